@@ -0,0 +1,297 @@
+"""Day pack files for the clean archive.
+
+A completed day of one feed is sealed into ``<PACK_DIR>/<feed>/<day>.pack``:
+
+    b'SCNPACK1' | member bytes ... | index JSON | footer
+
+The footer is ``<QQ8s``: index offset, index length, b'SCNPIDX1'. The index
+maps every member file name (``.wav``, ``.json``, ``.txt``) to its
+``[offset, size]`` and carries per-call summaries (parsed sidecar, text
+transcript, WAV format) so listings never read member bytes. Members are
+read with ``os.pread`` on a shared descriptor, so ranges can be served
+straight out of the pack.
+"""
+import io
+import json
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+import config
+from wav_utils import read_wav_info
+
+MAGIC = b'SCNPACK1'
+FOOTER = struct.Struct('<QQ8s')
+FOOTER_MAGIC = b'SCNPIDX1'
+SIDECARS = ('.json', '.txt')
+CHUNK = 1 << 20
+
+
+class PackError(Exception):
+    pass
+
+
+class PackMember(io.RawIOBase):
+    """Read-only, seekable view of one member, backed by ``os.pread``.
+
+    It deliberately has no usable ``fileno()`` so WSGI servers do not try to
+    ``sendfile`` the whole pack.
+    """
+
+    def __init__(self, pack, offset, size):
+        self._pack = pack
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._size
+        self._pos = min(max(pos, 0), self._size)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def readinto(self, b):
+        n = min(len(b), self._size - self._pos)
+        if n <= 0:
+            return 0
+        data = os.pread(self._pack.fd, n, self._offset + self._pos)
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+class Pack:
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        try:
+            st = os.fstat(self.fd)
+            self.mtime_ns = st.st_mtime_ns
+            self.size = st.st_size
+            if self.size < len(MAGIC) + FOOTER.size or os.pread(self.fd, len(MAGIC), 0) != MAGIC:
+                raise PackError(f'{path}: not a pack file')
+            index_offset, index_length, magic = FOOTER.unpack(
+                os.pread(self.fd, FOOTER.size, self.size - FOOTER.size))
+            if magic != FOOTER_MAGIC:
+                raise PackError(f'{path}: bad footer')
+            index = json.loads(os.pread(self.fd, index_length, index_offset))
+        except BaseException:
+            os.close(self.fd)
+            raise
+        self.feed = index.get('feed')
+        self.day = index.get('day')
+        self.members = {name: (v[0], v[1]) for name, v in index['members'].items()}
+        self.crcs = {name: v[2] for name, v in index['members'].items()}
+        self.calls = index.get('calls', {})
+
+    def close(self):
+        fd, self.fd = self.fd, -1
+        if fd >= 0:
+            os.close(fd)
+
+    # The descriptor lives as long as the Pack object: readers (PackMember,
+    # iter_member, a Location) hold a reference, so a pack evicted from the
+    # cache keeps serving them and is closed when the last one lets go.
+    def __del__(self):
+        try:
+            self.close()
+        except (AttributeError, OSError):
+            pass
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def member_range(self, name):
+        """``(offset, size)`` of a member within the pack file."""
+        return self.members[name]
+
+    def open_member(self, name):
+        offset, size = self.members[name]
+        return PackMember(self, offset, size)
+
+    def read(self, name):
+        offset, size = self.members[name]
+        return os.pread(self.fd, size, offset)
+
+    def iter_member(self, name, chunk_size=CHUNK):
+        offset, size = self.members[name]
+        end = offset + size
+        while offset < end:
+            data = os.pread(self.fd, min(chunk_size, end - offset), offset)
+            if not data:
+                break
+            offset += len(data)
+            yield data
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+CACHE_SIZE = 32
+
+
+def open_pack(path):
+    """Return a cached :class:`Pack` for ``path``, reopening it if replaced."""
+    path = os.fspath(path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        pack = _cache.get(path)
+        if pack is not None and pack.mtime_ns == mtime_ns:
+            _cache.move_to_end(path)
+            return pack
+    pack = Pack(path)
+    # Replaced and evicted packs are only dropped, not closed: responses may
+    # still be streaming from them (see Pack.__del__).
+    with _cache_lock:
+        _cache[path] = pack
+        _cache.move_to_end(path)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return pack
+
+
+def pack_dir(feed):
+    return os.path.join(config.PACK_DIR, feed)
+
+
+def pack_path(feed, day):
+    return os.path.join(pack_dir(feed), f'{day}.pack')
+
+
+def list_packs(feed):
+    """Pack paths for ``feed``, newest day first."""
+    try:
+        names = os.listdir(pack_dir(feed))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(pack_dir(feed), n) for n in sorted(names, reverse=True) if n.endswith('.pack')]
+
+
+def _call_summary(wav_path):
+    stem = wav_path[:-4]
+    summary = {'meta': None, 'text': None}
+    try:
+        with open(stem + '.json') as f:
+            summary['meta'] = json.load(f)
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        print(f"[!] Failed to load JSON for {os.path.basename(wav_path)}: {e}")
+    try:
+        with open(stem + '.txt') as f:
+            summary['text'] = f.read()
+    except FileNotFoundError:
+        pass
+    try:
+        info = read_wav_info(wav_path)
+        summary.update(duration=info['duration'], sample_rate=info['sample_rate'], channels=info['channels'])
+    except (OSError, ValueError):
+        summary.update(duration=0, sample_rate=0, channels=0)
+    return summary
+
+
+def day_files(directory, day):
+    """Files of ``directory`` that belong to calls recorded on ``day``."""
+    prefix = f'rec_{day}_'
+    with os.scandir(directory) as it:
+        return sorted(e.path for e in it if e.name.startswith(prefix) and e.is_file()
+                      and os.path.splitext(e.name)[1] in ('.wav',) + SIDECARS)
+
+
+def seal_day(directory, feed, day, remove=True):
+    """Pack every call of ``day`` in ``directory`` into its day pack.
+
+    Calls already in an existing pack for the day are carried over. The new
+    pack is written to a temp file, verified and renamed into place before
+    any source file is removed. Returns ``(pack_path, files_packed, bytes)``.
+    """
+    files = day_files(directory, day)
+    if not files:
+        return None, 0, 0
+    dest = pack_path(feed, day)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    previous = Pack(dest) if os.path.exists(dest) else None
+
+    members = OrderedDict()
+    calls = {}
+    fd, tmp = tempfile.mkstemp(prefix=f'.{day}.', suffix='.pack', dir=os.path.dirname(dest))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(MAGIC)
+            offset = len(MAGIC)
+            new_names = {os.path.basename(p) for p in files}
+            if previous is not None:
+                for name in previous.members:
+                    if name in new_names:
+                        continue
+                    start = offset
+                    crc = 0
+                    for data in previous.iter_member(name):
+                        out.write(data)
+                        crc = zlib.crc32(data, crc)
+                        offset += len(data)
+                    members[name] = [start, offset - start, crc]
+                calls.update({k: v for k, v in previous.calls.items() if k not in new_names})
+            for path in files:
+                name = os.path.basename(path)
+                start = offset
+                crc = 0
+                with open(path, 'rb') as f:
+                    while True:
+                        data = f.read(CHUNK)
+                        if not data:
+                            break
+                        out.write(data)
+                        crc = zlib.crc32(data, crc)
+                        offset += len(data)
+                members[name] = [start, offset - start, crc]
+                if name.endswith('.wav'):
+                    calls[name] = _call_summary(path)
+            index = json.dumps({'version': 1, 'feed': feed, 'day': day,
+                                'members': members, 'calls': calls}).encode('utf-8')
+            out.write(index)
+            out.write(FOOTER.pack(offset, len(index), FOOTER_MAGIC))
+            out.flush()
+            os.fsync(out.fileno())
+        verify_pack(tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    finally:
+        if previous is not None:
+            previous.close()
+
+    if remove:
+        for path in files:
+            os.unlink(path)
+    return dest, len(files), sum(m[1] for m in members.values())
+
+
+def verify_pack(path):
+    """Re-read every member and check its CRC32. Raises PackError on mismatch."""
+    pack = Pack(path)
+    try:
+        for name, crc in pack.crcs.items():
+            actual = 0
+            for data in pack.iter_member(name):
+                actual = zlib.crc32(data, actual)
+            if actual != crc:
+                raise PackError(f'{path}: CRC mismatch for {name}')
+    finally:
+        pack.close()
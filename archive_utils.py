@@ -0,0 +1,88 @@
+import errno
+import fcntl
+import json
+import os
+import tempfile
+
+# ioctl request number for FICLONE (Linux, btrfs/xfs/overlay reflinks)
+FICLONE = 0x40049409
+
+
+def _read_umask():
+    # os.umask() can only be read by setting it, which would briefly make
+    # files other threads create world-writable; so only once, at import.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _read_umask()
+
+
+def _default_mode():
+    return 0o666 & ~_UMASK
+
+
+def atomic_write_json(path, data, indent=2):
+    """Write ``data`` as JSON to ``path`` via a temp file and rename.
+
+    Readers either see the old file or the complete new one, never a
+    partially written sidecar.
+    """
+    path = os.fspath(path)
+    directory = os.path.dirname(path) or '.'
+    fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600 files; keep the mode a plain open() would give
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = _default_mode()
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _reflink(src, dst):
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.unlink(dst)
+            raise
+
+
+def link_file(src, dst):
+    """Make ``dst`` refer to the bytes of ``src`` without copying them.
+
+    Tries a hardlink, then a reflink (copy-on-write clone). Returns the
+    method used ('hardlink' or 'reflink'), or None when neither is possible
+    (e.g. different filesystems without reflink support); callers should
+    then keep a reference to ``src`` instead of materialising ``dst``.
+    """
+    src, dst = os.fspath(src), os.fspath(dst)
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return 'hardlink'
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+    try:
+        _reflink(src, dst)
+        return 'reflink'
+    except OSError:
+        return None
@@ -0,0 +1,870 @@
+import datetime
+import json
+import os
+import sqlite3
+import config
+from wav_utils import read_wav_info, wav_duration
+
+# SQLite index of derived archive data. It is shared by every request
+# worker and the background worker, so connections use WAL mode and a busy
+# timeout instead of holding a long-lived handle.
+DB_PATH = config.INDEX_DB_PATH
+_ready = False
+
+
+def connect():
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def ensure_db():
+    global _ready
+    if _ready:
+        return
+    conn = connect()
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS reviews (
+        filename TEXT PRIMARY KEY,
+        feed TEXT,
+        source_wav TEXT,
+        review_wav TEXT,
+        link_type TEXT,
+        edited_transcript TEXT,
+        submitted_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS reviews_submitted ON reviews (submitted_at);
+
+    CREATE TABLE IF NOT EXISTS dir_state (
+        path TEXT PRIMARY KEY,
+        mtime_ns INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS segments (
+        file TEXT PRIMARY KEY,
+        ts TEXT,
+        speaker TEXT,
+        speaker_role TEXT,
+        speaker_label TEXT,
+        transcript TEXT,
+        json_mtime REAL,
+        duration REAL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS segments_ts ON segments (ts, file);
+    CREATE INDEX IF NOT EXISTS segments_speaker ON segments (speaker, ts, file);
+    CREATE INDEX IF NOT EXISTS segments_role ON segments (speaker_role, ts, file);
+    CREATE INDEX IF NOT EXISTS segments_label ON segments (speaker_label, ts, file);
+
+    CREATE TABLE IF NOT EXISTS calls (
+        feed TEXT,
+        file TEXT,
+        location TEXT,
+        day TEXT,
+        meta_ts TEXT,
+        transcript TEXT,
+        edited_transcript TEXT,
+        enhanced_transcript TEXT,
+        text TEXT,
+        edited INTEGER,
+        has_json INTEGER,
+        metadata_json TEXT,
+        duration REAL,
+        sample_rate INTEGER,
+        channels INTEGER,
+        sig REAL,
+        PRIMARY KEY (feed, file)
+    );
+    CREATE INDEX IF NOT EXISTS calls_day ON calls (feed, day, file);
+    CREATE INDEX IF NOT EXISTS calls_meta_ts ON calls (feed, meta_ts);
+    ''')
+    _migrate(conn)
+    conn.executescript(SEGMENT_STATS_SCHEMA)
+    conn.executescript(CALL_VERSION_SCHEMA)
+    conn.executescript(FINGERPRINT_SCHEMA)
+    conn.commit()
+    conn.close()
+    _ready = True
+
+
+def _columns(conn, table):
+    return {r[1] for r in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _migrate(conn):
+    if 'duration' not in _columns(conn, 'segments'):
+        # Rows indexed before durations were tracked: drop them and let the
+        # next sync re-read every segment so the stats start out complete.
+        conn.execute('ALTER TABLE segments ADD COLUMN duration REAL DEFAULT 0')
+        conn.execute('DELETE FROM segments')
+        conn.execute('DELETE FROM dir_state')
+    if 'version' not in _columns(conn, 'calls'):
+        # Number the existing rows so a client syncing from 0 gets them all;
+        # CALL_VERSION_SCHEMA then starts the counter after them.
+        conn.execute('ALTER TABLE calls ADD COLUMN version INTEGER DEFAULT 0')
+        conn.execute('UPDATE calls SET version = rowid')
+    fingerprint_columns = _columns(conn, 'fingerprints')
+    if fingerprint_columns and 'hop' not in fingerprint_columns:
+        # Left NULL for fingerprints stored so far; see fingerprint.Matcher.add.
+        conn.execute('ALTER TABLE fingerprints ADD COLUMN hop REAL')
+
+
+# Per-day segment counts and airtime for each speaker, role and label. The
+# triggers keep it in step with every insert/update/delete on ``segments``,
+# so answering "segments per unit this week" reads a few hundred rows at
+# most. Dimension '*' holds the daily totals.
+def _stats_delta(row, sign):
+    statements = []
+    for dimension, column in (('*', "'*'"), ('speaker', f'{row}.speaker'),
+                              ('speaker_role', f'{row}.speaker_role'),
+                              ('speaker_label', f'{row}.speaker_label')):
+        statements.append(f'''
+        INSERT INTO segment_stats (day, dimension, value, count, airtime)
+        SELECT substr({row}.ts, 1, 10), '{dimension}', {column}, {sign}1, {sign}coalesce({row}.duration, 0)
+        WHERE coalesce({column}, '') != ''
+        ON CONFLICT (day, dimension, value) DO UPDATE SET
+            count = count + excluded.count,
+            airtime = airtime + excluded.airtime;''')
+    return ''.join(statements)
+
+
+SEGMENT_STATS_SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS segment_stats (
+    day TEXT,
+    dimension TEXT,
+    value TEXT,
+    count INTEGER,
+    airtime REAL,
+    PRIMARY KEY (day, dimension, value)
+);
+CREATE TRIGGER IF NOT EXISTS segment_stats_ins AFTER INSERT ON segments BEGIN
+    {_stats_delta('NEW', '+')}
+END;
+CREATE TRIGGER IF NOT EXISTS segment_stats_del AFTER DELETE ON segments BEGIN
+    {_stats_delta('OLD', '-')}
+    DELETE FROM segment_stats WHERE count <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS segment_stats_upd AFTER UPDATE ON segments BEGIN
+    {_stats_delta('OLD', '-')}
+    {_stats_delta('NEW', '+')}
+    DELETE FROM segment_stats WHERE count <= 0;
+END;
+'''
+
+
+def add_review(filename, feed, source_wav, review_wav, link_type, edited_transcript, submitted_at):
+    ensure_db()
+    conn = connect()
+    conn.execute('INSERT OR REPLACE INTO reviews (filename, feed, source_wav, review_wav, link_type, edited_transcript, submitted_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (filename, feed, source_wav, review_wav, link_type, edited_transcript, submitted_at))
+    conn.commit()
+    conn.close()
+
+
+def list_reviews(limit=50, offset=0):
+    ensure_db()
+    conn = connect()
+    rows = conn.execute('SELECT * FROM reviews ORDER BY submitted_at DESC LIMIT ? OFFSET ?', (limit, offset)).fetchall()
+    total = conn.execute('SELECT COUNT(*) FROM reviews').fetchone()[0]
+    conn.close()
+    return [dict(r) for r in rows], total
+
+
+def remove_review(filename):
+    ensure_db()
+    conn = connect()
+    conn.execute('DELETE FROM reviews WHERE filename = ?', (filename,))
+    conn.commit()
+    conn.close()
+
+
+# --- segments -------------------------------------------------------------
+
+SEGMENT_FILTERS = ('speaker', 'speaker_role', 'speaker_label')
+
+
+def segment_row(wav_path, meta, json_mtime):
+    ts = meta.get('timestamp')
+    if not ts:
+        ts = datetime.datetime.fromtimestamp(os.stat(wav_path).st_mtime).isoformat()
+    return (
+        os.path.basename(wav_path),
+        ts,
+        meta.get('speaker', ''),
+        meta.get('speaker_role', ''),
+        meta.get('speaker_label', ''),
+        meta.get('transcript', '(no transcript)'),
+        json_mtime,
+        wav_duration(wav_path),
+    )
+
+
+def _upsert_segments(conn, rows):
+    # An UPSERT (not INSERT OR REPLACE) so the stats UPDATE trigger fires.
+    conn.executemany('''
+    INSERT INTO segments (file, ts, speaker, speaker_role, speaker_label, transcript, json_mtime, duration)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (file) DO UPDATE SET
+        ts = excluded.ts, speaker = excluded.speaker, speaker_role = excluded.speaker_role,
+        speaker_label = excluded.speaker_label, transcript = excluded.transcript,
+        json_mtime = excluded.json_mtime, duration = excluded.duration
+    ''', rows)
+
+
+def upsert_segment(wav_path, meta, dir_mtime_ns=None):
+    """Update one segment row, e.g. right after its labels were written.
+
+    ``dir_mtime_ns`` is the directory's mtime from just before that write.
+    If the index was in step with the directory then, it still is: the
+    write's own bump of the mtime does not need a rescan of every sidecar.
+    """
+    ensure_db()
+    json_path = os.path.splitext(wav_path)[0] + '.json'
+    directory = os.path.normpath(os.path.dirname(os.fspath(wav_path)))
+    try:
+        json_mtime = os.stat(json_path).st_mtime
+        mtime_ns = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        json_mtime = mtime_ns = 0
+    conn = connect()
+    with conn:
+        _upsert_segments(conn, [segment_row(wav_path, meta, json_mtime)])
+        if dir_mtime_ns is not None and mtime_ns:
+            conn.execute('UPDATE dir_state SET mtime_ns = ? WHERE path = ? AND mtime_ns = ?',
+                         (mtime_ns, directory, dir_mtime_ns))
+    conn.close()
+
+
+def _dir_changed(conn, directory):
+    """Return the directory's mtime_ns if it changed since the last sync, else None."""
+    try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    row = conn.execute('SELECT mtime_ns FROM dir_state WHERE path = ?', (directory,)).fetchone()
+    if row and row[0] == mtime_ns:
+        return None
+    return mtime_ns
+
+
+def _scan_directory(directory, known, signature):
+    """Return ``(changed, seen)`` for the WAVs in ``directory``.
+
+    ``changed`` lists ``(entry, sig)`` for files whose ``signature(entry)``
+    differs from the value recorded in ``known``; ``seen`` is every WAV name.
+    """
+    changed = []
+    seen = set()
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.name.endswith('.wav'):
+                continue
+            seen.add(entry.name)
+            sig = signature(entry)
+            if known.get(entry.name) != sig:
+                changed.append((entry, sig))
+    return changed, seen
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[!] Failed to load JSON for {os.path.basename(path)}: {e}")
+        return None
+
+
+def sync_segments(directory):
+    """Bring the segments table in line with ``directory``.
+
+    Creating, renaming or deleting a file bumps the directory mtime (atomic
+    sidecar rewrites included), so an unchanged directory costs a stat per
+    segment of today: sidecars rewritten in place leave the directory
+    alone, and those are the ones still being labelled. Otherwise only
+    sidecars whose mtime differs from the index are parsed again.
+    """
+    ensure_db()
+    directory = os.path.normpath(os.fspath(directory))
+    conn = connect()
+    mtime_ns = _dir_changed(conn, directory)
+    if mtime_ns is None:
+        today = conn.execute('SELECT file, json_mtime FROM segments WHERE ts >= ?',
+                             (datetime.date.today().isoformat(),))
+        rows = []
+        for name, old in today.fetchall():
+            path = os.path.join(directory, name)
+            json_mtime = _mtime(path[:-4] + '.json')
+            if json_mtime != old:
+                rows.append(segment_row(path, _read_json(path[:-4] + '.json') or {}, json_mtime))
+        if rows:
+            with conn:
+                _upsert_segments(conn, rows)
+        conn.close()
+        return
+    known = dict(conn.execute('SELECT file, json_mtime FROM segments'))
+    changed, seen = _scan_directory(
+        directory, known, lambda entry: _mtime(entry.path[:-4] + '.json'))
+    rows = [segment_row(entry.path, _read_json(entry.path[:-4] + '.json') or {}, sig)
+            for entry, sig in changed]
+    gone = [(name,) for name in known if name not in seen]
+    with conn:
+        _upsert_segments(conn, rows)
+        conn.executemany('DELETE FROM segments WHERE file = ?', gone)
+        conn.execute('INSERT OR REPLACE INTO dir_state (path, mtime_ns) VALUES (?, ?)', (directory, mtime_ns))
+    conn.close()
+
+
+def query_segments(filters=None, cursor=None, limit=50):
+    """Return ``(rows, next_cursor)`` ordered newest first.
+
+    ``cursor`` is the ``(ts, file)`` of the last row of the previous page;
+    seeking past it keeps every page an index range scan.
+    """
+    ensure_db()
+    where = []
+    params = []
+    for key, value in (filters or {}).items():
+        if key in SEGMENT_FILTERS and value:
+            where.append(f'{key} = ?')
+            params.append(value)
+    if cursor:
+        where.append('(ts < ? OR (ts = ? AND file < ?))')
+        params.extend([cursor[0], cursor[0], cursor[1]])
+    sql = 'SELECT * FROM segments'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ts DESC, file DESC LIMIT ?'
+    params.append(limit + 1)
+    conn = connect()
+    rows = [dict(r) for r in conn.execute(sql, params)]
+    conn.close()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]['ts'], rows[-1]['file'])
+    return rows, next_cursor
+
+
+
+def segment_stats(dimension, start_day=None, end_day=None):
+    """Aggregated segment counts/airtime for ``dimension`` between two days.
+
+    Returns ``{'totals': [...], 'by_day': [...]}`` with per-value totals
+    (largest airtime first) and the per-day rows they were summed from.
+    """
+    ensure_db()
+    where = ['dimension = ?']
+    params = [dimension]
+    if start_day:
+        where.append('day >= ?')
+        params.append(start_day)
+    if end_day:
+        where.append('day <= ?')
+        params.append(end_day)
+    clause = ' AND '.join(where)
+    conn = connect()
+    by_day = [dict(r) for r in conn.execute(f'SELECT day, value, count, airtime FROM segment_stats WHERE {clause} ORDER BY day, value', params)]
+    totals = [dict(r) for r in conn.execute(f'SELECT value, SUM(count) AS count, SUM(airtime) AS airtime FROM segment_stats WHERE {clause} GROUP BY value ORDER BY airtime DESC', params)]
+    conn.close()
+    return {'totals': totals, 'by_day': by_day}
+
+
+# --- calls ----------------------------------------------------------------
+
+# Change tracking for delta sync. Every insert, content update and delete of
+# a calls row takes the next value of a single counter; deletes leave a
+# tombstone carrying it. "What changed since version N" is then one range
+# scan over each table. Moving a call between locations (tiering) does not
+# change its content and so does not bump its version.
+_VERSIONED = ('meta_ts', 'transcript', 'edited_transcript', 'enhanced_transcript', 'text',
+              'edited', 'has_json', 'metadata_json', 'duration')
+
+CALL_VERSION_SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS call_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER
+);
+INSERT OR IGNORE INTO call_version (id, version) VALUES (1, 0);
+UPDATE call_version SET version = max(version, (SELECT coalesce(max(version), 0) FROM calls));
+CREATE TABLE IF NOT EXISTS call_tombstones (
+    feed TEXT,
+    file TEXT,
+    version INTEGER,
+    PRIMARY KEY (feed, file)
+);
+CREATE INDEX IF NOT EXISTS call_tombstones_version ON call_tombstones (version);
+CREATE INDEX IF NOT EXISTS calls_version ON calls (version);
+CREATE TRIGGER IF NOT EXISTS calls_version_ins AFTER INSERT ON calls BEGIN
+    UPDATE call_version SET version = version + 1;
+    UPDATE calls SET version = (SELECT version FROM call_version) WHERE feed = NEW.feed AND file = NEW.file;
+    DELETE FROM call_tombstones WHERE feed = NEW.feed AND file = NEW.file;
+END;
+CREATE TRIGGER IF NOT EXISTS calls_version_upd AFTER UPDATE OF {', '.join(_VERSIONED)} ON calls BEGIN
+    UPDATE call_version SET version = version + 1;
+    UPDATE calls SET version = (SELECT version FROM call_version) WHERE feed = NEW.feed AND file = NEW.file;
+END;
+CREATE TRIGGER IF NOT EXISTS calls_version_del AFTER DELETE ON calls BEGIN
+    UPDATE call_version SET version = version + 1;
+    INSERT OR REPLACE INTO call_tombstones (feed, file, version)
+    SELECT OLD.feed, OLD.file, version FROM call_version;
+END;
+'''
+
+CALL_COLUMNS = ('feed', 'file', 'location', 'day', 'meta_ts', 'transcript', 'edited_transcript',
+                'enhanced_transcript', 'text', 'edited', 'has_json', 'metadata_json',
+                'duration', 'sample_rate', 'channels', 'sig')
+
+
+def call_day(filename):
+    """``YYYY-MM-DD`` from a ``rec_YYYY-MM-DD_HH-MM-SS.wav`` name, or 'unknown'."""
+    try:
+        date_str = filename.split("_")[1]
+        return datetime.datetime.strptime(date_str, "%Y-%m-%d").date().isoformat()
+    except Exception:
+        return 'unknown'
+
+
+def call_signature(wav_path):
+    """Newest mtime of a call's WAV and sidecars; changes whenever any is rewritten."""
+    stem = wav_path[:-4]
+    return max(_mtime(wav_path), _mtime(stem + '.json'), _mtime(stem + '.txt'))
+
+
+def call_row(wav_path, feed, meta=None, sig=None):
+    """Build an index row for one call from its sidecars and WAV header.
+
+    ``meta`` may be passed when the caller already parsed the JSON.
+    """
+    wav_path = os.fspath(wav_path)
+    stem = wav_path[:-4]
+    if meta is None:
+        meta = _read_json(stem + '.json')
+    try:
+        with open(stem + '.txt') as f:
+            text = f.read()
+    except FileNotFoundError:
+        text = None
+    try:
+        info = read_wav_info(wav_path)
+    except (OSError, ValueError) as e:
+        print(f"[!] Failed to read WAV header for {os.path.basename(wav_path)}: {e}")
+        info = {'duration': 0, 'sample_rate': 0, 'channels': 0}
+    m = meta or {}
+    return (
+        feed,
+        os.path.basename(wav_path),
+        os.path.normpath(os.path.dirname(wav_path)),
+        call_day(os.path.basename(wav_path)),
+        m.get('timestamp'),
+        m.get('transcript'),
+        m.get('edited_transcript'),
+        m.get('enhanced_transcript'),
+        text,
+        1 if m.get('edited') else 0,
+        0 if meta is None else 1,
+        None if meta is None else json.dumps(meta),
+        info['duration'],
+        info['sample_rate'],
+        info['channels'],
+        call_signature(wav_path) if sig is None else sig,
+    )
+
+
+def upsert_calls(rows, conn=None):
+    own = conn is None
+    if own:
+        ensure_db()
+        conn = connect()
+    placeholders = ', '.join('?' for _ in CALL_COLUMNS)
+    with conn:
+        conn.executemany(f'INSERT OR REPLACE INTO calls ({", ".join(CALL_COLUMNS)}) VALUES ({placeholders})', rows)
+    if own:
+        conn.close()
+
+
+def index_call(wav_path, feed, meta=None):
+    """Index (or re-index) a single call, e.g. as soon as it is recorded."""
+    upsert_calls([call_row(wav_path, feed, meta)])
+
+
+def call_sigs(feed, location, conn=None):
+    """``{file: sig}`` of the calls indexed in ``location`` (a directory)."""
+    own = conn is None
+    if own:
+        ensure_db()
+        conn = connect()
+    sigs = dict(conn.execute('SELECT file, sig FROM calls WHERE feed = ? AND location = ?',
+                             (feed, os.path.normpath(location))))
+    if own:
+        conn.close()
+    return sigs
+
+
+def sync_calls(directory, feed):
+    """Bring the calls rows of ``directory`` in line with the filesystem.
+
+    Same scheme as sync_segments: when the directory is unchanged only
+    today's calls are checked (a few stats each, since a sidecar rewritten
+    in place leaves the directory mtime alone and today's calls are the ones
+    still being transcribed and edited); otherwise only calls whose WAV or
+    sidecars changed are read.
+    """
+    ensure_db()
+    directory = os.path.normpath(os.fspath(directory))
+    conn = connect()
+    mtime_ns = _dir_changed(conn, directory)
+    if mtime_ns is None:
+        today = conn.execute('SELECT file, sig FROM calls WHERE feed = ? AND location = ? AND day = ?',
+                             (feed, directory, datetime.date.today().isoformat()))
+        rows = []
+        for name, old in today.fetchall():
+            path = os.path.join(directory, name)
+            sig = call_signature(path)
+            if sig != old:
+                rows.append(call_row(path, feed, sig=sig))
+        if rows:
+            upsert_calls(rows, conn)
+        conn.close()
+        return
+    known = call_sigs(feed, directory, conn)
+    changed, seen = _scan_directory(directory, known, lambda entry: call_signature(entry.path))
+    rows = [call_row(entry.path, feed, sig=sig) for entry, sig in changed]
+    gone = [(feed, name) for name in known if name not in seen]
+    upsert_calls(rows, conn)
+    with conn:
+        conn.executemany('DELETE FROM calls WHERE feed = ? AND file = ?', gone)
+        conn.execute('INSERT OR REPLACE INTO dir_state (path, mtime_ns) VALUES (?, ?)', (directory, mtime_ns))
+    conn.close()
+
+
+def _pack_call_rows(pack, feed):
+    sig = pack.mtime_ns / 1e9
+    rows = []
+    for name, summary in pack.calls.items():
+        meta = summary.get('meta')
+        m = meta or {}
+        rows.append((
+            feed, name, pack.path, call_day(name), m.get('timestamp'),
+            m.get('transcript'), m.get('edited_transcript'), m.get('enhanced_transcript'),
+            summary.get('text'), 1 if m.get('edited') else 0,
+            0 if meta is None else 1, None if meta is None else json.dumps(meta),
+            summary.get('duration', 0), summary.get('sample_rate', 0), summary.get('channels', 0),
+            sig,
+        ))
+    return rows
+
+
+def sync_packs(feed, pack_directory, open_pack):
+    """Index the sealed day packs of ``feed``.
+
+    Packs are immutable once renamed into place, so each one is indexed
+    from its own summary table once, and again only if it is replaced.
+    """
+    ensure_db()
+    pack_directory = os.path.normpath(os.fspath(pack_directory))
+    conn = connect()
+    mtime_ns = _dir_changed(conn, pack_directory)
+    if mtime_ns is None:
+        conn.close()
+        return
+    known = dict(conn.execute(
+        "SELECT location, MAX(sig) FROM calls WHERE feed = ? AND location LIKE ? GROUP BY location",
+        (feed, pack_directory + os.sep + '%.pack')))
+    present = set()
+    with os.scandir(pack_directory) as it:
+        for entry in it:
+            if not entry.name.endswith('.pack'):
+                continue
+            path = os.path.normpath(entry.path)
+            present.add(path)
+            if known.get(path) == entry.stat().st_mtime_ns / 1e9:
+                continue
+            pack = open_pack(path)
+            with conn:
+                conn.execute('DELETE FROM calls WHERE feed = ? AND location = ?', (feed, path))
+            upsert_calls(_pack_call_rows(pack, feed), conn)
+    with conn:
+        conn.executemany('DELETE FROM calls WHERE feed = ? AND location = ?',
+                         [(feed, path) for path in known if path not in present])
+        conn.execute('INSERT OR REPLACE INTO dir_state (path, mtime_ns) VALUES (?, ?)', (pack_directory, mtime_ns))
+    conn.close()
+
+
+def relocate_calls(feed, old_location, new_location, files=None):
+    """Point index rows at a new location after their files were moved.
+
+    With ``files`` only those calls are updated (loose files); without, every
+    row at ``old_location`` is (a whole pack).
+    """
+    ensure_db()
+    old_location = os.path.normpath(os.fspath(old_location))
+    new_location = os.path.normpath(os.fspath(new_location))
+    conn = connect()
+    with conn:
+        if files is None:
+            conn.execute('UPDATE calls SET location = ? WHERE feed = ? AND location = ?',
+                         (new_location, feed, old_location))
+        else:
+            conn.executemany('UPDATE calls SET location = ? WHERE feed = ? AND location = ? AND file = ?',
+                             [(new_location, feed, old_location, f) for f in files])
+    conn.close()
+
+
+def index_snapshot(directories):
+    """What the index holds: ``{(feed, file): call row}`` for calls in
+    ``directories`` and ``{file: segment row}`` for all segments, as tuples
+    shaped like call_row() and segment_row()."""
+    ensure_db()
+    locations = [os.path.normpath(os.fspath(d)) for d in directories]
+    conn = connect()
+    calls = {}
+    for location in locations:
+        for r in conn.execute(f'SELECT {", ".join(CALL_COLUMNS)} FROM calls WHERE location = ?', (location,)):
+            calls[(r['feed'], r['file'])] = tuple(r)
+    segments = {r[0]: tuple(r) for r in conn.execute(
+        'SELECT file, ts, speaker, speaker_role, speaker_label, transcript, json_mtime, duration FROM segments')}
+    conn.close()
+    return calls, segments
+
+
+def bulk_load(calls=(), segments=(), gone_calls=(), gone_segments=(), dir_mtimes=None):
+    """Apply a bulk reindex in a single transaction.
+
+    ``calls`` are call_row() tuples, ``segments`` segment rows, ``gone_*``
+    the ``(feed, file)`` / ``file`` keys to delete, and ``dir_mtimes``
+    ``{directory: mtime_ns}`` taken before the walk, so the mtime-gated
+    syncs skip directories that have not changed since.
+    """
+    ensure_db()
+    conn = connect()
+    placeholders = ', '.join('?' for _ in CALL_COLUMNS)
+    with conn:
+        conn.executemany(f'INSERT OR REPLACE INTO calls ({", ".join(CALL_COLUMNS)}) VALUES ({placeholders})', calls)
+        conn.executemany('DELETE FROM calls WHERE feed = ? AND file = ?', gone_calls)
+        _upsert_segments(conn, segments)
+        conn.executemany('DELETE FROM segments WHERE file = ?', [(f,) for f in gone_segments])
+        conn.executemany('INSERT OR REPLACE INTO dir_state (path, mtime_ns) VALUES (?, ?)',
+                         [(os.path.normpath(d), m) for d, m in (dir_mtimes or {}).items()])
+    conn.close()
+
+
+def query_calls(feed=None, day=None, since_meta_ts=None, has_json=None, location=None,
+                limit=None, offset=0, columns=None):
+    """Call rows newest first (by file name), optionally filtered."""
+    ensure_db()
+    where = []
+    params = []
+    if feed:
+        where.append('feed = ?')
+        params.append(feed)
+    if location:
+        where.append('location = ?')
+        params.append(os.path.normpath(os.fspath(location)))
+    if day:
+        where.append('day = ?')
+        params.append(day)
+    if since_meta_ts:
+        where.append('meta_ts >= ?')
+        params.append(since_meta_ts)
+    if has_json is not None:
+        where.append('has_json = ?')
+        params.append(1 if has_json else 0)
+    sql = f'SELECT {", ".join(columns or CALL_COLUMNS)} FROM calls'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY file DESC'
+    if limit is not None:
+        sql += ' LIMIT ? OFFSET ?'
+        params.extend([limit, offset])
+    conn = connect()
+    rows = [dict(r) for r in conn.execute(sql, params)]
+    conn.close()
+    return rows
+
+
+def get_call(file, feed=None):
+    ensure_db()
+    conn = connect()
+    if feed:
+        row = conn.execute('SELECT * FROM calls WHERE feed = ? AND file = ?', (feed, file)).fetchone()
+    else:
+        row = conn.execute('SELECT * FROM calls WHERE file = ?', (file,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def changes_since(since, feed=None, limit=500, columns=None, from_day=None):
+    """Calls added or changed, and calls deleted, after version ``since``.
+
+    ``from_day`` (YYYY-MM-DD) leaves out calls of earlier days. Returns ``(rows, deleted, version, more)``: at most ``limit`` rows in
+    version order, ``(feed, file)`` pairs removed in the same span, the
+    version to pass as ``since`` next time, and whether more changes are
+    waiting. Both tables are read in one transaction so nothing slips
+    between them.
+    """
+    ensure_db()
+    feed_sql = ' AND feed = ?' if feed else ''
+    feed_params = [feed] if feed else []
+    day_sql = ' AND day >= ?' if from_day else ''
+    day_params = [from_day] if from_day else []
+    conn = connect()
+    try:
+        conn.execute('BEGIN')
+        current = conn.execute('SELECT version FROM call_version').fetchone()[0]
+        rows = [dict(r) for r in conn.execute(
+            f'SELECT {", ".join(columns or CALL_COLUMNS)}, version FROM calls '
+            f'WHERE version > ?{feed_sql}{day_sql} ORDER BY version LIMIT ?',
+            [since] + feed_params + day_params + [limit])]
+        more = len(rows) == limit
+        upto = rows[-1]['version'] if more else current
+        deleted = [tuple(r) for r in conn.execute(
+            f'SELECT feed, file FROM call_tombstones WHERE version > ? AND version <= ?{feed_sql}',
+            [since, upto] + feed_params)]
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return rows, deleted, upto, more
+
+
+def current_version():
+    ensure_db()
+    conn = connect()
+    version = conn.execute('SELECT version FROM call_version').fetchone()[0]
+    conn.close()
+    return version
+
+
+# --- fingerprints ---------------------------------------------------------
+
+# Audio fingerprints (fingerprint.py) and the duplicates found with them.
+# ``feed`` is the call's feed, or fingerprint.SEGMENT_FEED for segments;
+# ``hop`` is the item's seconds per sub-fingerprint. A duplicate row points at
+# the first recording of the transmission, and ``offset`` is where the
+# duplicate starts within it, in seconds.
+FINGERPRINT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fingerprints (
+    feed TEXT,
+    file TEXT,
+    ts REAL,
+    fp BLOB,
+    hop REAL,
+    PRIMARY KEY (feed, file)
+);
+CREATE INDEX IF NOT EXISTS fingerprints_ts ON fingerprints (ts);
+
+CREATE TABLE IF NOT EXISTS duplicates (
+    feed TEXT,
+    file TEXT,
+    day TEXT,
+    of_feed TEXT,
+    of_file TEXT,
+    offset REAL,
+    ber REAL,
+    linked INTEGER DEFAULT 0,
+    PRIMARY KEY (feed, file)
+);
+CREATE INDEX IF NOT EXISTS duplicates_day ON duplicates (feed, day);
+'''
+
+
+def save_fingerprint(feed, file, ts, fp, hop):
+    ensure_db()
+    conn = connect()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO fingerprints (feed, file, ts, fp, hop) VALUES (?, ?, ?, ?, ?)',
+                     (feed, file, ts, fp, hop))
+    conn.close()
+
+
+def get_fingerprint(feed, file):
+    """``(fp, hop)`` of a fingerprinted item, or None."""
+    ensure_db()
+    conn = connect()
+    row = conn.execute('SELECT fp, hop FROM fingerprints WHERE feed = ? AND file = ?', (feed, file)).fetchone()
+    conn.close()
+    return tuple(row) if row else None
+
+
+def fingerprinted():
+    """``(feed, file)`` of every fingerprinted item."""
+    ensure_db()
+    conn = connect()
+    keys = {(r[0], r[1]) for r in conn.execute('SELECT feed, file FROM fingerprints')}
+    conn.close()
+    return keys
+
+
+def recent_fingerprints(start, end):
+    """Fingerprint rows recorded between ``start`` and ``end`` (epoch seconds), oldest first."""
+    ensure_db()
+    conn = connect()
+    rows = conn.execute('SELECT feed, file, ts, fp, hop FROM fingerprints WHERE ts BETWEEN ? AND ? ORDER BY ts',
+                        (start, end)).fetchall()
+    conn.close()
+    return rows
+
+
+def add_duplicate(feed, file, of_feed, of_file, offset, ber):
+    ensure_db()
+    conn = connect()
+    with conn:
+        # An UPSERT keeps ``linked`` when a rerun finds the same match.
+        conn.execute('''
+        INSERT INTO duplicates (feed, file, day, of_feed, of_file, offset, ber) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (feed, file) DO UPDATE SET
+            of_feed = excluded.of_feed, of_file = excluded.of_file, offset = excluded.offset, ber = excluded.ber
+        ''', (feed, file, call_day(file), of_feed, of_file, offset, ber))
+    conn.close()
+
+
+def duplicate_of(feed, file):
+    """The duplicates row of ``feed``/``file``, or None if it is an original."""
+    ensure_db()
+    conn = connect()
+    row = conn.execute('SELECT * FROM duplicates WHERE feed = ? AND file = ?', (feed, file)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def duplicate_map(feed, day=None):
+    """``{file: "of_feed/of_file"}`` for the duplicates in ``feed`` (on ``day``)."""
+    ensure_db()
+    conn = connect()
+    sql = 'SELECT file, of_feed, of_file FROM duplicates WHERE feed = ?'
+    params = [feed]
+    if day is not None:
+        sql += ' AND day = ?'
+        params.append(day)
+    found = {r[0]: f'{r[1]}/{r[2]}' for r in conn.execute(sql, params)}
+    conn.close()
+    return found
+
+
+def list_duplicates(linked=None):
+    ensure_db()
+    conn = connect()
+    sql = 'SELECT * FROM duplicates'
+    if linked is not None:
+        sql += f' WHERE linked = {1 if linked else 0}'
+    rows = [dict(r) for r in conn.execute(sql + ' ORDER BY day, file')]
+    conn.close()
+    return rows
+
+
+def mark_linked(feed, file):
+    ensure_db()
+    conn = connect()
+    with conn:
+        conn.execute('UPDATE duplicates SET linked = 1 WHERE feed = ? AND file = ?', (feed, file))
+    conn.close()
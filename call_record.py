@@ -0,0 +1,120 @@
+"""Compact in-memory form of a listed call.
+
+Listings used to carry one dict per call with the parsed sidecar JSON
+embedded a second time under ``metadata``, so every cached page held a
+full JSON tree per call on top of the transcripts already copied out of
+it. ``CallRecord`` keeps only the fields pages show, in slots, with the
+derived ones (``timestamp``, ``timestamp_human``, ``edit_pending``)
+computed once when the record is built. ``metadata`` is read from the
+call index on first access, for the few views that need all of it.
+
+Records travel through the shared page cache as plain lists
+(``pack()``/``unpack()``) and become the old dict shape, minus
+``metadata``, only when a response is serialised (``to_dict()``).
+"""
+import datetime
+import json
+from pathlib import Path
+
+import call_index
+
+NO_TRANSCRIPT = "(no transcript)"
+
+
+def timestamps(base):
+    """``(timestamp, timestamp_human)`` for a call file stem (``rec_YYYY-MM-DD_HH-MM-SS``)."""
+    timestamp = base.replace("rec_", "").replace("_", " ")
+    try:
+        dt = datetime.datetime.strptime(base.replace("rec_", ""), "%Y-%m-%d_%H-%M-%S")
+        timestamp_human = dt.strftime("%b %d, %I:%M %p")
+    except Exception:
+        timestamp_human = timestamp
+    return timestamp, timestamp_human
+
+
+class CallRecord:
+    FIELDS = ("feed", "file", "transcript", "edited_transcript", "enhanced_transcript", "edit_pending",
+              "timestamp", "timestamp_human", "duration", "sample_rate", "channels", "duplicate_of")
+    __slots__ = FIELDS + ("_metadata",)
+    # Bump when FIELDS changes; cached packed records are keyed by it.
+    PACK_FORMAT = "rec2"
+
+    def __init__(self, feed, file, transcript, edited_transcript="", enhanced_transcript="",
+                 edit_pending=False, timestamp=None, timestamp_human=None, duration=None,
+                 sample_rate=None, channels=None, duplicate_of=""):
+        self.feed = feed
+        self.file = file
+        self.transcript = transcript
+        self.edited_transcript = edited_transcript
+        self.enhanced_transcript = enhanced_transcript
+        self.edit_pending = edit_pending
+        if timestamp is None:
+            timestamp, timestamp_human = timestamps(Path(file).stem)
+        self.timestamp = timestamp
+        self.timestamp_human = timestamp_human
+        self.duration = duration
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # "feed/file" of the first recording of this transmission, if it is a duplicate.
+        self.duplicate_of = duplicate_of
+        self._metadata = None
+
+    @classmethod
+    def from_row(cls, row, feed=None, duplicate_of=""):
+        """Record for a call index row with sidecar JSON (listing pages)."""
+        edited = row["edited_transcript"]
+        # Shown as pending until the edit has been applied to the sidecar.
+        edit_pending = edited is not None and not (row["edited"] and edited)
+        if row["transcript"] is not None:
+            transcript = row["transcript"]
+        elif edited is not None:
+            transcript = edited
+        else:
+            transcript = NO_TRANSCRIPT
+        return cls(feed or row["feed"], row["file"], transcript, edited or "",
+                   row["enhanced_transcript"] or "", edit_pending,
+                   duration=row["duration"], sample_rate=row["sample_rate"], channels=row["channels"],
+                   duplicate_of=duplicate_of)
+
+    @classmethod
+    def from_text_row(cls, row, feed=None, duplicate_of=""):
+        """Record showing the ``.txt`` transcript (archive pages)."""
+        return cls(feed or row["feed"], row["file"],
+                   row["text"] if row["text"] is not None else NO_TRANSCRIPT,
+                   duration=row["duration"], duplicate_of=duplicate_of)
+
+    @property
+    def path(self):
+        return f"/scanner/audio/{self.file}"
+
+    @property
+    def metadata(self):
+        """The call's full sidecar JSON, loaded on first use."""
+        if self._metadata is None:
+            row = call_index.get_call(self.file, self.feed)
+            raw = row and row["metadata_json"]
+            self._metadata = json.loads(raw) if raw else {}
+        return self._metadata
+
+    def pack(self):
+        return [getattr(self, name) for name in self.FIELDS]
+
+    @classmethod
+    def unpack(cls, values):
+        return cls(*values)
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.FIELDS}
+        data["path"] = self.path
+        return data
+
+    def __repr__(self):
+        return f"<CallRecord {self.feed}/{self.file}>"
+
+
+def pack_all(records):
+    return [r.pack() for r in records]
+
+
+def unpack_all(values):
+    return [CallRecord.unpack(v) for v in values]
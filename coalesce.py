@@ -0,0 +1,138 @@
+"""Request coalescing and admission control.
+
+When a new call lands every open client refreshes at once, and each request
+would otherwise rebuild the same listing. ``flight.do(key, fn)`` runs ``fn``
+once per key at a time: concurrent callers with the same key wait for the
+first one and share its result (or exception). Results are shared objects,
+so callers must treat them as read-only.
+
+With ``COALESCE_REDIS_LOCK`` the leader also takes a Redis lock for the key,
+so leaders in other worker processes queue behind it instead of scanning
+the same directory in parallel; by the time they run, the call index is
+already up to date and their own pass is cheap. Redis errors fall back to
+running unlocked.
+
+``Gate`` bounds how many expensive requests (the archive views) run at
+once. A few more may queue for a short while; the rest are shed with a 503
+and Retry-After rather than piling onto a busy disk.
+"""
+import functools
+import threading
+
+from flask import jsonify
+
+import config
+
+_redis = None
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.from_url(config.REDIS_URL)
+    return _redis
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, redis_lock=False, lock_timeout=60):
+        self.redis_lock = redis_lock
+        self.lock_timeout = lock_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._run(key, fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _run(self, key, fn):
+        if not self.redis_lock:
+            return fn()
+        try:
+            lock = _redis_client().lock(f'scanner:flight:{key!r}', timeout=self.lock_timeout,
+                                        blocking_timeout=self.lock_timeout)
+            acquired = lock.acquire()
+        except Exception as e:
+            print('coalesce: redis lock unavailable', e)
+            return fn()
+        try:
+            return fn()
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except Exception:
+                    pass  # expired while we ran; nothing to release
+
+
+class Gate:
+    """At most ``limit`` concurrent holders, ``queue`` waiters, ``timeout`` seconds of waiting."""
+
+    def __init__(self, limit, queue, timeout):
+        self.timeout = timeout
+        self.queue = queue
+        self._slots = threading.BoundedSemaphore(limit)
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        if self._slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self._waiting >= self.queue:
+                return False
+            self._waiting += 1
+        try:
+            return self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def leave(self):
+        self._slots.release()
+
+    def admit(self, view):
+        """Decorate a view so it runs inside the gate or answers 503."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enter():
+                rv = jsonify({"success": False, "error": "Server busy, try again shortly"})
+                rv.status_code = 503
+                rv.headers['Retry-After'] = str(max(int(self.timeout), 1))
+                return rv
+            try:
+                return view(*args, **kwargs)
+            finally:
+                self.leave()
+        return wrapper
+
+
+flight = SingleFlight(redis_lock=config.COALESCE_REDIS_LOCK)
+archive_gate = Gate(config.ARCHIVE_MAX_CONCURRENT, config.ARCHIVE_MAX_QUEUE, config.ARCHIVE_QUEUE_TIMEOUT)
@@ -0,0 +1,105 @@
+import os
+import tempfile
+
+# Central configuration. Every value can be overridden through the
+# environment so the same code runs under the dev server, gunicorn and the
+# background worker process without edits.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ARCHIVE_ROOT = os.environ.get('SCANNER_ARCHIVE_ROOT', '/home/ned/scanner_archive')
+ARCHIVE_DIR = os.environ.get('SCANNER_CLEAN_DIR', os.path.join(ARCHIVE_ROOT, 'clean'))
+REVIEW_DIR = os.environ.get('SCANNER_REVIEW_DIR', os.path.join(ARCHIVE_ROOT, 'review'))
+SEGMENT_DIR = os.environ.get('SCANNER_SEGMENT_DIR', os.path.join(ARCHIVE_ROOT, 'segmentation', 'processed'))
+FEEDS = ('pd', 'fd')
+
+# Sealed day packs (archive_pack.py)
+PACK_DIR = os.environ.get('SCANNER_PACK_DIR', os.path.join(ARCHIVE_ROOT, 'packs'))
+
+# Storage tiering (storage.py, scripts/tier_archive.py): calls older than
+# HOT_DAYS move from the clean/ and packs/ trees to COLD_ROOT.
+COLD_ROOT = os.environ.get('SCANNER_COLD_ROOT', os.path.join(ARCHIVE_ROOT, 'cold'))
+HOT_DAYS = int(os.environ.get('SCANNER_HOT_DAYS', '7'))
+
+# Waveform peak sidecars (peaks.py)
+PEAKS_DIR = os.environ.get('SCANNER_PEAKS_DIR', os.path.join(ARCHIVE_ROOT, 'peaks'))
+PEAKS_PER_SECOND = int(os.environ.get('SCANNER_PEAKS_PER_SECOND', '50'))
+PEAKS_SCAN_INTERVAL = int(os.environ.get('SCANNER_PEAKS_SCAN_INTERVAL', '60'))
+
+# Ingest watcher (ingest.py): new calls in the clean/<feed> directories are
+# indexed and pushed as soon as their WAV and JSON are complete. Without
+# inotify the directories are polled; pairs must be QUIET seconds old then.
+INGEST_INOTIFY = os.environ.get('SCANNER_INGEST_INOTIFY', '1') == '1'
+INGEST_POLL_INTERVAL = float(os.environ.get('SCANNER_INGEST_POLL_INTERVAL', '2'))
+INGEST_QUIET = float(os.environ.get('SCANNER_INGEST_QUIET', '1'))
+INGEST_RESCAN_INTERVAL = float(os.environ.get('SCANNER_INGEST_RESCAN_INTERVAL', '60'))
+# Calls found with an older sidecar (e.g. after downtime) are indexed but not pushed.
+INGEST_PUSH_MAX_AGE = float(os.environ.get('SCANNER_INGEST_PUSH_MAX_AGE', '300'))
+
+# Duplicate transmission detection (fingerprint.py, scripts/fingerprint.py).
+# Items recorded within WINDOW seconds of each other are compared; a match
+# must cover MIN_COVERAGE of the shorter item with a bit error rate of at
+# most MAX_BER. COLLAPSE leaves duplicates out of listings instead of
+# linking them to the original. --link in the script hardlinks duplicate
+# WAVs to the original only at LINK_MAX_BER or better.
+FINGERPRINT_ENABLED = os.environ.get('SCANNER_FINGERPRINT', '1') == '1'
+FINGERPRINT_WINDOW = float(os.environ.get('SCANNER_FINGERPRINT_WINDOW', '120'))
+FINGERPRINT_MAX_BER = float(os.environ.get('SCANNER_FINGERPRINT_MAX_BER', '0.3'))
+FINGERPRINT_MIN_COVERAGE = float(os.environ.get('SCANNER_FINGERPRINT_MIN_COVERAGE', '0.8'))
+FINGERPRINT_COLLAPSE = os.environ.get('SCANNER_FINGERPRINT_COLLAPSE', '0') == '1'
+FINGERPRINT_LINK_MAX_BER = float(os.environ.get('SCANNER_FINGERPRINT_LINK_MAX_BER', '0.15'))
+
+# Sidecar write-behind journal (metadata_journal.py)
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get('SCANNER_JOURNAL_FLUSH_INTERVAL', '0.5'))
+LOCK_DIR = os.environ.get('SCANNER_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'scanner_locks'))
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+# Request coalescing and admission control (coalesce.py). With
+# COALESCE_REDIS_LOCK, identical listings are also serialised across worker
+# processes so only one of them pays for the directory scan.
+COALESCE_REDIS_LOCK = os.environ.get('SCANNER_COALESCE_REDIS_LOCK', '0') == '1'
+ARCHIVE_MAX_CONCURRENT = int(os.environ.get('SCANNER_ARCHIVE_MAX_CONCURRENT', '2'))
+ARCHIVE_MAX_QUEUE = int(os.environ.get('SCANNER_ARCHIVE_MAX_QUEUE', '8'))
+ARCHIVE_QUEUE_TIMEOUT = float(os.environ.get('SCANNER_ARCHIVE_QUEUE_TIMEOUT', '10'))
+
+# Fleet-wide cache of listing pages in Redis (shared_cache.py). TTL bounds
+# staleness for changes nobody announced (e.g. files copied in by hand).
+SHARED_CACHE = os.environ.get('SCANNER_SHARED_CACHE', '1') == '1'
+SHARED_CACHE_TTL = int(os.environ.get('SCANNER_SHARED_CACHE_TTL', '60'))
+# Today's pages change with every call; keep them short-lived even when
+# no invalidation arrives.
+SHARED_CACHE_LIVE_TTL = int(os.environ.get('SCANNER_SHARED_CACHE_LIVE_TTL', '5'))
+
+# Profiling and the slow-request log (profiling.py). ADMIN_TOKEN unlocks
+# ?__profile= and the admin views; without it profiling is refused.
+# A SLOW_REQUEST_SAMPLE fraction of requests is traced; traced requests over
+# SLOW_REQUEST_MS (0 disables) are logged to SLOW_REQUEST_LOG, or stdout.
+ADMIN_TOKEN = os.environ.get('SCANNER_ADMIN_TOKEN', '')
+SLOW_REQUEST_MS = float(os.environ.get('SCANNER_SLOW_REQUEST_MS', '1000'))
+SLOW_REQUEST_SAMPLE = float(os.environ.get('SCANNER_SLOW_REQUEST_SAMPLE', '1.0'))
+SLOW_REQUEST_LOG = os.environ.get('SCANNER_SLOW_REQUEST_LOG', '')
+PROFILE_DIR = os.environ.get('SCANNER_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'scanner_profiles'))
+
+# Static files (static_assets.py) are loaded once at startup. STATIC_RELOAD
+# re-stats them on every request so edits show up without a restart.
+STATIC_RELOAD = os.environ.get('SCANNER_STATIC_RELOAD', '0') == '1'
+
+VAPID_PUBLIC_FILE = os.environ.get('VAPID_PUBLIC_FILE', os.path.join(BASE_DIR, 'vapid_public.key'))
+VAPID_PRIVATE_FILE = os.environ.get('VAPID_PRIVATE_FILE', os.path.join(BASE_DIR, 'vapid_private.key'))
+VAPID_CLAIM_SUB = os.environ.get('VAPID_CLAIM_SUB', 'mailto:admin@iamcalledned.ai')
+
+PUSH_DB_PATH = os.environ.get('PUSH_DB_PATH', os.path.join(BASE_DIR, 'push_subs.sqlite3'))
+INDEX_DB_PATH = os.environ.get('SCANNER_INDEX_DB', os.path.join(BASE_DIR, 'call_index.sqlite3'))
+
+LOGIN_PROCESS_URL = os.environ.get('LOGIN_PROCESS_URL', 'http://127.0.0.1:8010/api/login')
+
+HOST = os.environ.get('SCANNER_HOST', '0.0.0.0')
+PORT = int(os.environ.get('SCANNER_PORT', '5005'))
+# Off unless asked for; `python app.py` (the dev server) turns it on by default.
+DEBUG = os.environ.get('SCANNER_DEBUG', '0') == '1'
+
+
+def as_dict():
+    """Return the upper-case settings of this module as a plain dict."""
+    return {k: v for k, v in globals().items() if k.isupper()}
@@ -0,0 +1,243 @@
+"""Spectral fingerprints for finding duplicate transmissions.
+
+The same transmission is often recorded on both feeds, and segments in
+``segmentation/processed`` are cut from calls that are also in the clean
+archive. Each WAV is reduced to a fingerprint: one 32-bit sub-fingerprint
+per FRAME_HOP of audio, where bit ``b`` says whether the energy difference
+between voice bands ``b`` and ``b + 1`` grew or shrank since the previous
+frame (Haitsma & Kalker). Those bits survive different gain, noise and
+codecs, so two recordings of one transmission share many sub-fingerprints
+exactly and differ in few bits overall.
+
+Matching never compares files pairwise. Items within FINGERPRINT_WINDOW
+seconds of each other (and from different feeds: a feed does not repeat
+its own transmissions) share a ``HashIndex``; a new item looks up its
+sub-fingerprints there, votes for ``(item, frame offset)`` alignments, and
+only the best alignments are verified by bit error rate (BER) over their
+overlap. An item is a duplicate of an earlier one when the overlap covers
+FINGERPRINT_MIN_COVERAGE of the shorter of the two and the BER is at most
+FINGERPRINT_MAX_BER; a segment inside a call thus matches the call, at
+the segment's offset.
+
+Fingerprints (4 bytes per FRAME_HOP, ~345 bytes per second of audio) and
+matches live in the call index (``call_index.save_fingerprint``,
+``call_index.add_duplicate``). The ingest service fingerprints each new
+call as it lands; ``scripts/fingerprint.py`` backfills and deduplicates
+storage.
+"""
+import datetime
+import os
+from collections import Counter, defaultdict
+
+import numpy as np
+
+import call_index
+import config
+from wav_utils import read_wav_info
+
+# Haitsma & Kalker's framing: long, heavily overlapped frames keep the bits
+# stable when two recordings start a fraction of a hop apart.
+FRAME_SECONDS = 0.37
+FRAME_HOP = 0.0116
+BAND_EDGES = np.geomspace(300.0, 3400.0, 34)  # 33 bands -> 32 bits
+SILENCE_DB = -60.0  # frames this far below the loudest frame are not used as keys
+KEY_STEP = 2  # index every other usable frame; lookups use them all
+MIN_VOTES = 3
+MAX_CANDIDATES = 5
+BLOCK_FRAMES = 512
+SEGMENT_FEED = 'segments'
+
+_DTYPES = {1: np.uint8, 2: np.dtype('<i2'), 4: np.dtype('<i4')}
+
+
+def frame_hop(rate):
+    """Actual seconds between sub-fingerprints at ``rate``: FRAME_HOP in whole samples."""
+    return int(rate * FRAME_HOP) / rate
+
+
+def compute(wav_path, base=0, length=None):
+    """Sub-fingerprints of a PCM WAV as ``(uint32 array, usable-frame mask, hop seconds)``.
+
+    Samples are memory-mapped and framed without copying; only BLOCK_FRAMES
+    windowed frames are materialised at a time. ``base``/``length`` select
+    a WAV stored inside a pack file.
+    """
+    info = read_wav_info(wav_path, base, length)
+    if info['subformat'] != 1 or info['sample_width'] not in _DTYPES:
+        raise ValueError('unsupported WAV format')
+    rate = info['sample_rate']
+    channels = max(info['channels'], 1)
+    width = info['sample_width']
+    n = int(rate * FRAME_SECONDS)
+    hop = int(rate * FRAME_HOP)
+    total = info['data_size'] // (width * channels)
+    if total < n + hop:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=bool), frame_hop(rate)
+    samples = np.memmap(wav_path, dtype=_DTYPES[width], mode='r',
+                        offset=info['data_offset'], shape=(total * channels,))
+    frames = np.lib.stride_tricks.sliding_window_view(samples[::channels], n)[::hop]
+
+    window = np.hanning(n).astype(np.float32)
+    bins = np.fft.rfftfreq(n, 1.0 / rate)
+    starts = np.searchsorted(bins, BAND_EDGES[:-1])
+    ends = np.searchsorted(bins, BAND_EDGES[1:])
+    ends = np.maximum(ends, starts + 1)
+    energy = np.empty((len(frames), len(starts)), dtype=np.float64)
+    for lo in range(0, len(frames), BLOCK_FRAMES):
+        block = frames[lo:lo + BLOCK_FRAMES].astype(np.float32)
+        if width == 1:
+            block -= 128.0
+        power = np.abs(np.fft.rfft(block * window, axis=1)) ** 2
+        cumulative = np.concatenate([np.zeros((len(block), 1)), np.cumsum(power, axis=1)], axis=1)
+        energy[lo:lo + len(block)] = cumulative[:, ends] - cumulative[:, starts]
+
+    diff = energy[:, :-1] - energy[:, 1:]
+    bits = (diff[1:] - diff[:-1]) > 0
+    weights = (1 << np.arange(bits.shape[1] - 1, -1, -1)).astype(np.uint64)
+    hashes = (bits.astype(np.uint64) @ weights).astype(np.uint32)
+
+    loudness = 10 * np.log10(energy.sum(axis=1)[1:] + 1e-9)
+    usable = (loudness > loudness.max() + SILENCE_DB) & (hashes != 0) & (hashes != 0xFFFFFFFF)
+    return hashes, usable, frame_hop(rate)
+
+
+def to_bytes(hashes, usable):
+    """Storage form: little-endian hashes with the unusable ones zeroed."""
+    return np.where(usable, hashes, 0).astype('<u4').tobytes()
+
+
+def from_bytes(data):
+    hashes = np.frombuffer(data, dtype='<u4').astype(np.uint32)
+    return hashes, hashes != 0
+
+
+def item_time(feed, name, ts=None):
+    """Epoch seconds an item was recorded: from a call's file name, else ``ts`` (ISO)."""
+    stem = os.path.splitext(name)[0]
+    try:
+        return datetime.datetime.strptime(stem.replace('rec_', '')[:19], '%Y-%m-%d_%H-%M-%S').timestamp()
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(ts).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def bit_error_rate(a, b, offset):
+    """BER of ``a`` against ``b`` with ``a[i]`` aligned to ``b[i + offset]``, and the overlap length."""
+    lo = max(0, -offset)
+    hi = min(len(a), len(b) - offset)
+    if hi <= lo:
+        return 1.0, 0
+    x = a[lo:hi]
+    y = b[lo + offset:hi + offset]
+    both = (x != 0) & (y != 0)
+    count = int(both.sum())
+    if not count:
+        return 1.0, 0
+    flips = np.unpackbits((x[both] ^ y[both]).view(np.uint8)).sum()
+    return float(flips) / (32 * count), hi - lo
+
+
+class HashIndex:
+    """Sub-fingerprint -> ``[(key, frame)]`` for the items of a sliding time window."""
+
+    def __init__(self, window=None):
+        self.window = config.FINGERPRINT_WINDOW if window is None else window
+        self.table = defaultdict(list)
+        self.items = {}  # key -> (time, hashes)
+
+    def add(self, key, when, hashes, usable):
+        self.items[key] = (when, hashes)
+        frames = np.flatnonzero(usable)[::KEY_STEP]
+        for frame, value in zip(frames.tolist(), hashes[frames].tolist()):
+            self.table[value].append((key, frame))
+
+    def expire(self, before):
+        """Forget items recorded before ``before`` (epoch seconds)."""
+        old = {key for key, (when, _) in self.items.items() if when < before}
+        if not old:
+            return
+        for key in old:
+            del self.items[key]
+        for value in list(self.table):
+            kept = [entry for entry in self.table[value] if entry[0] not in old]
+            if kept:
+                self.table[value] = kept
+            else:
+                del self.table[value]
+
+    def match(self, hashes, usable, when, exclude_feed=None):
+        """Best ``(key, offset_frames, ber)`` among indexed items near ``when``, or None.
+
+        ``offset_frames`` is where this item starts within the match. Items
+        whose key starts with ``exclude_feed`` are never matched.
+        """
+        votes = Counter()
+        for frame, value in zip(np.flatnonzero(usable).tolist(), hashes[usable].tolist()):
+            for key, other_frame in self.table.get(value, ()):
+                votes[key, other_frame - frame] += 1
+        best = None
+        for (key, offset), count in votes.most_common(MAX_CANDIDATES * 4):
+            if count < MIN_VOTES:
+                break
+            other_when, other = self.items[key]
+            if key[0] == exclude_feed or abs(other_when - when) > self.window:
+                continue
+            ber, overlap = bit_error_rate(hashes, other, offset)
+            if overlap < config.FINGERPRINT_MIN_COVERAGE * min(len(hashes), len(other)):
+                continue
+            if ber <= config.FINGERPRINT_MAX_BER and (best is None or ber < best[2]):
+                best = (key, offset, ber)
+        return best
+
+
+class Matcher:
+    """Fingerprint items in time order and record which earlier item each duplicates."""
+
+    def __init__(self, window=None):
+        self.index = HashIndex(window)
+
+    def prime(self, until):
+        """Load fingerprints recorded in the window before ``until`` from the call index."""
+        for row in call_index.recent_fingerprints(until - self.index.window, until):
+            hashes, usable = from_bytes(row['fp'])
+            self.index.add((row['feed'], row['file']), row['ts'], hashes, usable)
+
+    def add(self, feed, name, when, hashes, usable, hop, save=True):
+        """Index one item; returns ``(of_feed, of_file, offset_seconds, ber)`` if it is a duplicate.
+
+        ``hop`` is from :func:`compute`; None (fingerprints stored before
+        hops were) falls back to FRAME_HOP. ``save=False`` is for
+        fingerprints already stored; duplicates are always recorded.
+        """
+        self.index.expire(when - 2 * self.index.window)
+        key = (feed, name)
+        hop = hop or FRAME_HOP
+        found = self.index.match(hashes, usable, when, exclude_feed=feed)
+        duplicate = None
+        if found is not None:
+            (of_feed, of_file), offset, ber = found
+            # Link to the first recording, not to another duplicate of it.
+            canonical = call_index.duplicate_of(of_feed, of_file)
+            if canonical:
+                of_feed, of_file, prior = canonical['of_feed'], canonical['of_file'], canonical['offset']
+                offset_seconds = prior + offset * hop
+            else:
+                offset_seconds = offset * hop
+            duplicate = (of_feed, of_file, round(offset_seconds, 3), round(ber, 4))
+        self.index.add(key, when, hashes, usable)
+        if save:
+            call_index.save_fingerprint(feed, name, when, to_bytes(hashes, usable), hop)
+        if duplicate:
+            call_index.add_duplicate(feed, name, *duplicate)
+        return duplicate
+
+    def add_file(self, feed, wav_path, when=None, base=0, length=None):
+        name = os.path.basename(wav_path)
+        when = when if when is not None else item_time(feed, name)
+        if when is None:
+            when = os.stat(wav_path).st_mtime
+        hashes, usable, hop = compute(wav_path, base, length)
+        return self.add(feed, name, when, hashes, usable, hop)
@@ -0,0 +1,19 @@
+# gunicorn settings for `gunicorn -c gunicorn.conf.py wsgi:app`.
+# Values can be overridden with the usual GUNICORN_CMD_ARGS or the
+# environment variables below.
+import multiprocessing
+import os
+
+bind = os.environ.get('SCANNER_BIND', '0.0.0.0:' + os.environ.get('SCANNER_PORT', '5005'))
+# Request handlers are mostly filesystem and Redis bound; a process per core
+# plus one gives parallelism across cores, and threads keep slow audio
+# downloads from pinning a whole process.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+threads = int(os.environ.get('SCANNER_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.environ.get('SCANNER_TIMEOUT', '60'))
+keepalive = 5
+# Import the app once in the master so workers fork with it loaded.
+preload_app = True
+accesslog = '-'
+errorlog = '-'
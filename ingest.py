@@ -0,0 +1,275 @@
+"""Pick up new calls the moment the recorder finishes writing them.
+
+The recorder writes ``rec_<time>.wav`` and then its ``.json`` sidecar into
+``clean/<feed>``. The ingest service (a worker service, see ``worker.py``)
+watches those directories with inotify and handles every completed
+WAV + JSON pair once:
+
+1. the sidecar is parsed and the call indexed (WAV header, ``.txt``
+   transcript) in one pass, so listings never rescan for it;
+2. the feed's cached pages are invalidated on every process;
+3. a push job for the call goes onto ``push_queue`` and a ``new_call``
+   event is published on ``scanner:calls``;
+4. waveform peaks are written, so the first listener does not wait;
+5. the call is fingerprinted and, if it repeats a transmission recorded
+   on the other feed moments ago, linked to it (see ``fingerprint.py``).
+
+A pair counts as handled when its index row's ``sig`` (newest mtime of
+the WAV and sidecars) matches the files, so nothing but the index is
+needed to skip the archive on a restart or rescan. Pairs whose sidecar
+is younger than INGEST_PUSH_MAX_AGE are also handled once by the watcher
+itself even if a listing indexed them first, so they still get pushed;
+a Redis claim per call keeps the watcher (across restarts) and
+``/scanner/push/send`` from announcing the same call twice. Later
+rewrites of a sidecar (transcript edits) are re-indexed without a push.
+
+Without inotify (not Linux, watch limit reached, directory missing) the
+directories are polled every INGEST_POLL_INTERVAL seconds instead, and a
+pair must have been quiet for INGEST_QUIET seconds to count as complete.
+Either way a full rescan every INGEST_RESCAN_INTERVAL seconds catches
+anything missed (e.g. inotify queue overflow).
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import time
+
+import call_index
+import config
+import fingerprint
+import peaks
+import push_utils
+import shared_cache
+import storage
+
+CHANNEL = 'scanner:calls'
+CLAIM_PREFIX = 'scanner:announced'
+CLAIM_TTL = 7 * 86400
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+_EVENT = struct.Struct('iIII')
+
+
+# Claim and enqueue in one step: a failed enqueue must not leave a claim
+# behind that makes every later attempt look like a duplicate.
+ANNOUNCE_SCRIPT = """
+if not redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+redis.call('LPUSH', KEYS[2], ARGV[2])
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+return 1
+"""
+
+
+def announce(r, row):
+    """Queue the push for new call ``row`` and publish it, once per call.
+
+    Returns the push payload, or None if the call was already announced.
+    """
+    payload = push_utils.call_payload(row)
+    job = json.dumps({'payload': payload, 'feed': row['feed'], 'texts': push_utils.call_texts(row)})
+    event = json.dumps({'type': 'new_call', 'feed': row['feed'], 'file': row['file'], 'day': row['day']})
+    claimed = r.eval(ANNOUNCE_SCRIPT, 2, f"{CLAIM_PREFIX}:{row['feed']}:{row['file']}", 'push_queue',
+                     CLAIM_TTL, job, CHANNEL, event)
+    return payload if claimed else None
+
+
+class Inotify:
+    """Minimal inotify binding over libc (no extra dependency)."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('libc not found')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.paths = {}  # watch descriptor -> directory
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self.paths[wd] = path
+        return wd
+
+    def read(self, timeout):
+        """``(directory, name, mask)`` events arriving within ``timeout`` seconds."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = data[pos:pos + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            pos += length
+            events.append((self.paths.get(wd), name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Ingester:
+    def __init__(self, r, feeds=None, push_max_age=None):
+        self.r = r
+        self.feeds = {storage.live_dir(feed): feed for feed in (feeds or config.FEEDS)}
+        self.push_max_age = config.INGEST_PUSH_MAX_AGE if push_max_age is None else push_max_age
+        # (feed, wav name) -> sidecar mtime, for pairs young enough to push
+        self.recent = {}
+        self.matcher = fingerprint.Matcher() if config.FINGERPRINT_ENABLED else None
+
+    def consider(self, directory, stem, quiet=0.0, known=None):
+        """Handle the pair ``stem`` in ``directory`` if it is complete and new or changed.
+
+        ``known`` is :func:`call_index.call_sigs` of the directory, when the
+        caller looks at many pairs; otherwise the pair's row is looked up.
+        """
+        feed = self.feeds[directory]
+        wav = os.path.join(directory, stem + '.wav')
+        sidecar = os.path.join(directory, stem + '.json')
+        try:
+            wav_mtime = os.stat(wav).st_mtime
+            json_mtime = os.stat(sidecar).st_mtime
+        except FileNotFoundError:
+            return False
+        key = (feed, stem + '.wav')
+        young = time.time() - json_mtime <= self.push_max_age
+        if self.recent.get(key) == json_mtime:
+            return False
+        if not young:
+            if known is None:
+                try:
+                    row = call_index.get_call(key[1], feed)
+                except Exception as e:
+                    print(f'ingest: {feed}/{stem}.wav: cannot read the index: {e}')
+                    return False
+                indexed = row['sig'] if row and row['location'] == os.path.normpath(directory) else None
+            else:
+                indexed = known.get(key[1])
+            if indexed == call_index.call_signature(wav):
+                return False
+        if quiet and time.time() - max(wav_mtime, json_mtime) < quiet:
+            return False  # possibly still being written; the next poll retries
+        try:
+            with open(sidecar) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False  # half-written; its close/rename event brings us back
+        try:
+            self.handle(feed, wav, meta, announce_call=young)
+        except Exception as e:
+            # Neither indexed nor remembered, so the next event or scan retries it.
+            print(f'ingest: {feed}/{stem}.wav failed: {e}')
+            return False
+        if young:
+            self.recent[key] = json_mtime
+        return True
+
+    def handle(self, feed, wav, meta, announce_call=True):
+        started = time.time()
+        values = call_index.call_row(wav, feed, meta)
+        call_index.upsert_calls([values])
+        row = dict(zip(call_index.CALL_COLUMNS, values))
+        shared_cache.cache.invalidate(feed)
+        announced = False
+        if announce_call:
+            try:
+                announced = announce(self.r, row) is not None
+            except Exception as e:
+                print('ingest: could not announce', row['file'], e)
+        print(f"ingest: {feed}/{row['file']} indexed{' and announced' if announced else ''}"
+              f" in {time.time() - started:.3f}s")
+        try:
+            peaks.ensure_peaks(wav, feed)
+        except Exception as e:
+            print(f'ingest: peaks for {wav}: {e}')
+        if self.matcher is not None and call_index.get_fingerprint(feed, row['file']) is None:
+            try:
+                duplicate = self.matcher.add_file(feed, wav)
+            except Exception as e:
+                print(f'ingest: fingerprint for {wav}: {e}')
+            else:
+                if duplicate:
+                    print(f"ingest: {feed}/{row['file']} repeats {duplicate[0]}/{duplicate[1]}")
+                    shared_cache.cache.invalidate(feed)
+
+    def scan(self, quiet=0.0):
+        """Consider every complete pair in the watched directories."""
+        cutoff = time.time() - self.push_max_age
+        self.recent = {key: mtime for key, mtime in self.recent.items() if mtime >= cutoff}
+        for directory, feed in self.feeds.items():
+            try:
+                with os.scandir(directory) as it:
+                    names = {e.name for e in it}
+            except OSError as e:
+                if not isinstance(e, FileNotFoundError):
+                    print(f'ingest: cannot scan {directory}: {e}')
+                continue
+            try:
+                known = call_index.call_sigs(feed, directory)
+            except Exception as e:
+                print(f'ingest: cannot read the index for {directory}: {e}')
+                continue
+            for name in sorted(names):
+                if name.endswith('.wav') and name[:-4] + '.json' in names:
+                    self.consider(directory, name[:-4], quiet, known)
+
+    def run(self, stop_event):
+        if self.matcher is not None:
+            try:
+                self.matcher.prime(time.time())
+            except Exception as e:
+                # Keep watching: new calls are still indexed, only matching starts empty.
+                print('ingest: could not load recent fingerprints:', e)
+        watcher = None
+        if config.INGEST_INOTIFY:
+            try:
+                watcher = Inotify()
+                for directory in self.feeds:
+                    watcher.add_watch(directory, IN_CLOSE_WRITE | IN_MOVED_TO)
+            except OSError as e:
+                print('ingest: inotify unavailable, polling instead:', e)
+                if watcher is not None:
+                    watcher.close()
+                watcher = None
+        print('ingest: watching', ', '.join(self.feeds), 'with inotify' if watcher else 'by polling')
+        self.scan(quiet=config.INGEST_QUIET)
+        last_scan = time.time()
+        try:
+            while not stop_event.is_set():
+                if watcher is None:
+                    stop_event.wait(config.INGEST_POLL_INTERVAL)
+                    self.scan(quiet=config.INGEST_QUIET)
+                    continue
+                rescan = False
+                for directory, name, mask in watcher.read(1.0):
+                    if mask & IN_IGNORED:
+                        print('ingest: watch on', directory, 'removed, polling instead')
+                        watcher.close()
+                        watcher = None
+                        break
+                    if mask & IN_Q_OVERFLOW:
+                        rescan = True
+                    elif directory in self.feeds and name.endswith(('.wav', '.json')):
+                        self.consider(directory, os.path.splitext(name)[0])
+                if rescan or time.time() - last_scan > config.INGEST_RESCAN_INTERVAL:
+                    self.scan(quiet=config.INGEST_QUIET)
+                    last_scan = time.time()
+        finally:
+            if watcher is not None:
+                watcher.close()
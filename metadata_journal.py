@@ -0,0 +1,180 @@
+"""Write-behind journal for JSON sidecar updates.
+
+Edits and segment labels are recorded as partial updates keyed by sidecar
+path. Updates to the same file are merged in memory and a background thread
+flushes each file once per interval: read, apply every pending change,
+atomic rewrite. A striped ``flock`` serialises read-modify-write cycles
+across threads and processes, so concurrent request workers cannot lose each
+other's changes.
+
+Every updated key carries the time it was submitted, and a key is only
+written if it is newer than the last write of that key (recorded per lock
+stripe under the flock), so a batch that was delayed, in this process or
+another, never overwrites a newer value. The journal lives in memory:
+requests that acknowledge an update call ``flush()`` first, which also
+waits for a batch of the same file that another flush is already writing.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+
+import config
+from archive_utils import atomic_write_json
+
+LOCK_STRIPES = 64
+# Per-key write times older than this are forgotten; no batch waits that long.
+SEQ_RETENTION_NS = 3600 * 10 ** 9
+
+
+class MetadataJournal:
+    def __init__(self, flush_interval=None, lock_dir=None):
+        self.flush_interval = flush_interval if flush_interval is not None else config.JOURNAL_FLUSH_INTERVAL
+        self.lock_dir = lock_dir or config.LOCK_DIR
+        # path -> {'updates': {...}, 'seqs': {key: submit time_ns}, 'seed_from': path or None, 'callbacks': [...]}
+        self._pending = {}
+        self._inflight = {}  # path -> entry being written, with 'done' (Event) and 'error'
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def submit(self, path, updates, seed_from=None, on_flush=None):
+        """Queue ``updates`` for the sidecar at ``path``.
+
+        ``seed_from`` names a sidecar (or gives an already parsed dict) to
+        start from when ``path`` does not exist yet (review copies). ``on_flush(path, meta, dir_mtime_ns)`` is
+        called after the merged file has been written; ``dir_mtime_ns`` is the mtime its directory had just
+        before the write, or None if nothing needed writing.
+        """
+        path = os.fspath(path)
+        with self._lock:
+            entry = self._pending.setdefault(path, {'updates': {}, 'seqs': {}, 'seed_from': None,
+                                                    'callbacks': []})
+            entry['updates'].update(updates)
+            seq = time.time_ns()
+            entry['seqs'].update(dict.fromkeys(updates, seq))
+            if seed_from is not None:
+                entry['seed_from'] = seed_from if isinstance(seed_from, dict) else os.fspath(seed_from)
+            if on_flush:
+                entry['callbacks'].append(on_flush)
+            self._ensure_thread()
+        self._wake.set()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, paths=None):
+        """Write pending updates now (all, or only ``paths``). Returns ``{path: error}``.
+
+        When it returns, every update submitted for those paths before the
+        call is on disk, or reported in the errors.
+        """
+        with self._lock:
+            wanted = list(self._pending) if paths is None else [os.fspath(p) for p in paths]
+        errors = {}
+        for path in wanted:
+            error = self._flush_path(path)
+            if error:
+                errors[path] = error
+        return errors
+
+    def _flush_path(self, path):
+        error = None
+        while True:
+            with self._lock:
+                running = self._inflight.get(path)
+                if running is None:
+                    entry = self._pending.pop(path, None)
+                    if entry is None:
+                        return error
+                    entry['done'] = threading.Event()
+                    entry['error'] = None
+                    self._inflight[path] = entry
+            if running is not None:
+                # Another flush holds this file's older updates: let it finish
+                # first (ordering) and report its outcome (it may hold ours).
+                running['done'].wait()
+                error = error or running['error']
+                continue
+            try:
+                meta, dir_mtime_ns = self._apply(path, entry)
+                for cb in entry['callbacks']:
+                    try:
+                        cb(path, meta, dir_mtime_ns)
+                    except Exception as e:
+                        print(f"[!] journal callback failed for {path}: {e}")
+            except Exception as e:
+                print(f"[!] journal flush failed for {path}: {e}")
+                entry['error'] = str(e)
+            finally:
+                with self._lock:
+                    del self._inflight[path]
+                entry['done'].set()
+            return entry['error'] or error
+
+    def _lock_path(self, path):
+        stripe = zlib.crc32(path.encode('utf-8')) % LOCK_STRIPES
+        return os.path.join(self.lock_dir, f'meta-{stripe:02d}.lock')
+
+    def _apply(self, path, entry):
+        os.makedirs(self.lock_dir, exist_ok=True)
+        lock_path = self._lock_path(path)
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                source = path if os.path.exists(path) else entry['seed_from']
+                if isinstance(source, dict):
+                    meta = dict(source)
+                elif source:
+                    with open(source) as f:
+                        meta = json.load(f)
+                else:
+                    raise FileNotFoundError(path)
+                seq_path = lock_path[:-len('.lock')] + '.seq'
+                seqs = self._read_seqs(seq_path)
+                written = seqs.setdefault(path, {})
+                updates = {k: v for k, v in entry['updates'].items() if entry['seqs'][k] > written.get(k, 0)}
+                dir_mtime_ns = None
+                if updates:
+                    meta.update(updates)
+                    dir_mtime_ns = os.stat(os.path.dirname(path) or '.').st_mtime_ns
+                    atomic_write_json(path, meta)
+                    written.update({k: entry['seqs'][k] for k in updates})
+                    cutoff = time.time_ns() - SEQ_RETENTION_NS
+                    for p in list(seqs):
+                        seqs[p] = {k: t for k, t in seqs[p].items() if t > cutoff}
+                        if not seqs[p]:
+                            del seqs[p]
+                    atomic_write_json(seq_path, seqs, indent=None)
+                return meta, dir_mtime_ns
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_seqs(seq_path):
+        try:
+            with open(seq_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='metadata-journal', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Give closely spaced submissions a chance to merge.
+            time.sleep(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+journal = MetadataJournal()
+atexit.register(journal.flush)
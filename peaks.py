@@ -0,0 +1,134 @@
+"""Downsampled waveform peaks for call audio.
+
+Peaks are stored in the audiowaveform ``.dat`` (version 1, 8-bit) layout so
+existing players such as peaks.js can read them directly:
+
+    int32 version (1) | uint32 flags (1 = 8-bit) | int32 sample_rate |
+    int32 samples_per_pixel | uint32 length | length * (int8 min, int8 max)
+
+Sidecars live under ``config.PEAKS_DIR/<feed>`` (``segments`` for
+segments) rather than next to the WAVs so the archive directories do not
+grow extra files; the feed keeps same-named calls of pd and fd apart.
+"""
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+import config
+from wav_utils import read_wav_info
+
+HEADER = struct.Struct('<iIiiI')
+FLAG_8BIT = 1
+SEGMENT_GROUP = 'segments'
+
+_DTYPES = {1: np.uint8, 2: np.dtype('<i2'), 4: np.dtype('<i4')}
+
+
+def peaks_path(wav_name, feed):
+    """Sidecar path for the peaks of ``wav_name`` in ``feed`` (None for a segment)."""
+    stem = os.path.splitext(os.path.basename(wav_name))[0]
+    return os.path.join(config.PEAKS_DIR, feed or SEGMENT_GROUP, stem + '.dat')
+
+
+def compute_peaks(wav_path, peaks_per_second=None, base=0, length=None):
+    """Return ``(sample_rate, samples_per_pixel, minmax)`` for a PCM WAV.
+
+    The sample data is memory-mapped and reduced with one reshape and one
+    min/max per bucket across all channels; ``minmax`` is an int8 array of
+    interleaved min/max pairs scaled to the sample format's full range.
+    ``base``/``length`` select a WAV stored inside a pack file.
+    """
+    info = read_wav_info(wav_path, base, length)
+    if info['subformat'] != 1 or info['sample_width'] not in _DTYPES:
+        raise ValueError('unsupported WAV format')
+    rate = info['sample_rate']
+    channels = max(info['channels'], 1)
+    per_second = peaks_per_second or config.PEAKS_PER_SECOND
+    spp = max(rate // per_second, 1)
+
+    width = info['sample_width']
+    frames = info['data_size'] // (width * channels)
+    if frames == 0:
+        return rate, spp, np.zeros(0, dtype=np.int8)
+    samples = np.memmap(wav_path, dtype=_DTYPES[width], mode='r',
+                        offset=info['data_offset'], shape=(frames * channels,))
+    # 8-bit WAV is unsigned with a 128 midpoint; shifting after the
+    # reduction avoids converting the whole array.
+    offset = 128 if width == 1 else 0
+    full_scale = 128.0 if width == 1 else float(2 ** (8 * width - 1))
+
+    # Full buckets are reduced straight off the memory map; a short tail
+    # bucket, if any, is reduced on its own.
+    full = frames // spp
+    stride = spp * channels
+    mins = []
+    maxs = []
+    if full:
+        grid = samples[:full * stride].reshape(full, stride)
+        mins.append(grid.min(axis=1).astype(np.int64))
+        maxs.append(grid.max(axis=1).astype(np.int64))
+    tail = samples[full * stride:frames * channels]
+    if tail.size:
+        mins.append(np.array([tail.min()], dtype=np.int64))
+        maxs.append(np.array([tail.max()], dtype=np.int64))
+    mins = np.concatenate(mins) - offset
+    maxs = np.concatenate(maxs) - offset
+    buckets = len(mins)
+
+    scale = 127.0 / full_scale
+    out = np.empty(buckets * 2, dtype=np.int8)
+    out[0::2] = np.clip(np.floor(mins * scale), -128, 127)
+    out[1::2] = np.clip(np.ceil(maxs * scale), -128, 127)
+    return rate, spp, out
+
+
+def write_peaks(wav_path, dest, base=0, length=None):
+    """Compute peaks for ``wav_path`` and write them atomically to ``dest``. Returns ``dest``."""
+    rate, spp, minmax = compute_peaks(wav_path, base=base, length=length)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix='.peaks.', dir=os.path.dirname(dest))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(1, FLAG_8BIT, rate, spp, len(minmax) // 2))
+            f.write(minmax.tobytes())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return dest
+
+
+def ensure_peaks(wav_path, feed):
+    """Return the peaks sidecar for ``wav_path``, (re)computing it if stale."""
+    dest = peaks_path(wav_path, feed)
+    try:
+        if os.stat(dest).st_mtime >= os.stat(wav_path).st_mtime:
+            return dest
+    except FileNotFoundError:
+        pass
+    return write_peaks(wav_path, dest)
+
+
+def missing_peaks(directory, feed):
+    """WAV paths in ``directory`` whose peaks sidecar is missing or older than the WAV."""
+    have = {}
+    try:
+        with os.scandir(os.path.join(config.PEAKS_DIR, feed or SEGMENT_GROUP)) as it:
+            for entry in it:
+                have[entry.name] = entry.stat().st_mtime
+    except FileNotFoundError:
+        pass
+    missing = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.name.endswith('.wav'):
+                continue
+            if have.get(entry.name[:-4] + '.dat', 0) < entry.stat().st_mtime:
+                missing.append(entry.path)
+    return missing
@@ -0,0 +1,253 @@
+"""On-demand profiling and the slow-request log.
+
+Two tools for finding where a slow request spends its time, both usable in
+production without a redeploy:
+
+* ``?__profile=1`` on any URL, with the admin token (``X-Admin-Token``
+  header or ``__token`` parameter), runs that one request under cProfile
+  and answers with the pstats report instead of the page.
+  ``?__profile=store`` keeps the normal response and writes the binary
+  dump to PROFILE_DIR (named in ``X-Profile-Dump``) for ``snakeviz`` or
+  ``python -m pstats``. Both add a ``Server-Timing`` header.
+
+* A sampled fraction of requests (SLOW_REQUEST_SAMPLE) is traced cheaply:
+  time is split into directory scans and stats (``glob``), sidecar JSON
+  parsing (``json``), template rendering (``template``), Redis commands
+  (``redis``) and call index / push DB work (``sqlite``). Traced requests
+  slower than SLOW_REQUEST_MS are logged as one JSON line each
+  (SLOW_REQUEST_LOG, or stdout) and kept in memory for
+  ``/scanner/admin/slow_requests``.
+
+Times are exclusive: a call index sync that scans a directory and parses
+sidecars counts the scan as ``glob``, the parsing as ``json`` and only the
+rest as ``sqlite``. ``other`` is whatever was not instrumented (Python in
+the views, serialising the response).
+"""
+import cProfile
+import functools
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+
+from flask import before_render_template, current_app, g, jsonify, request, template_rendered
+
+import archive_pack
+import call_index
+import config
+import push_db
+
+CATEGORIES = ('glob', 'json', 'template', 'redis', 'sqlite')
+REPORT_LINES = 60
+RECENT = 200
+
+_local = threading.local()
+# cProfile hooks are per thread, but only one profile at a time keeps the
+# overhead on a production worker bounded.
+_profile_lock = threading.Lock()
+_recent = deque(maxlen=RECENT)
+_log_lock = threading.Lock()
+_instrumented = False
+
+
+class Trace:
+    __slots__ = ('started', 'totals', 'counts', 'stack')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.totals = dict.fromkeys(CATEGORIES, 0.0)
+        self.counts = dict.fromkeys(CATEGORIES, 0)
+        self.stack = []
+
+    def enter(self, category):
+        self.stack.append([category, time.perf_counter(), 0.0])
+
+    def exit(self):
+        category, start, children = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self.totals[category] += elapsed - children
+        self.counts[category] += 1
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def breakdown_ms(self):
+        total = time.perf_counter() - self.started
+        ms = {c: round(t * 1000, 2) for c, t in self.totals.items()}
+        ms['other'] = round((total - sum(self.totals.values())) * 1000, 2)
+        return round(total * 1000, 2), ms
+
+
+def _timed(fn, category):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        trace = getattr(_local, 'trace', None)
+        if trace is None:
+            return fn(*args, **kwargs)
+        trace.enter(category)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            trace.exit()
+    wrapper.__profiling_category__ = category
+    return wrapper
+
+
+def _wrap(owner, name, category):
+    fn = getattr(owner, name)
+    if getattr(fn, '__profiling_category__', None) is None:
+        setattr(owner, name, _timed(fn, category))
+
+
+def _wrap_module(module, category):
+    """Time every public function defined in ``module``."""
+    for name, value in list(vars(module).items()):
+        if callable(value) and not name.startswith('_') and getattr(value, '__module__', None) == module.__name__ \
+                and not isinstance(value, type):
+            _wrap(module, name, category)
+
+
+def instrument():
+    """Put timers around the code paths the breakdown reports. Idempotent.
+
+    Calls made through the module (``call_index.query_calls(...)``) and
+    from inside it are timed; names imported with ``from ... import`` before
+    this runs are not.
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+    # Filesystem work inside the index syncs, accounted separately. Wrapped
+    # first: the module-wide wrap leaves already timed functions alone, so
+    # the public call_signature is not counted as sqlite.
+    for name in ('_scan_directory', '_dir_changed', 'call_signature'):
+        _wrap(call_index, name, 'glob')
+    _wrap(call_index, '_read_json', 'json')
+    _wrap_module(call_index, 'sqlite')
+    _wrap_module(push_db, 'sqlite')
+    _wrap(archive_pack, 'open_pack', 'glob')
+    _wrap(archive_pack, 'day_files', 'glob')
+    try:
+        import redis
+        import redis.client
+    except ImportError:
+        return
+    _wrap(redis.Redis, 'execute_command', 'redis')
+    _wrap(redis.client.Pipeline, 'execute', 'redis')
+
+
+def is_admin():
+    token = config.ADMIN_TOKEN
+    given = request.headers.get('X-Admin-Token') or request.args.get('__token') or ''
+    return bool(token) and hmac.compare_digest(given.encode(), token.encode())
+
+
+def _server_timing(trace):
+    total, ms = trace.breakdown_ms()
+    parts = [f'{c};dur={v}' for c, v in ms.items() if v]
+    return ', '.join(parts + [f'total;dur={total}'])
+
+
+def _log_slow(entry):
+    _recent.append(entry)
+    line = json.dumps(entry)
+    if not config.SLOW_REQUEST_LOG:
+        print('slow request', line)
+        return
+    with _log_lock:
+        with open(config.SLOW_REQUEST_LOG, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def _start():
+    mode = request.args.get('__profile')
+    g.profile_mode = None
+    if mode:
+        if not is_admin():
+            return jsonify({"success": False, "error": "Forbidden"}), 403
+        if not _profile_lock.acquire(blocking=False):
+            return jsonify({"success": False, "error": "Another request is being profiled"}), 409
+        g.profile_mode = mode
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    if mode or (config.SLOW_REQUEST_MS > 0 and random.random() < config.SLOW_REQUEST_SAMPLE):
+        _local.trace = Trace()
+
+
+def _finish(response):
+    trace = getattr(_local, 'trace', None)
+    mode = g.get('profile_mode')
+    if mode:
+        g.profiler.disable()
+        header = _server_timing(trace)
+        if mode == 'store':
+            os.makedirs(config.PROFILE_DIR, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unknown'}-{os.getpid()}.prof"
+            g.profiler.dump_stats(os.path.join(config.PROFILE_DIR, name))
+            response.headers['X-Profile-Dump'] = name
+        else:
+            out = io.StringIO()
+            stats = pstats.Stats(g.profiler, stream=out)
+            stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+            out.write(f'\nServer-Timing: {header}\n')
+            response = current_app.response_class(out.getvalue(), mimetype='text/plain')
+        response.headers['Server-Timing'] = header
+    if trace is not None:
+        total, ms = trace.breakdown_ms()
+        if config.SLOW_REQUEST_MS > 0 and total >= config.SLOW_REQUEST_MS:
+            _log_slow({
+                'ts': time.time(),
+                'method': request.method,
+                'path': request.path,
+                'query': {k: v for k, v in request.args.items() if k != '__token'},
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'ms': total,
+                'breakdown_ms': ms,
+                'calls': {c: n for c, n in trace.counts.items() if n},
+                'pid': os.getpid(),
+            })
+    return response
+
+
+def _teardown(exc):
+    _local.trace = None
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+
+
+def _template_start(sender, template, context, **extra):
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.enter('template')
+
+
+def _template_done(sender, template, context, **extra):
+    trace = getattr(_local, 'trace', None)
+    if trace is not None and trace.stack and trace.stack[-1][0] == 'template':
+        trace.exit()
+
+
+def slow_requests():
+    """Recent slow requests seen by this process (admin only)."""
+    if not is_admin():
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    return jsonify({'threshold_ms': config.SLOW_REQUEST_MS, 'sample': config.SLOW_REQUEST_SAMPLE,
+                    'pid': os.getpid(), 'requests': list(_recent)})
+
+
+def init_app(app):
+    instrument()
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_teardown)
+    before_render_template.connect(_template_start, app)
+    template_rendered.connect(_template_done, app)
+    app.add_url_rule('/scanner/admin/slow_requests', 'slow_requests', slow_requests)
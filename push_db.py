@@ -1,8 +1,8 @@
 import sqlite3
-import os
 import json
+import config
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'push_subs.sqlite3')
+DB_PATH = config.PUSH_DB_PATH
 
 def ensure_db():
     conn = sqlite3.connect(DB_PATH)
@@ -15,6 +15,21 @@ def ensure_db():
         created_at INTEGER
     )
     ''')
+    # Keyword rules: a subscriber with rules is only pushed calls whose
+    # transcript contains one of its phrases (optionally for one feed);
+    # a subscriber without rules gets every call.
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        endpoint TEXT,
+        phrase TEXT,
+        feed TEXT
+    )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS rules_endpoint ON rules (endpoint)')
+    # Bumped on every rule change so matchers know when to rebuild.
+    cur.execute('CREATE TABLE IF NOT EXISTS rules_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER)')
+    cur.execute('INSERT OR IGNORE INTO rules_version (id, version) VALUES (1, 0)')
     conn.commit()
     conn.close()
 
@@ -39,10 +54,57 @@ def list_subscriptions():
     return rows
 
 
+def list_subscriptions_by_endpoint():
+    ensure_db()
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    cur.execute('SELECT endpoint, subscription_json FROM subscriptions')
+    rows = {r[0]: json.loads(r[1]) for r in cur.fetchall()}
+    conn.close()
+    return rows
+
+
 def remove_subscription(endpoint):
     ensure_db()
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     cur.execute('DELETE FROM subscriptions WHERE endpoint = ?', (endpoint,))
+    if cur.execute('DELETE FROM rules WHERE endpoint = ?', (endpoint,)).rowcount:
+        cur.execute('UPDATE rules_version SET version = version + 1')
+    conn.commit()
+    conn.close()
+
+
+def set_rules(endpoint, rules):
+    """Replace the rules of ``endpoint`` with ``rules``: a list of (phrase, feed or None)."""
+    ensure_db()
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    cur.execute('DELETE FROM rules WHERE endpoint = ?', (endpoint,))
+    cur.executemany('INSERT INTO rules (endpoint, phrase, feed) VALUES (?, ?, ?)',
+                    [(endpoint, phrase, feed) for phrase, feed in rules])
+    cur.execute('UPDATE rules_version SET version = version + 1')
     conn.commit()
     conn.close()
+
+
+def list_rules(endpoint=None):
+    """``(endpoint, phrase, feed)`` rows, for one subscriber or all."""
+    ensure_db()
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    if endpoint:
+        cur.execute('SELECT endpoint, phrase, feed FROM rules WHERE endpoint = ? ORDER BY id', (endpoint,))
+    else:
+        cur.execute('SELECT endpoint, phrase, feed FROM rules ORDER BY id')
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def rules_version():
+    ensure_db()
+    conn = sqlite3.connect(DB_PATH)
+    version = conn.execute('SELECT version FROM rules_version').fetchone()[0]
+    conn.close()
+    return version
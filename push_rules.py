@@ -0,0 +1,108 @@
+"""Keyword rules for push notifications.
+
+All subscribers' phrases are compiled into one Aho–Corasick automaton, so a
+transcript is scanned once, in time linear in its length plus the matches,
+however many rules exist. Text and phrases are normalised the same way
+(lower case, runs of anything but letters and digits collapsed to one
+space, padded with a space at each end), which makes phrases match whole
+words only: "fire" does not fire on "fireworks", "main st" does match
+"Main St." The automaton is rebuilt only when the rules change.
+"""
+import re
+import threading
+from collections import deque
+
+import push_db
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    return ' ' + _NON_WORD.sub(' ', (text or '').lower()).strip() + ' '
+
+
+class Automaton:
+    """Multi-pattern matcher over ``{pattern: payload}`` (patterns pre-normalised)."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern, payload in patterns.items():
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(payload)
+        # Breadth-first fail links; each node inherits its fail node's outputs.
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text):
+        """Payloads of every pattern occurring in ``text`` (once per occurrence)."""
+        found = []
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.extend(out[node])
+        return found
+
+
+class RuleMatcher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._automaton = None
+        self._with_rules = frozenset()
+
+    def _current(self):
+        version = push_db.rules_version()
+        with self._lock:
+            if version != self._version:
+                patterns = {}
+                endpoints = set()
+                for endpoint, phrase, feed in push_db.list_rules():
+                    key = normalize(phrase)
+                    if key.strip():
+                        patterns.setdefault(key, []).append((endpoint, feed or None))
+                        endpoints.add(endpoint)
+                self._automaton = Automaton(patterns)
+                self._with_rules = frozenset(endpoints)
+                self._version = version
+            return self._automaton, self._with_rules
+
+    def recipients(self, feed, texts):
+        """Subscriptions to push for a call of ``feed`` whose transcripts are ``texts``.
+
+        Subscribers without rules get every call; the rest only calls that
+        match one of their phrases (for their feed, if they named one).
+        """
+        automaton, with_rules = self._current()
+        matched = set()
+        for hits in automaton.find(normalize(' \n '.join(t for t in texts if t))):
+            for endpoint, rule_feed in hits:
+                if rule_feed is None or rule_feed == feed:
+                    matched.add(endpoint)
+        subs = push_db.list_subscriptions_by_endpoint()
+        return [sub for endpoint, sub in subs.items() if endpoint not in with_rules or endpoint in matched]
+
+
+matcher = RuleMatcher()
@@ -5,9 +5,10 @@ from pywebpush import webpush, WebPushException
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import ec
 import base64
+import config
 
-VAPID_PUBLIC_FILE = os.path.join(os.path.dirname(__file__), 'vapid_public.key')
-VAPID_PRIVATE_FILE = os.path.join(os.path.dirname(__file__), 'vapid_private.key')
+VAPID_PUBLIC_FILE = config.VAPID_PUBLIC_FILE
+VAPID_PRIVATE_FILE = config.VAPID_PRIVATE_FILE
 
 # Helper to load VAPID keys if present
 def load_vapid_keys():
@@ -21,6 +22,45 @@ def load_vapid_keys():
     return None, None
 
 
+FEED_NAMES = {'pd': 'Police', 'fd': 'Fire/EMS'}
+FEED_PAGES = {'pd': '/scanner_pd', 'fd': '/scanner_fire'}
+SNIPPET_CHARS = 160
+
+
+def call_payload(row):
+    """Push payload announcing one new call, from its call index row.
+
+    Carries what the service worker needs to fetch the call before the
+    notification is shown; push services cap payloads at about 4 KB, so
+    the transcript is cut to a snippet.
+    """
+    transcript = (row.get('edited_transcript') if row.get('edited') else None) or row.get('transcript') or row.get('text') or ''
+    snippet = ' '.join(transcript.split())
+    if len(snippet) > SNIPPET_CHARS:
+        snippet = snippet[:SNIPPET_CHARS - 1].rstrip() + '…'
+    feed = row['feed']
+    call_id = row['file'][:-4].replace('rec_', '', 1)
+    return {
+        'title': f"New {FEED_NAMES.get(feed, feed)} call",
+        'message': snippet or 'New call',
+        'data': {
+            'type': 'call',
+            'id': call_id,
+            'feed': feed,
+            'file': row['file'],
+            'snippet': snippet,
+            'audio': f"/scanner/audio/{row['file']}",
+            'meta': f"/api/call/{call_id}",
+            'url': FEED_PAGES.get(feed, '/scanner/'),
+        },
+    }
+
+
+def call_texts(row):
+    """Transcript variants of a call that keyword rules are matched against."""
+    return [row.get('transcript') or row.get('text'), row.get('edited_transcript')]
+
+
 def send_push(subscription_info, payload, vapid_private_key, vapid_claims):
     # Debug: log input shapes (do not log secrets in production)
     try:
@@ -50,7 +90,9 @@ def send_push(subscription_info, payload, vapid_private_key, vapid_claims):
             data=json.dumps(payload),
             # pywebpush expects the private key as a PEM string
             vapid_private_key=(vapid_private_key.decode('utf-8') if isinstance(vapid_private_key, (bytes, bytearray)) else vapid_private_key),
-            vapid_claims=vapid_claims,
+            # webpush() writes the endpoint's origin into the claims as
+            # 'aud'; a copy keeps one push service's aud off the next.
+            vapid_claims=dict(vapid_claims),
             ttl=60
         )
         return True, None
@@ -78,7 +120,7 @@ def send_push(subscription_info, payload, vapid_private_key, vapid_claims):
                 subscription_info=subscription_info,
                 data=json.dumps(payload),
                 vapid_private_key=raw_b64,
-                vapid_claims=vapid_claims,
+                vapid_claims=dict(vapid_claims),
                 ttl=60
             )
             return True, None
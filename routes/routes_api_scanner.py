@@ -1,50 +1,50 @@
-from flask import Blueprint, jsonify, send_from_directory, abort
+from flask import Blueprint, jsonify, abort, request
 from pathlib import Path
+import datetime
 import json
+import config
+import call_index
+import storage
 
 api_scanner_bp = Blueprint("api_scanner", __name__)
-ARCHIVE_BASE = Path("/home/ned/scanner_archive/clean")
+ARCHIVE_BASE = Path(config.ARCHIVE_DIR)
+MAX_STATS_DAYS = 3660  # ten years; far more would overflow the start date
 
 def find_file(filename):
-    for sub in ["pd", "fd"]:
-        f = ARCHIVE_BASE / sub / filename
-        if f.exists():
-            return f
-    return None
+    """Resolve a call file in the live directories or day packs (storage.Location)."""
+    location = storage.resolve(filename)
+    if location is None or location.feed not in config.FEEDS:
+        return None
+    return location
 
 @api_scanner_bp.route("/api/calls")
 def list_calls():
     calls = []
-    for sub in ["pd", "fd"]:
-        for wav in sorted((ARCHIVE_BASE / sub).glob("*.wav"), reverse=True):
-            base = wav.stem
-            json_path = wav.with_suffix(".json")
-            call_id = base.replace("rec_", "")
+    for sub in config.FEEDS:
+        storage.sync_feed(sub)
+        for row in call_index.query_calls(feed=sub):
+            call_id = Path(row["file"]).stem.replace("rec_", "")
             entry = {
                 "id": call_id,
                 "feed": sub,
-                "audio": f"/api/audio/{wav.name}",
+                "audio": f"/api/audio/{row['file']}",
                 "transcript": "",  # will set below
-                "filename": wav.name,
+                "filename": row["file"],
+                "duration": row["duration"],
+                "sample_rate": row["sample_rate"],
+                "channels": row["channels"],
             }
 
-            if json_path.exists():
-                try:
-                    with open(json_path) as f:
-                        meta = json.load(f)
+            if row["has_json"]:
+                # Choose transcript
+                if row["edited"] and row["edited_transcript"]:
+                    entry["transcript"] = row["edited_transcript"]
+                    entry["edited"] = True
+                else:
+                    entry["transcript"] = row["transcript"] or ""
+                    entry["edited"] = False
 
-                        # Choose transcript
-                        if meta.get("edited") and meta.get("edited_transcript"):
-                            entry["transcript"] = meta["edited_transcript"]
-                            entry["edited"] = True
-                        else:
-                            entry["transcript"] = meta.get("transcript", "")
-                            entry["edited"] = False
-
-                        entry["metadata"] = meta
-
-                except Exception as e:
-                    print(f"[WARN] Skipping {json_path.name}: {e}")
+                entry["metadata"] = json.loads(row["metadata_json"])
 
             calls.append(entry)
 
@@ -56,23 +56,29 @@ def get_call_details(call_id):
     wav = find_file(f"{base}.wav")
     if not wav:
         return abort(404, description="Call not found")
-    txt = wav.with_suffix(".txt")
-    json_path = wav.with_suffix(".json")
+    txt = storage.read_sidecar(wav, ".txt")
+    raw_json = storage.read_sidecar(wav, ".json")
 
     data = {
         "id": call_id,
         "audio": f"/api/audio/{wav.name}",
         "filename": wav.name,
-        "transcript": txt.read_text() if txt.exists() else "",
+        "transcript": txt.decode("utf-8") if txt is not None else "",
         "metadata": {}
     }
 
-    if json_path.exists():
+    if raw_json is not None:
         try:
-            data["metadata"] = json.loads(json_path.read_text())
+            data["metadata"] = json.loads(raw_json)
         except:
             pass
 
+    row = call_index.get_call(wav.name, wav.feed)
+    if row:
+        data["duration"] = row["duration"]
+        data["sample_rate"] = row["sample_rate"]
+        data["channels"] = row["channels"]
+
     return jsonify(data)
 
 @api_scanner_bp.route("/api/audio/<filename>")
@@ -80,5 +86,29 @@ def get_audio(filename):
     f = find_file(filename)
     if not f:
         return abort(404)
-    return send_from_directory(f.parent, f.name)
+    return storage.send_location(f)
+
+
+
+@api_scanner_bp.route("/api/segments/stats")
+def segment_stats():
+    """Segment counts and airtime per speaker, role or label, by day.
+
+    Query: ``dimension`` (speaker | speaker_role | speaker_label, default
+    speaker_label) and either ``days`` (trailing window, default 7) or
+    ``start``/``end`` as YYYY-MM-DD.
+    """
+    dimension = request.args.get("dimension", "speaker_label")
+    if dimension not in call_index.SEGMENT_FILTERS:
+        return jsonify({"error": "Invalid dimension"}), 400
+    start = request.args.get("start")
+    end = request.args.get("end")
+    if not start and not end:
+        days = request.args.get("days", 7, type=int)
+        if not 1 <= days <= MAX_STATS_DAYS:
+            return jsonify({"error": f"days must be between 1 and {MAX_STATS_DAYS}"}), 400
+        start = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
 
+    call_index.sync_segments(config.SEGMENT_DIR)
+    stats = call_index.segment_stats(dimension, start, end)
+    return jsonify({"dimension": dimension, "start": start, "end": end, **stats})
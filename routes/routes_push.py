@@ -3,16 +3,21 @@ import os
 import json
 from . import routes_scanner as scanner_routes
 import push_db
+import push_rules
 import push_utils
 import redis
+import call_index
+import config
+import ingest
+import shared_cache
+import storage
 
 push_bp = Blueprint('push', __name__)
 
-REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
-redis_client = redis.from_url(REDIS_URL)
+redis_client = redis.from_url(config.REDIS_URL)
 
-VAPID_PUBLIC_FILE = os.path.join(os.path.dirname(__file__), '..', 'vapid_public.key')
-VAPID_PRIVATE_FILE = os.path.join(os.path.dirname(__file__), '..', 'vapid_private.key')
+VAPID_PUBLIC_FILE = config.VAPID_PUBLIC_FILE
+VAPID_PRIVATE_FILE = config.VAPID_PRIVATE_FILE
 
 
 @push_bp.route('/scanner/push/vapid_public')
@@ -30,7 +35,15 @@ def subscribe():
     data = request.get_json()
     if not data:
         return jsonify({'error': 'invalid json'}), 400
+    # Keyword rules may ride along with the subscription itself.
+    rules = data.pop('rules', None)
+    if rules is not None:
+        rules, error = _parse_rules(rules)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
     push_db.save_subscription(data)
+    if rules is not None:
+        push_db.set_rules(data.get('endpoint'), rules)
     return jsonify({'success': True})
 
 
@@ -42,15 +55,92 @@ def unsubscribe():
     return jsonify({'success': True})
 
 
+MAX_RULES = 50
+MAX_PHRASE = 100
+
+
+def _parse_rules(rules):
+    """``[(phrase, feed or None)]`` from a list of phrases or ``{"phrase", "feed"}`` objects."""
+    if not isinstance(rules, list) or len(rules) > MAX_RULES:
+        return None, f'rules must be a list of at most {MAX_RULES} entries'
+    parsed = []
+    for rule in rules:
+        if isinstance(rule, str):
+            rule = {'phrase': rule}
+        if not isinstance(rule, dict):
+            return None, 'each rule must be a phrase or an object with a phrase'
+        phrase = (rule.get('phrase') or '').strip()
+        feed = rule.get('feed') or None
+        if not phrase or len(phrase) > MAX_PHRASE or not push_rules.normalize(phrase).strip():
+            return None, f'invalid phrase: {phrase[:MAX_PHRASE]!r}'
+        if feed is not None and feed not in config.FEEDS:
+            return None, f'invalid feed: {feed!r}'
+        parsed.append((phrase, feed))
+    return parsed, None
+
+
+@push_bp.route('/scanner/push/rules', methods=['GET', 'POST'])
+def push_rules_view():
+    """Read (GET ?endpoint=) or replace (POST {endpoint, rules}) a subscriber's keyword rules.
+
+    An empty rule list means "every call".
+    """
+    if request.method == 'GET':
+        endpoint = request.args.get('endpoint')
+        if not endpoint:
+            return jsonify({'success': False, 'error': 'endpoint required'}), 400
+        rules = [{'phrase': phrase, 'feed': feed} for _, phrase, feed in push_db.list_rules(endpoint)]
+        return jsonify({'endpoint': endpoint, 'rules': rules})
+    data = request.get_json() or {}
+    endpoint = data.get('endpoint')
+    if not endpoint or endpoint not in push_db.list_subscriptions_by_endpoint():
+        return jsonify({'success': False, 'error': 'unknown subscription'}), 404
+    parsed, error = _parse_rules(data.get('rules', []))
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    push_db.set_rules(endpoint, parsed)
+    return jsonify({'success': True, 'rules': len(parsed)})
+
+
 @push_bp.route('/scanner/push/send', methods=['POST'])
 def send_push():
+    """Queue a push.
+
+    Body: ``{"message": ...}`` for a plain notification to everyone, or
+    ``{"feed": "pd", "file": "rec_....wav"}`` to announce a new call with its
+    id, snippet and audio URL so the service worker can fetch it before
+    notifying. Calls go only to subscribers whose keyword rules match.
+    """
     data = request.get_json() or {}
+    if data.get('file'):
+        row, error = _new_call(data.get('feed'), data['file'])
+        if error:
+            return jsonify({'success': False, 'error': error}), 404
+        payload = ingest.announce(redis_client, row)
+        if payload is None:
+            # The ingest watcher (or an earlier request) already announced it.
+            return jsonify({'queued': False, 'duplicate': True})
+        return jsonify({'queued': True, 'payload': payload})
     message = data.get('message', 'Test push')
     # push job to redis list
     redis_client.lpush('push_queue', json.dumps({'message': message}))
     return jsonify({'queued': True})
 
 
+def _new_call(feed, filename):
+    if feed not in config.FEEDS:
+        return None, 'Unknown feed'
+    # The call has usually just been written; indexing is mtime-gated, so
+    # this only reads the new files.
+    storage.sync_feed(feed)
+    row = call_index.get_call(filename, feed)
+    if row is None:
+        return None, 'Call not found'
+    # A new call: every process drops its cached pages for the feed.
+    shared_cache.cache.invalidate(feed)
+    return row, None
+
+
 @push_bp.route('/scanner/push/send_now', methods=['POST'])
 def send_push_now():
     """Send a push to all stored subscriptions immediately (useful for testing).
@@ -60,15 +150,25 @@ def send_push_now():
     """
     data = request.get_json() or {}
     message = data.get('message', 'Test push')
+    body = {'message': message}
+    row = None
+    if data.get('file'):
+        row, error = _new_call(data.get('feed'), data['file'])
+        if error:
+            return jsonify({'success': False, 'error': error}), 404
+        body = push_utils.call_payload(row)
     vapid_pub, vapid_priv = push_utils.load_vapid_keys()
     if not vapid_priv:
         return jsonify({'error': 'VAPID private key not configured'}), 500
-    vapid_claims = {'sub': 'mailto:admin@iamcalledned.ai'}
+    vapid_claims = {'sub': config.VAPID_CLAIM_SUB}
     results = []
-    subs = push_db.list_subscriptions()
+    if row is not None:
+        subs = push_rules.matcher.recipients(row['feed'], push_utils.call_texts(row))
+    else:
+        subs = push_db.list_subscriptions()
     for s in subs:
         try:
-            ok, err = push_utils.send_push(s, {'message': message}, vapid_priv, vapid_claims)
+            ok, err = push_utils.send_push(s, body, vapid_priv, vapid_claims)
             entry = {'endpoint': s.get('endpoint'), 'ok': bool(ok)}
             if err:
                 entry['error'] = str(err)
@@ -1,22 +1,43 @@
-from flask import Blueprint, render_template, send_from_directory, request, jsonify, redirect
+from flask import Blueprint, Response, render_template, send_from_directory, request, jsonify, redirect
 from pathlib import Path
+import base64
+import csv
 import datetime
+import io
 import json
+import math
 from collections import defaultdict
+from werkzeug.datastructures import ContentRange
 from werkzeug.utils import secure_filename
-import shutil
+from werkzeug.wsgi import FileWrapper
 import os
 import time
 import threading
 import uuid
+import config
+import call_index
+import coalesce
+import peaks
+import shared_cache
+import storage
+import wav_clip
+import zip_stream
+from call_record import CallRecord, pack_all, timestamps, unpack_all
+from archive_utils import link_file
+from metadata_journal import journal
+from wav_utils import read_wav_info
 
 scanner_bp = Blueprint("scanner", __name__)
-LOGIN_PROCESS_URL = os.environ.get('LOGIN_PROCESS_URL', 'http://127.0.0.1:8010/api/login')
-ARCHIVE_DIR = "/home/ned/scanner_archive/clean"
-PD_DIR = Path("/home/ned/scanner_archive/clean/pd")
-REVIEW_DIR = Path("/home/ned/scanner_archive/review")
-SEGMENT_DIR = Path("/home/ned/scanner_archive/segmentation/processed")
+LOGIN_PROCESS_URL = config.LOGIN_PROCESS_URL
+ARCHIVE_DIR = config.ARCHIVE_DIR
+PD_DIR = Path(ARCHIVE_DIR) / "pd"
+REVIEW_DIR = Path(config.REVIEW_DIR)
+SEGMENT_DIR = Path(config.SEGMENT_DIR)
 CALLS_PER_PAGE = 10
+MAX_BATCH = 1000
+SEGMENTS_PER_PAGE = 50
+LISTING_COLUMNS = ("feed", "file", "transcript", "edited_transcript", "enhanced_transcript", "edited",
+                   "duration", "sample_rate", "channels")
 
 # Simple in-memory active user registry. Key: client_id -> {last_seen, ip, ua, page}
 ACTIVE_USERS = {}
@@ -26,146 +47,167 @@ ACTIVE_TIMEOUT = 120  # seconds considered "active"
 
 
 def load_calls(directory, feed="pd", filter_today=False):
-    calls = []
-    today = datetime.date.today()
+    """Calls in ``directory`` (newest first) from the call index.
 
-    for wav in sorted(Path(directory).glob("*.wav"), reverse=True):
-        base = wav.stem
-        txt = wav.with_suffix(".txt")
-        json_path = wav.with_suffix(".json")
+    The index is refreshed from the directory first; sidecars and WAV
+    headers are only read for calls that are new or changed.
+    """
+    day = datetime.date.today().isoformat() if filter_today else None
 
-        try:
-            date_str = base.split("_")[1]
-            call_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-        except Exception:
-            call_date = None
+    def build():
+        call_index.sync_calls(directory, feed)
+        duplicates = call_index.duplicate_map(feed, day)
+        return _collapse([CallRecord.from_row(row, feed, duplicates.get(row["file"], ""))
+                          for row in call_index.query_calls(feed=feed, day=day, has_json=True,
+                                                            location=directory, columns=LISTING_COLUMNS)])
 
-        if filter_today and call_date != today:
-            continue
+    # Every client refreshes when a call lands; they share one build.
+    return coalesce.flight.do(("load_calls", str(directory), feed, day), build)
 
-        timestamp = base.replace("rec_", "").replace("_", " ")
-        try:
-            dt = datetime.datetime.strptime(base.replace("rec_", ""), "%Y-%m-%d_%H-%M-%S")
-            timestamp_human = dt.strftime("%b %d, %I:%M %p")
-        except Exception:
-            timestamp_human = timestamp
-
-        transcript = "(no transcript)"
-        edit_pending = False
-        edited_transcript = ""
-
-        if json_path.exists():
-            try:
-                with open(json_path) as f:
-                    data = json.load(f)
-
-                if data.get("edited") and data.get("edited_transcript"):
-                    transcript = data["edited_transcript"]
-                    edit_pending = False
-                elif "edited_transcript" in data:
-                    transcript = data["edited_transcript"]
-                    edit_pending = True
-                else:
-                    transcript = data.get("transcript", transcript)
-
-                calls.append({
-                    "file": wav.name,
-                    "path": f"/scanner/audio/{wav.name}",
-                    "transcript": data.get("transcript", transcript),
-                    "edited_transcript": data.get("edited_transcript", ""),
-                    "enhanced_transcript": data.get("enhanced_transcript", ""),
-                    "edit_pending": edit_pending,
-                    "timestamp": timestamp,
-                    "timestamp_human": timestamp_human,
-                    "feed": feed,
-                    "metadata": data
-                })
-            except Exception as e:
-                print(f"[!] Failed to load JSON for {base}: {e}")
-
-    return calls
-
-
-def load_archive(directory):
-    archive = {}
-    for wav in sorted(Path(directory).glob("*.wav"), reverse=True):
-        base = wav.stem
-        txt = wav.with_suffix(".txt")
-        try:
-            date_str = base.split("_")[1]
-            call_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-            day_key = call_date.strftime("%Y-%m-%d")
-        except Exception:
-            day_key = "unknown"
 
-        timestamp = base.replace("rec_", "").replace("_", " ")
-        try:
-            dt = datetime.datetime.strptime(base.replace("rec_", ""), "%Y-%m-%d_%H-%M-%S")
-            timestamp_human = dt.strftime("%b %d, %I:%M %p")
-        except Exception:
-            timestamp_human = timestamp
-
-        data = {
-            "file": wav.name,
-            "path": f"/scanner/audio/{wav.name}",
-            "transcript": txt.read_text() if txt.exists() else "(no transcript)",
-            "timestamp": timestamp,
-            "timestamp_human": timestamp_human
+def _collapse(records):
+    """Leave duplicate transmissions out of a listing if FINGERPRINT_COLLAPSE is set."""
+    if not config.FINGERPRINT_COLLAPSE:
+        return records
+    return [r for r in records if not r.duplicate_of]
+
+
+def _cached(feed, name, build, ttl=None):
+    """``build()`` through the fleet-wide cache.
+
+    A build whose index sync picked up new or edited calls (the call index
+    version moved) invalidates the feed everywhere, so other processes drop
+    pages built before the change.
+    """
+    def tracked():
+        before = call_index.current_version()
+        value = build()
+        if call_index.current_version() != before:
+            shared_cache.cache.invalidate(feed)
+        return value
+    # Pages hold packed CallRecords; the format is part of the key so a
+    # deploy never reads entries written in another shape.
+    return shared_cache.cache.get_or_build(feed, f"{CallRecord.PACK_FORMAT}:{name}", tracked, ttl)
+
+
+def _today_page(feed, page):
+    """One page of today's calls of ``feed`` from its live directory."""
+    day = datetime.date.today().isoformat()
+    start = (page - 1) * CALLS_PER_PAGE
+
+    def build():
+        return pack_all(load_calls(f"{ARCHIVE_DIR}/{feed}", feed=feed, filter_today=True)[start:start + CALLS_PER_PAGE])
+    return unpack_all(_cached(feed, f"today:{day}:{page}", build, config.SHARED_CACHE_LIVE_TTL))
+
+
+def _archive_front(feed):
+    """First page and call count of every archive day of ``feed``."""
+    def build():
+        archive = load_archive(feed)
+        return {
+            "days": {day: pack_all(calls[:CALLS_PER_PAGE]) for day, calls in archive.items()},
+            "totals": {day: len(calls) for day, calls in archive.items()},
         }
-        archive.setdefault(day_key, []).append(data)
+    front = _cached(feed, "archive:front", build)
+    return {"days": {day: unpack_all(calls) for day, calls in front["days"].items()}, "totals": front["totals"]}
+
+
+def _archive_day(feed, day, page):
+    """``{"calls", "total"}`` for one page of an archive day, or None if no such day."""
+    def build():
+        calls = load_archive(feed).get(day)
+        if calls is None:
+            return None
+        start = (page - 1) * CALLS_PER_PAGE
+        return {"calls": pack_all(calls[start:start + CALLS_PER_PAGE]), "total": len(calls)}
+    result = _cached(feed, f"archive:{day}:{page}", build)
+    if result is None:
+        return None
+    return {"calls": unpack_all(result["calls"]), "total": result["total"]}
+
+
+def load_archive(feed):
+    """Every call of ``feed`` grouped by day, across the live directory and day packs."""
+    return coalesce.flight.do(("load_archive", feed), lambda: _build_archive(feed))
+
+
+def _build_archive(feed):
+    storage.sync_feed(feed)
+    duplicates = call_index.duplicate_map(feed)
+    archive = {}
+    for row in call_index.query_calls(feed=feed, columns=("feed", "file", "day", "text", "duration")):
+        record = CallRecord.from_text_row(row, feed, duplicates.get(row["file"], ""))
+        if not (config.FINGERPRINT_COLLAPSE and record.duplicate_of):
+            archive.setdefault(row["day"], []).append(record)
     return dict(sorted(archive.items(), reverse=True))
 
 
+def _encode_cursor(cursor):
+    if not cursor:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(token):
+    if not token:
+        return None
+    try:
+        ts, name = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return str(ts), str(name)
+    except Exception:
+        return None
+
+
 @scanner_bp.route("/scanner/segments")
 def scanner_segments():
-    calls = []
-    for wav in sorted(SEGMENT_DIR.glob("*.wav"), reverse=True):
-        base = wav.stem
-        json_path = wav.with_suffix(".json")
-        transcript = "(no transcript)"
-        speaker = ""
-        timestamp_human = wav.stem.replace("_", " ")
-
-        if json_path.exists():
-            try:
-                with open(json_path) as f:
-                    data = json.load(f)
-                transcript = data.get("transcript", transcript)
-                speaker = data.get("speaker", "")
-                timestamp_human = datetime.datetime.fromisoformat(data.get("timestamp")).strftime("%b %d, %I:%M %p")
-            except Exception:
-                pass
+    call_index.sync_segments(SEGMENT_DIR)
+    filters = {k: request.args.get(k, "").strip() for k in call_index.SEGMENT_FILTERS}
+    per_page = min(max(request.args.get("per_page", SEGMENTS_PER_PAGE, type=int), 1), 200)
+    rows, next_cursor = call_index.query_segments(
+        filters, _decode_cursor(request.args.get("cursor")), per_page
+    )
 
+    calls = []
+    for row in rows:
+        try:
+            timestamp_human = datetime.datetime.fromisoformat(row["ts"]).strftime("%b %d, %I:%M %p")
+        except Exception:
+            timestamp_human = Path(row["file"]).stem.replace("_", " ")
         calls.append({
-            "file": wav.name,
-            "path": f"/scanner/audio/{wav.name}",
-            "transcript": transcript,
+            "file": row["file"],
+            "path": f"/scanner/audio/{row['file']}",
+            "transcript": row["transcript"],
             "timestamp_human": timestamp_human,
-            "speaker": speaker
+            "speaker": row["speaker"],
+            "speaker_role": row["speaker_role"],
+            "speaker_label": row["speaker_label"],
         })
 
-    return render_template("scanner_segments.html", calls=calls)
+    next_token = _encode_cursor(next_cursor)
+    if request.headers.get("Accept") == "application/json" or request.args.get("json") == "1":
+        return jsonify({"calls": calls, "next_cursor": next_token})
+    return render_template(
+        "scanner_segments.html",
+        calls=calls,
+        filters=filters,
+        next_cursor=next_token,
+        per_page=per_page,
+    )
 
 @scanner_bp.route("/scanner_pd")
 def scanner_pd():
-    calls = load_calls(f"{ARCHIVE_DIR}/pd", filter_today=True)
     page = int(request.args.get("page", 1))
-    start = (page - 1) * CALLS_PER_PAGE
-    end = start + CALLS_PER_PAGE
     if request.headers.get("Accept") == "application/json":
-        return jsonify({"calls": calls[start:end]})
-    return render_template("scanner_pd.html", calls=calls[:CALLS_PER_PAGE])
+        return jsonify({"calls": [c.to_dict() for c in _today_page("pd", page)]})
+    return render_template("scanner_pd.html", calls=_today_page("pd", 1))
 
 
 @scanner_bp.route("/scanner_fire")
 def scanner_fire():
-    calls = load_calls(f"{ARCHIVE_DIR}/fd", feed="fd", filter_today=True)
     page = int(request.args.get("page", 1))
-    start = (page - 1) * CALLS_PER_PAGE
-    end = start + CALLS_PER_PAGE
     if request.headers.get("Accept") == "application/json":
-        return jsonify({"calls": calls[start:end]})
-    return render_template("scanner_fire.html", calls=calls[:CALLS_PER_PAGE])
+        return jsonify({"calls": [c.to_dict() for c in _today_page("fd", page)]})
+    return render_template("scanner_fire.html", calls=_today_page("fd", 1))
 
 
 # Backwards-compatible aliases: some links use /scanner_fd — keep working
@@ -177,13 +219,10 @@ def scanner_fd():
 
 @scanner_bp.route("/scanner")
 def scanner_list():
-    calls = load_calls(f"{ARCHIVE_DIR}/pd", filter_today=True)
     page = int(request.args.get("page", 1))
-    start = (page - 1) * CALLS_PER_PAGE
-    end = start + CALLS_PER_PAGE
     if request.headers.get("Accept") == "application/json" or request.args.get("json") == "1":
-        return jsonify({"calls": calls[start:end]})
-    return render_template("scanner.html", calls=calls[:CALLS_PER_PAGE])
+        return jsonify({"calls": [c.to_dict() for c in _today_page("pd", page)]})
+    return render_template("scanner.html", calls=_today_page("pd", 1))
 
 
 # Accept trailing slash as well so `/scanner/` doesn't 404.
@@ -192,115 +231,420 @@ def scanner_list_slash():
     return scanner_list()
 
 
+@scanner_bp.route("/scanner/changes")
+def scanner_changes():
+    """Calls added, edited or removed since ``since`` (a version from a previous reply).
+
+    Clients start from ``since=0`` and keep the returned ``version``. When
+    ``more`` is true they ask again straight away; ``reset`` means the index
+    was rebuilt and the local copy should be dropped before applying.
+    ``from_day`` (YYYY-MM-DD) limits the calls to that day and later, so a
+    new client does not have to download the whole archive.
+    """
+    feed = request.args.get("feed")
+    if feed and feed not in config.FEEDS:
+        return jsonify({"success": False, "error": "Unknown feed"}), 400
+    from_day = request.args.get("from_day")
+    if from_day:
+        try:
+            datetime.date.fromisoformat(from_day)
+        except ValueError:
+            return jsonify({"success": False, "error": "Invalid from_day"}), 400
+    try:
+        since = int(request.args.get("since", 0))
+        limit = max(1, min(int(request.args.get("limit", 500)), MAX_BATCH))
+    except ValueError:
+        return jsonify({"success": False, "error": "since and limit must be integers"}), 400
+
+    for f in [feed] if feed else config.FEEDS:
+        storage.sync_feed(f)
+    reset = since > call_index.current_version()
+    if reset:
+        since = 0
+    rows, deleted, version, more = call_index.changes_since(
+        since, feed=feed, limit=limit, columns=LISTING_COLUMNS + ("day", "has_json"), from_day=from_day)
+    calls = []
+    for row in rows:
+        if not row["has_json"]:
+            # Listings only show calls with a sidecar; until it exists the
+            # call is as good as absent for the client.
+            deleted.append((row["feed"], row["file"]))
+            continue
+        entry = CallRecord.from_row(row).to_dict()
+        entry["day"] = row["day"]
+        entry["version"] = row["version"]
+        calls.append(entry)
+    return jsonify({
+        "version": version,
+        "more": more,
+        "reset": reset,
+        "calls": calls,
+        "deleted": [{"feed": f, "file": name} for f, name in deleted],
+    })
+
+
 @scanner_bp.route("/scanner/archive")
+@coalesce.archive_gate.admit
 def scanner_archive():
-    sorted_archive = load_archive(f"{ARCHIVE_DIR}/pd")
     if request.headers.get("Accept") == "application/json" or request.args.get("json") == "1":
         day = request.args.get("day")
         page = int(request.args.get("page", 1))
-        if day and day in sorted_archive:
-            calls = sorted_archive[day]
-            start = (page - 1) * CALLS_PER_PAGE
-            end = start + CALLS_PER_PAGE
-            return jsonify({"calls": calls[start:end], "total": len(calls)})
+        result = _archive_day("pd", day, page) if day else None
+        if result is not None:
+            return jsonify({"calls": [c.to_dict() for c in result["calls"]], "total": result["total"]})
         return jsonify({"error": "Invalid day"}), 400
 
-    archive_render = {}
-    call_totals = {}
-    for day, call_list in sorted_archive.items():
-        call_totals[day] = len(call_list)
-        archive_render[day] = call_list[:CALLS_PER_PAGE]
-
+    front = _archive_front("pd")
     return render_template(
         "scanner_archive.html",
-        archive=archive_render,
+        feed="pd",
+        archive=front["days"],
         calls_per_page=CALLS_PER_PAGE,
-        call_totals=call_totals
+        call_totals=front["totals"]
     )
 
 
 @scanner_bp.route("/scanner_fire/archive")
+@coalesce.archive_gate.admit
 def scanner_fire_archive():
-    sorted_archive = load_archive(f"{ARCHIVE_DIR}/fd")
     if request.headers.get("Accept") == "application/json" or request.args.get("json") == "1":
         day = request.args.get("day")
         page = int(request.args.get("page", 1))
-        if day and day in sorted_archive:
-            calls = sorted_archive[day]
-            start = (page - 1) * CALLS_PER_PAGE
-            end = start + CALLS_PER_PAGE
-            return jsonify({"calls": calls[start:end], "total": len(calls)})
+        result = _archive_day("fd", day, page) if day else None
+        if result is not None:
+            return jsonify({"calls": [c.to_dict() for c in result["calls"]], "total": result["total"]})
         return jsonify({"error": "Invalid day"}), 400
 
-    archive_render = {}
-    call_totals = {}
-    for day, call_list in sorted_archive.items():
-        call_totals[day] = len(call_list)
-        archive_render[day] = call_list[:CALLS_PER_PAGE]
-
+    front = _archive_front("fd")
     return render_template(
         "scanner_archive.html",
-        archive=archive_render,
+        feed="fd",
+        archive=front["days"],
         calls_per_page=CALLS_PER_PAGE,
-        call_totals=call_totals
+        call_totals=front["totals"]
     )
 
 
+EXPORT_COLUMNS = ("feed", "file", "location", "duration", "sample_rate", "text", "transcript",
+                  "edited_transcript", "edited")
+
+
+def _export_archive(feed, day):
+    """ZipStream of every call of ``feed`` on ``day``, or None if there are none.
+
+    Holds each call's WAV and JSON sidecar plus ``manifest.csv``, one row per
+    call with its transcripts. Only the manifest is built in memory.
+    """
+    storage.sync_feed(feed)
+    rows = call_index.query_calls(feed=feed, day=day, columns=EXPORT_COLUMNS)
+    folder = f"{feed}-{day}"
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(["file", "time", "duration", "sample_rate", "edited", "transcript",
+                     "edited_transcript", "text", "sidecar"])
+    members = []
+    for row in reversed(rows):
+        location = storage.locate(row)
+        wav = location and storage.zip_member(location, f"{folder}/{row['file']}")
+        if wav is None:
+            continue
+        sidecar = storage.zip_member(location, f"{folder}/{row['file'][:-4]}.json", ".json")
+        members.append(wav)
+        if sidecar is not None:
+            members.append(sidecar)
+        _, timestamp_human = timestamps(Path(row["file"]).stem)
+        writer.writerow([row["file"], timestamp_human, row["duration"], row["sample_rate"],
+                         row["edited"], row["transcript"] or "", row["edited_transcript"] or "",
+                         row["text"] or "", row["file"][:-4] + ".json" if sidecar else ""])
+    if not members:
+        return None
+    midnight = datetime.date.fromisoformat(day).timetuple()[:6]
+    members.insert(0, zip_stream.BytesMember(f"{folder}/manifest.csv", manifest.getvalue().encode("utf-8"), midnight))
+    return zip_stream.ZipStream(members)
+
+
+@scanner_bp.route("/scanner/export")
+def scanner_export():
+    """Stream one day of a feed as a ZIP: ``?feed=pd&day=YYYY-MM-DD``.
+
+    The archive is laid out from file sizes before anything is read, so the
+    response has a Content-Length and single-range requests (with If-Range)
+    resume an interrupted download.
+    """
+    feed = request.args.get("feed", "pd")
+    day = request.args.get("day", "")
+    if feed not in config.FEEDS:
+        return jsonify({"success": False, "error": "Unknown feed"}), 400
+    try:
+        datetime.date.fromisoformat(day)
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid day"}), 400
+    archive = _export_archive(feed, day)
+    if archive is None:
+        return jsonify({"success": False, "error": "No calls on that day"}), 404
+
+    etag = archive.etag()
+    start, end, status = 0, archive.size, 200
+    if_range = request.if_range
+    if request.range is not None and len(request.range.ranges) == 1 and (
+            if_range.etag == etag or (if_range.etag is None and if_range.date is None)):
+        span = request.range.range_for_length(archive.size)
+        if span is None:
+            rv = Response(status=416)
+            rv.content_range = ContentRange("bytes", None, None, archive.size)
+            return rv
+        start, end = span
+        status = 206
+    rv = Response(archive.iter_bytes(start, end), status=status, mimetype="application/zip",
+                  direct_passthrough=True)
+    rv.content_length = end - start
+    if status == 206:
+        rv.content_range = ContentRange("bytes", start, end, archive.size)
+    rv.accept_ranges = "bytes"
+    rv.set_etag(etag)
+    rv.headers["Content-Disposition"] = f'attachment; filename="{feed}-{day}.zip"'
+    rv.cache_control.private = True
+    return rv
+
+
 @scanner_bp.route("/scanner/audio/<filename>")
 def scanner_audio(filename):
-    search_paths = [
-        Path("/home/ned/scanner_archive/clean/pd"),
-        Path("/home/ned/scanner_archive/clean/fd"),
-        Path("/home/ned/scanner_archive/segmentation/processed")
-    ]
-
-    for path in search_paths:
-        file_path = path / filename
-        if file_path.exists():
-            return send_from_directory(path, filename)
+    response = storage.send_audio(secure_filename(filename))
+    if response is not None:
+        return response
 
     return "File not found", 404
 
 
-@scanner_bp.route("/scanner/submit_edit", methods=["POST"])
-def submit_edit():
-    data = request.get_json()
-    if not data:
-        return jsonify({"success": False, "error": "Invalid JSON"}), 400
+@scanner_bp.route("/scanner/clip/<filename>")
+def scanner_clip(filename):
+    """``?start=&end=`` seconds of a call (or segment) as a WAV of its own.
 
+    The clip is sliced from the memory-mapped source with a synthesized
+    header, so only the requested range is read; Range requests work as for
+    ``/scanner/audio``.
+    """
+    filename = secure_filename(filename)
+    feed = request.args.get("feed") or None
+    if feed and feed not in config.FEEDS:
+        return jsonify({"success": False, "error": "Unknown feed"}), 400
+    try:
+        start = float(request.args.get("start") or 0)
+        end = float(request.args["end"]) if request.args.get("end") else None
+    except ValueError:
+        return jsonify({"success": False, "error": "start and end must be seconds"}), 400
+    if not math.isfinite(start) or (end is not None and not math.isfinite(end)):
+        return jsonify({"success": False, "error": "start and end must be seconds"}), 400
+    location = storage.resolve(filename, feed)
+    if location is None:
+        return jsonify({"success": False, "error": "File not found"}), 404
+    base, length = location.pack.member_range(filename) if location.kind == "pack" else (0, None)
+    try:
+        info = read_wav_info(location.path, base, length)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 415
+    if info["subformat"] not in wav_clip.FORMATS:
+        return jsonify({"success": False, "error": "unsupported WAV format"}), 415
+    try:
+        clip = wav_clip.WavClip(location.path, info, start, end)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    mtime_ns = location.pack.mtime_ns if location.kind == "pack" else os.stat(location.path).st_mtime_ns
+    rv = Response(FileWrapper(clip), mimetype="audio/wav", direct_passthrough=True)
+    rv.content_length = clip.size
+    rv.last_modified = mtime_ns / 1e9
+    rv.set_etag(f"{mtime_ns}-{base}-{clip.start:.6f}-{clip.end:.6f}")
+    rv.headers["Content-Disposition"] = (
+        f'inline; filename="{Path(filename).stem}_{clip.start:.2f}-{clip.end:.2f}.wav"')
+    if location.kind == "pack":
+        rv.cache_control.public = True
+        rv.cache_control.max_age = 86400
+    return rv.make_conditional(request.environ, accept_ranges=True, complete_length=clip.size)
+
+
+@scanner_bp.route("/scanner/peaks/<filename>")
+def scanner_peaks(filename):
+    """Waveform min/max peaks (audiowaveform .dat) for a call's WAV.
+
+    Normally precomputed by the background worker; computed on first request
+    otherwise. ``?feed=`` picks the feed when both have a call of that name.
+    """
+    filename = secure_filename(filename)
+    if not filename.endswith(".wav"):
+        filename = Path(filename).stem + ".wav"
+    feed = request.args.get("feed") or None
+    if feed and feed not in config.FEEDS:
+        return jsonify({"success": False, "error": "Unknown feed"}), 400
+    location = storage.resolve(filename, feed)
+    if not location:
+        return "File not found", 404
+    try:
+        if location.kind == "pack":
+            dat = Path(peaks.peaks_path(filename, location.feed))
+            if not dat.exists():
+                base, length = location.pack.member_range(filename)
+                peaks.write_peaks(location.path, str(dat), base, length)
+        else:
+            dat = Path(peaks.ensure_peaks(location.path, location.feed))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 415
+    return send_from_directory(dat.parent, dat.name, mimetype="application/octet-stream", max_age=86400)
+
+
+def _queue_edit(data):
+    """Validate one transcript edit and hand it to the metadata journal.
+
+    Returns ``(sidecar_path, None, None)`` on success or
+    ``(None, error, status)``.
+    """
     raw_filename = data.get("filename")
     if not raw_filename:
-        return jsonify({"success": False, "error": "Filename required"}), 400
+        return None, "Filename required", 400
 
     filename = secure_filename(raw_filename)
     if not filename.endswith(".wav"):
-        return jsonify({"success": False, "error": "Invalid file type"}), 400
+        return None, "Invalid file type", 400
 
-    new_transcript = data.get("transcript", "").strip()
+    new_transcript = (data.get("transcript") or "").strip()
     feed = data.get("feed", "pd")
+    if feed not in config.FEEDS:
+        return None, "Invalid feed", 400
+
+    location = storage.resolve(filename, feed)
+    if location is None:
+        return None, "Source file missing", 404
+    src_wav = Path(location.path) / filename if location.kind == "pack" else Path(location.path)
+    if location.kind == "pack":
+        # Sealed calls: start the review sidecar from the packed JSON.
+        raw = storage.read_sidecar(location, ".json")
+        if raw is None:
+            return None, "Source file missing", 404
+        seed = json.loads(raw)
+    else:
+        seed = src_wav.with_suffix(".json")
+        if not seed.exists():
+            return None, "Source file missing", 404
+
+    REVIEW_DIR.mkdir(parents=True, exist_ok=True)
+    # Reference the original audio instead of copying it: hardlink or
+    # reflink when the filesystem allows, otherwise just record the
+    # source path in the review index.
+    dst_wav = REVIEW_DIR / filename
+    link_type = link_file(src_wav, dst_wav) if location.kind == "file" else None
+    dst_json = dst_wav.with_suffix(".json")
+
+    def _record_review(path, meta, dir_mtime_ns):
+        call_index.add_review(
+            filename, feed, str(src_wav),
+            str(dst_wav) if link_type else None, link_type or "reference",
+            meta.get("edited_transcript", ""), time.time()
+        )
+
+    journal.submit(
+        dst_json,
+        {"edited_transcript": new_transcript, "source_wav": str(src_wav)},
+        seed_from=seed,
+        on_flush=_record_review,
+    )
+    return dst_json, None, None
+
+
+def _queue_segment_label(data):
+    """Validate one segment label and hand it to the metadata journal."""
+    filename = data.get("filename")
+    speaker = data.get("speaker")
+    label = (data.get("label") or "").strip()
+
+    if not filename or not speaker:
+        return None, "Missing required fields", 400
+
+    json_path = SEGMENT_DIR / secure_filename(filename)
+    if json_path.suffix != ".wav":
+        return None, "Invalid file type", 400
+
+    json_file = json_path.with_suffix(".json")
+    if not json_file.exists():
+        return None, "Metadata JSON not found", 404
+
+    updates = {"speaker_role": speaker}  # e.g., "dispatcher" or "officer"
+    if label:
+        updates["speaker_label"] = label  # e.g., "303", "Control", etc.
+    journal.submit(
+        json_file, updates,
+        on_flush=lambda path, meta, dir_mtime_ns: call_index.upsert_segment(str(json_path), meta, dir_mtime_ns),
+    )
+    return json_file, None, None
+
+
+def _submit_batch(items, queue_fn):
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "error": "Expected a non-empty list"}), 400
+    if len(items) > MAX_BATCH:
+        return jsonify({"success": False, "error": f"At most {MAX_BATCH} items per batch"}), 400
+
+    queued = []
+    errors = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": i, "error": "Invalid item"})
+            continue
+        try:
+            path, error, _ = queue_fn(item)
+        except Exception as e:
+            path, error = None, str(e)
+        if error:
+            errors.append({"index": i, "filename": item.get("filename"), "error": error})
+        else:
+            queued.append(path)
+
+    # Acknowledge only what is on disk: the journal is in memory.
+    if queued:
+        for path, error in journal.flush(queued).items():
+            errors.append({"filename": Path(path).with_suffix(".wav").name, "error": error})
+    return jsonify({"success": not errors, "queued": len(queued), "errors": errors})
 
-    src_dir = Path(f"/home/ned/scanner_archive/clean/{feed}")
-    src_wav = src_dir / filename
-    src_json = src_wav.with_suffix(".json")
 
-    if not src_wav.exists() or not src_json.exists():
-        return jsonify({"success": False, "error": "Source file missing"}), 404
+@scanner_bp.route("/scanner/submit_edit", methods=["POST"])
+def submit_edit():
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "error": "Invalid JSON"}), 400
 
     try:
-        REVIEW_DIR.mkdir(parents=True, exist_ok=True)
-        dst_wav = REVIEW_DIR / src_wav.name
-        shutil.copy2(src_wav, dst_wav)
-        with open(src_json) as f:
-            meta = json.load(f)
-        meta["edited_transcript"] = new_transcript
-        dst_json = REVIEW_DIR / src_json.name
-        with open(dst_json, "w") as f:
-            json.dump(meta, f, indent=2)
+        path, error, status = _queue_edit(data)
+        if error:
+            return jsonify({"success": False, "error": error}), status
+        errors = journal.flush([path])
+        if errors:
+            return jsonify({"success": False, "error": errors[str(path)]}), 500
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@scanner_bp.route("/scanner/submit_edits", methods=["POST"])
+def submit_edits():
+    """Batch form of submit_edit: ``{"edits": [{filename, feed, transcript}, ...]}``.
+
+    Edits are merged per sidecar by the write-behind journal; the reply is
+    sent once they are on disk.
+    """
+    data = request.get_json(silent=True) or {}
+    return _submit_batch(data.get("edits"), _queue_edit)
+
+
+@scanner_bp.route("/scanner/review_queue")
+def review_queue():
+    """List pending transcript reviews, newest first, from the review index."""
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 50, type=int), 1), 500)
+    reviews, total = call_index.list_reviews(limit=per_page, offset=(page - 1) * per_page)
+    for r in reviews:
+        r["path"] = f"/scanner/audio/{r['filename']}"
+    return jsonify({"reviews": reviews, "total": total, "page": page})
+
+
 @scanner_bp.route('/scanner/_heartbeat', methods=['POST'])
 def scanner_heartbeat():
     """Receive periodic heartbeats from clients to mark them active."""
@@ -359,26 +703,34 @@ def pd_heatmap():
     now = datetime.datetime.now()
     start = now - datetime.timedelta(days=6)
     heatmap = defaultdict(lambda: [0] * 24)
+    airtime = defaultdict(lambda: [0.0] * 24)
 
-    for file in PD_DIR.glob("*.json"):
+    call_index.sync_calls(PD_DIR, "pd")
+    rows = call_index.query_calls(
+        feed="pd", since_meta_ts=start.date().isoformat(),
+        columns=("meta_ts", "duration")
+    )
+    for row in rows:
         try:
-            with open(file) as f:
-                meta = json.load(f)
-            ts = meta.get("timestamp")
-            if not ts:
-                continue
-            dt = datetime.datetime.fromisoformat(ts)
-            if dt < start:
-                continue
-            date_key = dt.strftime("%Y-%m-%d")
-            heatmap[date_key][dt.hour] += 1
+            dt = datetime.datetime.fromisoformat(row["meta_ts"])
         except Exception:
             continue
+        if dt < start:
+            continue
+        date_key = dt.strftime("%Y-%m-%d")
+        heatmap[date_key][dt.hour] += 1
+        airtime[date_key][dt.hour] += row["duration"] or 0.0
 
     sorted_days = sorted(heatmap.keys())
     matrix = [heatmap[day] for day in sorted_days]
+    airtime_matrix = [[round(v, 1) for v in airtime[day]] for day in sorted_days]
 
-    return jsonify({"days": sorted_days, "data": matrix})
+    return jsonify({
+        "days": sorted_days,
+        "data": matrix,
+        "airtime": airtime_matrix,
+        "total_airtime": round(sum(map(sum, airtime_matrix)), 1)
+    })
 
 @scanner_bp.route("/scanner/submit_segment_label", methods=["POST"])
 def submit_segment_label():
@@ -386,33 +738,20 @@ def submit_segment_label():
     if not data:
         return jsonify({"success": False, "error": "Invalid JSON"}), 400
 
-    filename = data.get("filename")
-    speaker = data.get("speaker")
-    label = data.get("label", "").strip()
-
-    if not filename or not speaker:
-        return jsonify({"success": False, "error": "Missing required fields"}), 400
-
-    json_path = SEGMENT_DIR / filename
-    if json_path.suffix != ".wav":
-        return jsonify({"success": False, "error": "Invalid file type"}), 400
-
-    json_file = json_path.with_suffix(".json")
-    if not json_file.exists():
-        return jsonify({"success": False, "error": "Metadata JSON not found"}), 404
-
     try:
-        with open(json_file) as f:
-            meta = json.load(f)
-
-        meta["speaker_role"] = speaker  # e.g., "dispatcher" or "officer"
-        if label:
-            meta["speaker_label"] = label  # e.g., "303", "Control", etc.
-
-        with open(json_file, "w") as f:
-            json.dump(meta, f, indent=2)
-
+        path, error, status = _queue_segment_label(data)
+        if error:
+            return jsonify({"success": False, "error": error}), status
+        errors = journal.flush([path])
+        if errors:
+            return jsonify({"success": False, "error": errors[str(path)]}), 500
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+
+@scanner_bp.route("/scanner/submit_segment_labels", methods=["POST"])
+def submit_segment_labels():
+    """Batch form of submit_segment_label: ``{"labels": [{filename, speaker, label}, ...]}``."""
+    data = request.get_json(silent=True) or {}
+    return _submit_batch(data.get("labels"), _queue_segment_label)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Trim squelch and silence from archived call WAVs.
+
+Leading and trailing silence is removed, and internal silent stretches longer
+than --max-gap are shortened to --keep-gap. Silence is detected from the RMS
+of fixed windows, computed a block of windows at a time over the
+memory-mapped samples.
+The sidecar JSON keeps the original timestamp and records the kept ranges,
+so positions in the trimmed file map back to the original recording. Calls
+without a sidecar are left alone.
+
+Usage:
+    python3 scripts/compact_silence.py                 # clean/pd and clean/fd
+    python3 scripts/compact_silence.py --dry-run -j 8
+    python3 scripts/compact_silence.py /path/to/dir --threshold-db -45
+
+Files already carrying a ``silence_trim`` record in their sidecar are
+skipped, so the tool can be re-run safely. The record is written (marked
+``pending``) before the WAV is replaced, so a run interrupted in between
+is finished by the next one instead of trimming the file twice.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import config  # noqa: E402
+from archive_utils import atomic_write_json  # noqa: E402
+from wav_utils import read_wav_info  # noqa: E402
+
+_DTYPES = {1: np.uint8, 2: np.dtype('<i2'), 4: np.dtype('<i4')}
+BLOCK_WINDOWS = 4096  # windows converted to float32 at a time
+
+
+def window_rms_db(samples, channels, width, window):
+    """RMS level in dBFS of each ``window``-frame block (last partial block dropped)."""
+    frames = samples.shape[0] // channels
+    blocks = frames // window
+    if blocks == 0:
+        return np.zeros(0)
+    full_scale = 128.0 if width == 1 else float(2 ** (8 * width - 1))
+    size = window * channels
+    rms = np.empty(blocks)
+    for lo in range(0, blocks, BLOCK_WINDOWS):
+        hi = min(lo + BLOCK_WINDOWS, blocks)
+        x = samples[lo * size:hi * size].astype(np.float32)
+        if width == 1:
+            x -= 128.0
+        x = x.reshape(hi - lo, size) / full_scale
+        rms[lo:hi] = np.sqrt(np.mean(x * x, axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def plan_cuts(loud, window, frames, rate, max_gap, keep_gap, pad):
+    """Return frame ranges to keep, given a boolean loudness flag per window."""
+    if not loud.any():
+        return []
+    pad_w = int(round(pad * rate / window))
+    max_w = int(round(max_gap * rate / window))
+    keep_w = int(round(keep_gap * rate / window))
+
+    idx = np.flatnonzero(loud)
+    first, last = idx[0], idx[-1]
+    # Gaps between consecutive loud windows longer than max_gap are cut.
+    gaps = np.diff(idx) - 1
+    long_gaps = np.flatnonzero(gaps > max_w)
+
+    ranges = []
+    start = max(first - pad_w, 0)
+    for g in long_gaps:
+        end = idx[g] + 1 + keep_w // 2
+        ranges.append((start, end))
+        start = idx[g + 1] - (keep_w - keep_w // 2)
+    ranges.append((start, min(last + 1 + pad_w, len(loud))))
+    return [(s * window, min(e * window, frames)) for s, e in ranges]
+
+
+def compact_file(wav_path, threshold_db, window_ms, max_gap, keep_gap, pad, dry_run):
+    json_path = wav_path[:-4] + '.json'
+    if not os.path.exists(json_path):
+        return wav_path, 0, 0, 'no sidecar'
+    with open(json_path) as f:
+        meta = json.load(f)
+    trim = meta.get('silence_trim')
+    if trim and trim.get('pending'):
+        # Interrupted between the sidecar and the WAV replacement.
+        size = os.path.getsize(wav_path)
+        if size == trim['trimmed_bytes']:
+            if not dry_run:
+                del trim['pending']
+                atomic_write_json(json_path, meta)
+            return wav_path, 0, 0, 'finished earlier trim'
+        if size != trim['original_bytes']:
+            return wav_path, 0, 0, 'pending trim does not match the WAV, left as is'
+        del meta['silence_trim']
+    elif trim:
+        return wav_path, 0, 0, 'already trimmed'
+
+    info = read_wav_info(wav_path)
+    width, channels, rate = info['sample_width'], max(info['channels'], 1), info['sample_rate']
+    if info['subformat'] != 1 or width not in _DTYPES:
+        return wav_path, 0, 0, 'unsupported format'
+    frames = info['data_size'] // (width * channels)
+    if frames == 0:
+        return wav_path, 0, 0, 'empty'
+
+    samples = np.memmap(wav_path, dtype=_DTYPES[width], mode='r',
+                        offset=info['data_offset'], shape=(frames * channels,))
+    window = max(int(rate * window_ms / 1000), 1)
+    loud = window_rms_db(samples, channels, width, window) > threshold_db
+    keep = plan_cuts(loud, window, frames, rate, max_gap, keep_gap, pad)
+    kept_frames = sum(e - s for s, e in keep)
+    if not keep or kept_frames >= frames:
+        return wav_path, 0, 0, 'nothing to trim' if keep else 'all silence, left as is'
+
+    old_size = os.path.getsize(wav_path)
+    frame_bytes = width * channels
+    new_size = old_size - (frames - kept_frames) * frame_bytes
+    if dry_run:
+        return wav_path, old_size, new_size, 'dry run'
+
+    directory = os.path.dirname(wav_path)
+    fd, tmp = tempfile.mkstemp(prefix='.trim.', suffix='.wav', dir=directory)
+    os.close(fd)
+    try:
+        out = wave.open(tmp, 'wb')
+        out.setnchannels(channels)
+        out.setsampwidth(width)
+        out.setframerate(rate)
+        for s, e in keep:
+            out.writeframes(samples[s * channels:e * channels].tobytes())
+        out.close()
+        os.chmod(tmp, os.stat(wav_path).st_mode & 0o777)
+        new_size = os.path.getsize(tmp)
+
+        # 'timestamp' is left untouched: it is still the start of the
+        # original recording, and kept_ranges maps trimmed audio back to it.
+        meta['silence_trim'] = {
+            'original_duration': frames / rate,
+            'trimmed_duration': kept_frames / rate,
+            'kept_ranges': [[round(s / rate, 3), round(e / rate, 3)] for s, e in keep],
+            'original_bytes': old_size,
+            'trimmed_bytes': new_size,
+            'trimmed_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'pending': True,
+        }
+        del samples
+        atomic_write_json(json_path, meta)
+        os.replace(tmp, wav_path)
+        del meta['silence_trim']['pending']
+        atomic_write_json(json_path, meta)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return wav_path, old_size, new_size, 'trimmed'
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('dirs', nargs='*', help='directories to compact (default: clean/pd and clean/fd)')
+    p.add_argument('--threshold-db', type=float, default=-40.0, help='windows quieter than this are silence (dBFS)')
+    p.add_argument('--window-ms', type=float, default=20.0)
+    p.add_argument('--max-gap', type=float, default=1.5, help='internal silence longer than this (s) is shortened')
+    p.add_argument('--keep-gap', type=float, default=0.5, help='silence left in place of a shortened gap (s)')
+    p.add_argument('--pad', type=float, default=0.25, help='silence kept before the first and after the last sound (s)')
+    p.add_argument('--min-age', type=float, default=1.0, help='skip files modified within this many hours')
+    p.add_argument('--jobs', '-j', type=int, default=os.cpu_count())
+    p.add_argument('--dry-run', action='store_true')
+    args = p.parse_args()
+    if args.keep_gap >= args.max_gap:
+        p.error('--keep-gap must be smaller than --max-gap')
+
+    dirs = args.dirs or [os.path.join(config.ARCHIVE_DIR, feed) for feed in config.FEEDS]
+    cutoff = time.time() - args.min_age * 3600
+    files = []
+    for d in dirs:
+        try:
+            with os.scandir(d) as it:
+                files.extend(e.path for e in it if e.name.endswith('.wav') and e.stat().st_mtime < cutoff)
+        except FileNotFoundError:
+            print(f'skip missing directory {d}')
+    files.sort()
+
+    started = time.time()
+    before = after = trimmed = failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(compact_file, f, args.threshold_db, args.window_ms, args.max_gap,
+                               args.keep_gap, args.pad, args.dry_run) for f in files]
+        for i, fut in enumerate(as_completed(futures), 1):
+            try:
+                path, old, new, status = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f'[!] {e}')
+                continue
+            if old:
+                trimmed += 1
+                before += old
+                after += new
+            if i % 500 == 0:
+                print(f'{i}/{len(files)} files, {(before - after) / 1e6:.1f} MB saved so far')
+
+    elapsed = time.time() - started
+    verb = 'would save' if args.dry_run else 'saved'
+    print(f'{len(files)} files in {elapsed:.1f}s: {trimmed} trimmed, {failed} failed')
+    print(f'{before / 1e6:.1f} MB -> {after / 1e6:.1f} MB, {verb} {(before - after) / 1e6:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
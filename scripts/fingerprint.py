@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Fingerprint the archive and find duplicate transmissions.
+
+Every indexed call (loose or packed, hot or cold) and every segment in
+segmentation/processed gets a spectral fingerprint (see fingerprint.py);
+missing ones are computed in a process pool, stored ones are reused. All
+items are then matched in recording order through a sliding-window hash
+index, so each is only compared with the few recorded near it, and the
+duplicates found are stored in the call index for the listings.
+
+With --link, loose duplicate WAVs of the same format and length as their
+original (at FINGERPRINT_LINK_MAX_BER or better) are replaced by a
+hardlink/reflink to it, keeping their own sidecars. Packed calls are
+never rewritten.
+
+Usage:
+    python3 scripts/fingerprint.py                   # backfill and match everything
+    python3 scripts/fingerprint.py --feed pd --feed fd --no-segments
+    python3 scripts/fingerprint.py --link --dry-run  # show what would be linked
+    python3 scripts/fingerprint.py --link
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import archive_pack  # noqa: E402
+import call_index  # noqa: E402
+import config  # noqa: E402
+import fingerprint  # noqa: E402
+import shared_cache  # noqa: E402
+import storage  # noqa: E402
+from archive_utils import link_file  # noqa: E402
+from wav_utils import read_wav_info  # noqa: E402
+
+PROGRESS_INTERVAL = 2.0
+
+
+def items(feeds, segments):
+    """``(when, feed, name, path, base, length)`` for every item, in recording order."""
+    found = []
+    for feed in feeds:
+        storage.sync_feed(feed)
+        for row in call_index.query_calls(feed=feed, columns=('feed', 'file', 'location')):
+            base = length = None
+            path = os.path.join(row['location'], row['file'])
+            if row['location'].endswith('.pack'):
+                try:
+                    base, length = archive_pack.open_pack(row['location']).member_range(row['file'])
+                except (FileNotFoundError, KeyError):
+                    continue
+                path = row['location']
+            when = fingerprint.item_time(feed, row['file'])
+            found.append((when, feed, row['file'], path, base, length))
+    if segments:
+        try:
+            with os.scandir(config.SEGMENT_DIR) as it:
+                names = sorted(e.name for e in it if e.name.endswith('.wav'))
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            path = os.path.join(config.SEGMENT_DIR, name)
+            found.append((_segment_time(path), fingerprint.SEGMENT_FEED, name, path, None, None))
+    return sorted((i for i in found if i[0] is not None), key=lambda i: i[:3])
+
+
+def _segment_time(path):
+    try:
+        with open(path[:-4] + '.json') as f:
+            ts = json.load(f).get('timestamp')
+    except (OSError, ValueError, AttributeError):
+        ts = None
+    when = fingerprint.item_time(fingerprint.SEGMENT_FEED, os.path.basename(path), ts)
+    return when if when is not None else os.stat(path).st_mtime
+
+
+def compute(task):
+    """Worker: ``(item, fp bytes, hop, error)``; stored fingerprints are read back, not recomputed."""
+    item, stored = task
+    when, feed, name, path, base, length = item
+    if stored:
+        fp, hop = call_index.get_fingerprint(feed, name)
+        return item, fp, hop, None
+    try:
+        hashes, usable, hop = fingerprint.compute(path, base or 0, length)
+    except (OSError, ValueError) as e:
+        return item, None, None, str(e)
+    return item, fingerprint.to_bytes(hashes, usable), hop, None
+
+
+def link_duplicates(dry_run):
+    """Hardlink loose duplicate WAVs to their originals. Returns ``(linked, bytes saved)``."""
+    linked = saved = 0
+    for dup in call_index.list_duplicates(linked=False):
+        if dup['ber'] > config.FINGERPRINT_LINK_MAX_BER:
+            continue
+        paths = []
+        for feed, name in ((dup['feed'], dup['file']), (dup['of_feed'], dup['of_file'])):
+            if feed == fingerprint.SEGMENT_FEED:
+                location = storage.Location('file', os.path.join(config.SEGMENT_DIR, name), name, None, None)
+            else:
+                location = storage.resolve(name, feed)
+            paths.append(location.path if location is not None and location.kind == 'file' else None)
+        dst, src = paths
+        if not dst or not src or not os.path.exists(dst) or not os.path.exists(src):
+            continue
+        try:
+            a, b = read_wav_info(dst), read_wav_info(src)
+        except (OSError, ValueError):
+            continue
+        same = all(a[k] == b[k] for k in ('sample_rate', 'channels', 'sample_width')) \
+            and abs(a['duration'] - b['duration']) <= 2 * fingerprint.frame_hop(a['sample_rate'])
+        if not same or os.path.samefile(src, dst):
+            continue
+        size = os.path.getsize(dst)
+        print(f"{'would link' if dry_run else 'linking'} {dup['feed']}/{dup['file']} -> "
+              f"{dup['of_feed']}/{dup['of_file']} (BER {dup['ber']}, {size / 1e3:.0f} kB)")
+        if dry_run:
+            linked += 1
+            saved += size
+            continue
+        # Link beside the duplicate and rename over it, so a failed link
+        # never leaves the call without audio.
+        tmp = os.path.join(os.path.dirname(dst), f'.{os.path.basename(dst)}.link')
+        if link_file(src, tmp) is None:
+            print(f"  cannot link across filesystems, kept {dst}")
+            continue
+        os.replace(tmp, dst)
+        call_index.mark_linked(dup['feed'], dup['file'])
+        linked += 1
+        saved += size
+    return linked, saved
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--feed', choices=config.FEEDS, action='append', help='feed(s) to fingerprint (default: all)')
+    p.add_argument('--no-segments', action='store_true', help='leave segmentation/processed out')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    p.add_argument('--link', action='store_true', help='hardlink duplicate WAVs to their originals')
+    p.add_argument('--dry-run', action='store_true', help='with --link: only show what would be linked')
+    args = p.parse_args()
+
+    started = time.time()
+    todo = items(args.feed or config.FEEDS, not args.no_segments)
+    known = call_index.fingerprinted()
+    missing = sum(1 for item in todo if (item[1], item[2]) not in known)
+    print(f'fingerprint: {len(todo)} items, {missing} to compute with {args.workers} workers')
+
+    matcher = fingerprint.Matcher()
+    duplicates = computed = failed = done = 0
+    last = time.time()
+    tasks = [(item, (item[1], item[2]) in known) for item in todo]
+    # imap keeps recording order, which the matcher relies on.
+    with Pool(args.workers) as pool:
+        for item, fp, hop, error in pool.imap(compute, tasks, chunksize=16):
+            done += 1
+            when, feed, name = item[:3]
+            if fp is None:
+                failed += 1
+                print(f'  {feed}/{name}: {error}')
+                continue
+            hashes, usable = fingerprint.from_bytes(fp)
+            is_new = (feed, name) not in known
+            computed += is_new
+            if matcher.add(feed, name, when, hashes, usable, hop, save=is_new):
+                duplicates += 1
+            now = time.time()
+            if now - last >= PROGRESS_INTERVAL:
+                rate = done / (now - started)
+                print(f'  {done}/{len(todo)} items, {rate:.0f} items/s, {duplicates} duplicates', file=sys.stderr)
+                last = now
+    elapsed = time.time() - started
+    print(f'fingerprint: {done} items in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.0f} items/s), '
+          f'{computed} computed, {failed} failed, {duplicates} duplicates')
+
+    for feed in args.feed or config.FEEDS:
+        shared_cache.cache.invalidate(feed)
+    if args.link:
+        linked, saved = link_duplicates(args.dry_run)
+        print(f"{'would link' if args.dry_run else 'linked'} {linked} duplicates, {saved / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Local stand-in for a browser push service, for load tests.
+
+It hands out synthetic subscriptions whose keys it keeps, so every push it
+receives is checked like a real push service would check it: the VAPID JWT
+(ES256 signature, aud, exp, sub) and TTL header are validated and the
+aes128gcm payload is decrypted. Latency and error responses can be
+injected to see how the sender copes with slow or failing services.
+
+Usage:
+    python3 scripts/mock_push_server.py                       # :8099, no faults
+    python3 scripts/mock_push_server.py --latency-ms 80 --jitter-ms 40 \\
+        --rate-410 0.01 --rate-429 0.02 --rate-5xx 0.01
+
+Endpoints:
+    POST /subscriptions?count=N   create N subscriptions, returns their JSON
+    POST /push/<id>               the push endpoint (201 on success)
+    GET  /stats                   counters and latency percentiles
+    POST /reset                   clear the counters
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import http_ece
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+
+def b64url_decode(s):
+    return base64.urlsafe_b64decode(s + '=' * (-len(s) % 4))
+
+
+def b64url(b):
+    return base64.urlsafe_b64encode(b).rstrip(b'=').decode('ascii')
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    i = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[i]
+
+
+class State:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subs = {}  # id -> (private key, auth secret)
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.status = {}
+            self.errors = {}
+            self.latencies = []  # seconds from "t" in the payload to arrival
+            self.first = self.last = None
+
+    def record(self, status, error=None, sent_at=None):
+        now = time.time()
+        with self.lock:
+            self.status[status] = self.status.get(status, 0) + 1
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            if status == 201:
+                self.first = self.first or now
+                self.last = now
+                if sent_at is not None:
+                    self.latencies.append(now - sent_at)
+
+    def stats(self):
+        with self.lock:
+            lat = sorted(self.latencies)
+            accepted = self.status.get(201, 0)
+            span = (self.last - self.first) if accepted > 1 else None
+            return {
+                'status': {str(k): v for k, v in sorted(self.status.items())},
+                'errors': self.errors,
+                'accepted': accepted,
+                'accepted_per_sec': round((accepted - 1) / span, 1) if span else None,
+                'latency_ms': {q: (round(percentile(lat, p) * 1000, 1) if lat else None)
+                               for q, p in (('p50', .5), ('p90', .9), ('p99', .99), ('max', 1.0))},
+                'subscriptions': len(self.subs),
+            }
+
+
+def verify_vapid(headers, audience):
+    """Return None if the request carries a valid VAPID JWT for ``audience``, else an error."""
+    auth = headers.get('Authorization', '')
+    token = key = None
+    if auth.lower().startswith('vapid '):
+        for part in auth[6:].split(','):
+            name, _, value = part.strip().partition('=')
+            if name == 't':
+                token = value
+            elif name == 'k':
+                key = value
+    elif auth.lower().startswith('webpush '):
+        token = auth[8:].strip()
+        for part in headers.get('Crypto-Key', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == 'p256ecdsa':
+                key = value
+    if not token or not key:
+        return 'missing vapid authorization'
+    try:
+        header_b64, claims_b64, sig_b64 = token.split('.')
+        header = json.loads(b64url_decode(header_b64))
+        claims = json.loads(b64url_decode(claims_b64))
+        sig = b64url_decode(sig_b64)
+        if header.get('alg') != 'ES256' or len(sig) != 64:
+            return 'bad jwt header'
+        public = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), b64url_decode(key))
+        der = encode_dss_signature(int.from_bytes(sig[:32], 'big'), int.from_bytes(sig[32:], 'big'))
+        public.verify(der, f'{header_b64}.{claims_b64}'.encode('ascii'), ec.ECDSA(hashes.SHA256()))
+    except InvalidSignature:
+        return 'bad jwt signature'
+    except Exception:
+        return 'malformed jwt'
+    if claims.get('aud') != audience:
+        return 'wrong aud'
+    exp = claims.get('exp', 0)
+    if not time.time() < exp <= time.time() + 24 * 3600:
+        return 'bad exp'
+    if not str(claims.get('sub', '')).startswith(('mailto:', 'https:')):
+        return 'bad sub'
+    return None
+
+
+def make_handler(state, args):
+    audience = f'http://{args.host}:{args.port}'
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *a):
+            if args.verbose:
+                super().log_message(fmt, *a)
+
+        def reply(self, status, body=None, headers=None):
+            data = json.dumps(body).encode() if body is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(data)))
+            if body is not None:
+                self.send_header('Content-Type', 'application/json')
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if urlparse(self.path).path == '/stats':
+                return self.reply(200, state.stats())
+            self.reply(404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if url.path == '/reset':
+                state.reset()
+                return self.reply(204)
+            if url.path == '/subscriptions':
+                count = int(parse_qs(url.query).get('count', ['1'])[0])
+                return self.reply(200, self.create_subscriptions(count))
+            if url.path.startswith('/push/'):
+                return self.push(url.path[len('/push/'):], body)
+            self.reply(404)
+
+        def create_subscriptions(self, count):
+            subs = []
+            for _ in range(count):
+                sub_id = uuid.uuid4().hex
+                priv = ec.generate_private_key(ec.SECP256R1())
+                auth = os.urandom(16)
+                with state.lock:
+                    state.subs[sub_id] = (priv, auth)
+                pub = priv.public_key().public_bytes(serialization.Encoding.X962,
+                                                     serialization.PublicFormat.UncompressedPoint)
+                subs.append({'endpoint': f'{audience}/push/{sub_id}',
+                             'keys': {'p256dh': b64url(pub), 'auth': b64url(auth)}})
+            return subs
+
+        def push(self, sub_id, body):
+            delay = max(args.latency_ms + random.uniform(-args.jitter_ms, args.jitter_ms), 0) / 1000
+            if delay:
+                time.sleep(delay)
+            sub = state.subs.get(sub_id)
+            if sub is None:
+                state.record(404, 'unknown subscription')
+                return self.reply(404)
+            roll = random.random()
+            if roll < args.rate_410:
+                state.record(410)
+                return self.reply(410)
+            roll -= args.rate_410
+            if roll < args.rate_429:
+                state.record(429)
+                return self.reply(429, headers={'Retry-After': '1'})
+            roll -= args.rate_429
+            if roll < args.rate_5xx:
+                status = random.choice((500, 502, 503))
+                state.record(status)
+                return self.reply(status)
+
+            error = verify_vapid(self.headers, audience)
+            if error:
+                state.record(403, error)
+                return self.reply(403, {'error': error})
+            if 'TTL' not in self.headers:
+                state.record(400, 'missing TTL')
+                return self.reply(400, {'error': 'missing TTL'})
+            if self.headers.get('Content-Encoding') != 'aes128gcm':
+                state.record(415, 'unsupported content encoding')
+                return self.reply(415)
+            try:
+                plain = http_ece.decrypt(body, private_key=sub[0], auth_secret=sub[1], version='aes128gcm')
+            except Exception:
+                state.record(400, 'decryption failed')
+                return self.reply(400, {'error': 'decryption failed'})
+            sent_at = None
+            try:
+                # Load-test messages carry their send time for latency stats.
+                message = json.loads(plain).get('message')
+                sent_at = json.loads(message).get('t') if isinstance(message, str) and message.startswith('{') else None
+            except (ValueError, AttributeError):
+                pass
+            state.record(201, sent_at=sent_at)
+            self.reply(201, headers={'Location': f'{audience}/msg/{uuid.uuid4().hex}'})
+
+    return Handler
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8099)
+    p.add_argument('--latency-ms', type=float, default=0.0, help='added to every push request')
+    p.add_argument('--jitter-ms', type=float, default=0.0, help='+/- uniform jitter on the latency')
+    p.add_argument('--rate-410', type=float, default=0.0, help='fraction answered 410 Gone')
+    p.add_argument('--rate-429', type=float, default=0.0, help='fraction answered 429 Too Many Requests')
+    p.add_argument('--rate-5xx', type=float, default=0.0, help='fraction answered 500/502/503')
+    p.add_argument('--verbose', action='store_true', help='log every request')
+    args = p.parse_args()
+
+    state = State()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state, args))
+    server.daemon_threads = True
+    print(f'mock push service on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(state.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
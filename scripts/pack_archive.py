@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Seal completed days of the clean archive into day pack files.
+
+Every day older than --keep-days in clean/<feed> is written to
+<PACK_DIR>/<feed>/<day>.pack (see archive_pack.py), verified, and only then
+removed from the live directory, which is left holding the recent days.
+
+Usage:
+    python3 scripts/pack_archive.py                  # all feeds, keep today
+    python3 scripts/pack_archive.py --feed pd --dry-run
+    python3 scripts/pack_archive.py --keep-files     # pack but leave originals
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import archive_pack  # noqa: E402
+import config  # noqa: E402
+import storage  # noqa: E402
+from call_index import call_day  # noqa: E402
+
+
+def days_to_seal(directory, keep_days):
+    cutoff = (datetime.date.today() - datetime.timedelta(days=keep_days - 1)).isoformat()
+    days = set()
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith('.wav'):
+                day = call_day(entry.name)
+                if day != 'unknown' and day < cutoff:
+                    days.add(day)
+    return sorted(days)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--feed', choices=config.FEEDS, action='append', help='feed(s) to pack (default: all)')
+    p.add_argument('--keep-days', type=int, default=1, help='most recent days left as loose files (1 = today)')
+    p.add_argument('--keep-files', action='store_true', help='do not delete packed files')
+    p.add_argument('--dry-run', action='store_true')
+    args = p.parse_args()
+
+    for feed in args.feed or config.FEEDS:
+        directory = storage.live_dir(feed)
+        if not os.path.isdir(directory):
+            print(f'{feed}: no directory {directory}')
+            continue
+        days = days_to_seal(directory, max(args.keep_days, 1))
+        if not days:
+            print(f'{feed}: nothing to seal')
+            continue
+        for day in days:
+            if args.dry_run:
+                print(f'{feed} {day}: would pack {len(archive_pack.day_files(directory, day))} files')
+                continue
+            started = time.time()
+            path, count, size = archive_pack.seal_day(directory, feed, day, remove=not args.keep_files)
+            print(f'{feed} {day}: {count} files -> {path} ({size / 1e6:.1f} MB, {time.time() - started:.1f}s)')
+        if not args.dry_run:
+            storage.sync_feed(feed)
+
+
+if __name__ == '__main__':
+    main()
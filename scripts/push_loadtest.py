@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Measure push fan-out throughput against the local mock push service.
+
+Seeds the push subscription DB with synthetic subscriptions handed out by
+``scripts/mock_push_server.py``, sends pushes to all of them and reports
+messages/sec and delivery latency (from the moment a message is sent to
+its arrival at the mock service, p50/p90/p99/max).
+
+Modes:
+    queue     LPUSH jobs onto the Redis ``push_queue`` and wait for the
+              running ``worker.py`` to drain them (the production path)
+    send_now  POST /scanner/push/send_now on the running app
+    direct    call push_utils.send_push from this process, with --threads
+              senders; shows the ceiling of the sending code itself
+
+Run it against a scratch DB (PUSH_DB_PATH or --db) so real subscribers are
+never pushed; the app and worker must be started with the same DB.
+
+Usage:
+    python3 scripts/mock_push_server.py --latency-ms 50 &
+    PUSH_DB_PATH=/tmp/loadtest.sqlite3 python3 scripts/push_loadtest.py --subs 2000 --mode direct --threads 16
+    PUSH_DB_PATH=/tmp/loadtest.sqlite3 python3 scripts/push_loadtest.py --mode queue --jobs 3
+    PUSH_DB_PATH=/tmp/loadtest.sqlite3 python3 scripts/push_loadtest.py --clean
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import config  # noqa: E402
+
+BASE_URL = 'http://127.0.0.1:5005'
+MOCK_URL = 'http://127.0.0.1:8099'
+SEED_BATCH = 500
+
+
+def seed(db_path, mock_url, count):
+    """Create ``count`` subscriptions on the mock service and store them."""
+    import push_db
+    push_db.ensure_db()
+    conn = sqlite3.connect(db_path)
+    made = 0
+    while made < count:
+        n = min(SEED_BATCH, count - made)
+        r = requests.post(f'{mock_url}/subscriptions', params={'count': n}, timeout=120)
+        r.raise_for_status()
+        conn.executemany(
+            'INSERT OR REPLACE INTO subscriptions (endpoint, subscription_json, created_at) VALUES (?, ?, strftime("%s","now"))',
+            [(s['endpoint'], json.dumps(s)) for s in r.json()])
+        conn.commit()
+        made += n
+    conn.close()
+    print(f'seeded {made} subscriptions')
+
+
+def clean(db_path, mock_url):
+    conn = sqlite3.connect(db_path)
+    cur = conn.execute('DELETE FROM subscriptions WHERE endpoint LIKE ?', (f'{mock_url}/push/%',))
+    conn.commit()
+    conn.close()
+    print(f'removed {cur.rowcount} synthetic subscriptions')
+
+
+def count_subs(db_path, mock_url):
+    conn = sqlite3.connect(db_path)
+    n = conn.execute('SELECT COUNT(*) FROM subscriptions WHERE endpoint LIKE ?', (f'{mock_url}/push/%',)).fetchone()[0]
+    total = conn.execute('SELECT COUNT(*) FROM subscriptions').fetchone()[0]
+    conn.close()
+    return n, total
+
+
+def message(seq):
+    # The mock service reads "t" back out of the decrypted payload.
+    return json.dumps({'t': time.time(), 'seq': seq})
+
+
+def stats(mock_url):
+    return requests.get(f'{mock_url}/stats', timeout=10).json()
+
+
+def wait_for(mock_url, expected, timeout):
+    """Poll the mock service until ``expected`` pushes arrived or it goes quiet."""
+    deadline = time.time() + timeout
+    seen, last_change = -1, time.time()
+    while time.time() < deadline:
+        s = stats(mock_url)
+        arrived = sum(s['status'].values())
+        if arrived >= expected:
+            return s
+        if arrived != seen:
+            seen, last_change = arrived, time.time()
+        elif time.time() - last_change > 30:
+            print(f'no progress for 30s at {arrived}/{expected}')
+            return s
+        time.sleep(0.5)
+    print('timed out waiting for pushes')
+    return stats(mock_url)
+
+
+def run_queue(args, subs):
+    import redis
+    r = redis.from_url(config.REDIS_URL)
+    for i in range(args.jobs):
+        r.lpush('push_queue', json.dumps({'message': message(i)}))
+    return wait_for(args.mock_url, subs * args.jobs, args.timeout)
+
+
+def run_send_now(args, subs):
+    for i in range(args.jobs):
+        start = time.time()
+        r = requests.post(f'{args.url}/scanner/push/send_now', json={'message': message(i)}, timeout=args.timeout)
+        print(f'send_now #{i}: HTTP {r.status_code} in {time.time() - start:.2f}s, sent={r.json().get("sent")}')
+    return stats(args.mock_url)
+
+
+def run_direct(args, subs):
+    import push_db
+    import push_utils
+    _, vapid_priv = push_utils.load_vapid_keys()
+    if not vapid_priv:
+        sys.exit('VAPID private key not configured (scripts/generate_vapid.py)')
+    targets = [s for s in push_db.list_subscriptions() if s.get('endpoint', '').startswith(f'{args.mock_url}/push/')]
+    claims = {'sub': config.VAPID_CLAIM_SUB}
+
+    def send(job):
+        i, sub = job
+        return push_utils.send_push(sub, {'message': message(i)}, vapid_priv, claims)[0]
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        for i in range(args.jobs):
+            list(pool.map(send, ((i, s) for s in targets)))
+    return stats(args.mock_url)
+
+
+def report(s, elapsed, expected):
+    delivered = s['accepted']
+    print(f'\npushes expected: {expected}  arrived: {sum(s["status"].values())}  accepted: {delivered}')
+    print('responses by status:', s['status'])
+    if s['errors']:
+        print('rejections:', s['errors'])
+    print(f'wall time: {elapsed:.2f}s  throughput: {delivered / elapsed:.1f} msg/s'
+          + (f'  (steady state {s["accepted_per_sec"]} msg/s)' if s['accepted_per_sec'] else ''))
+    lat = s['latency_ms']
+    print('latency ms: ' + '  '.join(f'{k}={v}' for k, v in lat.items()))
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--db', default=config.PUSH_DB_PATH, help='push subscription DB (default: PUSH_DB_PATH)')
+    p.add_argument('--mock-url', default=MOCK_URL)
+    p.add_argument('--url', default=BASE_URL, help='app base URL for send_now mode')
+    p.add_argument('--subs', type=int, default=0, help='seed this many synthetic subscriptions first')
+    p.add_argument('--mode', choices=('queue', 'send_now', 'direct'), help='how to send (omit to only seed/clean)')
+    p.add_argument('--jobs', type=int, default=1, help='messages to send to every subscription')
+    p.add_argument('--threads', type=int, default=8, help='senders in direct mode')
+    p.add_argument('--timeout', type=float, default=600, help='seconds to wait for delivery')
+    p.add_argument('--clean', action='store_true', help='remove synthetic subscriptions and exit')
+    args = p.parse_args()
+
+    # push_db reads its path from config at import time.
+    config.PUSH_DB_PATH = args.db
+    if args.clean:
+        clean(args.db, args.mock_url)
+        sys.exit(0)
+    if args.subs:
+        seed(args.db, args.mock_url, args.subs)
+    if not args.mode:
+        sys.exit(0)
+    subs, total = count_subs(args.db, args.mock_url)
+    if total != subs and args.mode != 'direct':
+        sys.exit(f'{args.db} has {total - subs} real subscriptions; use a scratch DB for {args.mode} mode')
+    if not subs:
+        sys.exit('no synthetic subscriptions; seed some with --subs')
+    requests.post(f'{args.mock_url}/reset', timeout=10)
+    print(f'{args.mode}: {args.jobs} message(s) x {subs} subscriptions')
+    start = time.time()
+    result = {'queue': run_queue, 'send_now': run_send_now, 'direct': run_direct}[args.mode](args, subs)
+    report(result, time.time() - start, subs * args.jobs)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Rebuild the call index from the archive and report inconsistencies.
+
+Walks clean/<feed> (hot and cold), the review directory and
+segmentation/processed, parses every sidecar and WAV header in a process
+pool, and bulk-loads the rows that differ from the index in a single
+transaction. Day packs are indexed from their own summary tables as
+usual. Use it after restores, migrations or manual edits in the archive;
+the request-time syncs only notice files whose mtimes moved.
+
+Reported problems:
+    orphan-wav      WAV without a JSON sidecar
+    orphan-json     JSON sidecar without a WAV
+    corrupt-json    sidecar that does not parse (or is not an object)
+    bad-wav         unreadable WAV header
+    day-mismatch    sidecar timestamp on a different day than the file name
+    stale-row       index row that differed from the files (rewritten)
+    missing-row     file that was not indexed at all (added)
+    gone-row        index row whose file no longer exists (deleted)
+    review-missing  review sidecar absent from the reviews table (added)
+    review-source   review whose source call exists nowhere
+
+Usage:
+    python3 scripts/reindex.py                      # everything, all cores
+    python3 scripts/reindex.py --check              # report only, change nothing
+    python3 scripts/reindex.py --only calls --feed pd --workers 4
+    python3 scripts/reindex.py --check --json > report.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import archive_pack  # noqa: E402
+import call_index  # noqa: E402
+import config  # noqa: E402
+import storage  # noqa: E402
+
+KINDS = ('calls', 'segments', 'reviews')
+PROGRESS_INTERVAL = 2.0
+
+
+def _load_sidecar(path):
+    """``(meta, problem)`` for a JSON sidecar; meta is None unless it parsed to an object."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None, 'orphan-wav'
+    except (OSError, ValueError) as e:
+        return None, f'corrupt-json: {e}'
+    if not isinstance(meta, dict):
+        return None, 'corrupt-json: not an object'
+    return meta, None
+
+
+def parse(task):
+    """Worker: build the index row(s) for one file. Runs in the pool."""
+    kind, feed, path = task
+    stem = path[:-4] if path.endswith('.wav') else path[:-5]
+    problems = []
+    if kind == 'reviews':
+        meta, problem = _load_sidecar(path)
+        if problem:
+            return kind, feed, path, None, [problem]
+        source = meta.get('source_wav') or ''
+        review_wav = stem + '.wav'
+        return kind, feed, path, {
+            'filename': os.path.basename(review_wav),
+            'source_wav': source,
+            'source_exists': bool(source) and os.path.exists(source),
+            'review_wav': review_wav if os.path.exists(review_wav) else None,
+            'edited_transcript': meta.get('edited_transcript', ''),
+            'submitted_at': os.stat(path).st_mtime,
+        }, problems
+
+    meta, problem = _load_sidecar(stem + '.json')
+    if problem:
+        problems.append(problem)
+    if kind == 'segments':
+        try:
+            json_mtime = os.stat(stem + '.json').st_mtime
+        except FileNotFoundError:
+            json_mtime = 0
+        return kind, feed, path, call_index.segment_row(path, meta or {}, json_mtime), problems
+
+    if meta is not None or problem == 'orphan-wav':
+        row = call_index.call_row(path, feed, meta)
+    else:
+        # Indexed the way sync_calls indexes a broken sidecar: as absent.
+        row = _row_without_json(path, feed)
+    values = dict(zip(call_index.CALL_COLUMNS, row))
+    if not values['sample_rate']:
+        problems.append('bad-wav')
+    ts = values['meta_ts']
+    if isinstance(ts, str) and len(ts) >= 10 and values['day'] != 'unknown' and ts[:10] != values['day']:
+        problems.append(f'day-mismatch: sidecar says {ts}')
+    return kind, feed, path, row, problems
+
+
+def _row_without_json(path, feed):
+    # call_row() would re-read (and complain about) the broken sidecar.
+    values = dict(zip(call_index.CALL_COLUMNS, call_index.call_row(path, feed, {})))
+    values.update(meta_ts=None, transcript=None, edited_transcript=None, enhanced_transcript=None,
+                  edited=0, has_json=0, metadata_json=None)
+    return tuple(values[c] for c in call_index.CALL_COLUMNS)
+
+
+def _feed_of(source_wav):
+    # Sources live in clean/<feed>/ or, once sealed, packs/<feed>/<day>.pack/.
+    parts = os.path.normpath(source_wav).split(os.sep)
+    for part in reversed(parts[:-1]):
+        if part in config.FEEDS:
+            return part
+    return None
+
+
+def plan(kinds, feeds):
+    """``(tasks, dir_mtimes, problems)``: one task per file to parse.
+
+    Directory mtimes are taken before listing, so a file added during the
+    run makes the next request-time sync look at the directory again.
+    """
+    dirs = []
+    if 'calls' in kinds:
+        for feed in feeds:
+            dirs += [('calls', feed, storage.live_dir(feed)), ('calls', feed, storage.cold_dir(feed))]
+    if 'segments' in kinds:
+        dirs.append(('segments', None, config.SEGMENT_DIR))
+    if 'reviews' in kinds:
+        dirs.append(('reviews', None, config.REVIEW_DIR))
+
+    tasks, dir_mtimes, problems = [], {}, []
+    for kind, feed, directory in dirs:
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                names = {e.name for e in it if e.is_file()}
+        except FileNotFoundError:
+            continue
+        if kind != 'reviews':
+            dir_mtimes[os.path.normpath(directory)] = mtime_ns
+        for name in sorted(names):
+            stem, ext = os.path.splitext(name)
+            path = os.path.join(directory, name)
+            if kind == 'reviews':
+                if ext == '.json':
+                    tasks.append((kind, feed, path))
+                elif ext == '.wav' and stem + '.json' not in names:
+                    problems.append(('orphan-wav', path, ''))
+            elif ext == '.wav':
+                tasks.append((kind, feed, path))
+            elif ext == '.json' and stem + '.wav' not in names:
+                problems.append(('orphan-json', path, ''))
+    return tasks, dir_mtimes, problems
+
+
+def run_pool(tasks, workers, chunksize, quiet):
+    started = last = time.time()
+    done = 0
+    with Pool(workers) as pool:
+        for result in pool.imap_unordered(parse, tasks, chunksize):
+            done += 1
+            yield result
+            now = time.time()
+            if not quiet and now - last >= PROGRESS_INTERVAL:
+                rate = done / (now - started)
+                eta = (len(tasks) - done) / rate if rate else 0
+                print(f'  {done}/{len(tasks)} files, {rate:.0f} files/s, ~{eta:.0f}s left', file=sys.stderr)
+                last = now
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--only', choices=KINDS, action='append', help='what to reindex (default: everything)')
+    p.add_argument('--feed', choices=config.FEEDS, action='append', help='feed(s) to reindex (default: all)')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    p.add_argument('--chunksize', type=int, default=64, help='files handed to a worker at a time')
+    p.add_argument('--check', action='store_true', help='report only; do not write the index')
+    p.add_argument('--list-limit', type=int, default=20, help='problems listed per kind (0 = all)')
+    p.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = p.parse_args()
+
+    kinds = args.only or KINDS
+    feeds = args.feed or config.FEEDS
+    started = time.time()
+    tasks, dir_mtimes, problems = plan(kinds, feeds)
+    log = sys.stderr if args.json else sys.stdout
+    print(f'reindex: {len(tasks)} files to parse with {args.workers} workers', file=log)
+
+    call_dirs = [d for d in dir_mtimes if os.path.normpath(config.SEGMENT_DIR) != d]
+    indexed_calls, indexed_segments = call_index.index_snapshot(call_dirs)
+    indexed_reviews = {r['filename']: r for r in call_index.list_reviews(limit=-1)[0]} \
+        if 'reviews' in kinds else {}
+
+    calls, segments, reviews = [], [], []
+    seen_calls, seen_segments = set(), set()
+    for kind, feed, path, row, file_problems in run_pool(tasks, args.workers, args.chunksize, args.json):
+        for problem in file_problems:
+            name, _, detail = problem.partition(': ')
+            problems.append((name, path, detail))
+        if row is None:
+            continue
+        if kind == 'calls':
+            key = (row[0], row[1])
+            seen_calls.add(key)
+            old = indexed_calls.get(key)
+            if old != row:
+                problems.append(('stale-row' if old else 'missing-row', path, ''))
+                calls.append(row)
+        elif kind == 'segments':
+            seen_segments.add(row[0])
+            old = indexed_segments.get(row[0])
+            if old != row:
+                problems.append(('stale-row' if old else 'missing-row', path, ''))
+                segments.append(row)
+        else:
+            if not row['source_exists'] and not call_index.get_call(row['filename'], _feed_of(row['source_wav'])):
+                problems.append(('review-source', path, row['source_wav']))
+            if row['filename'] not in indexed_reviews:
+                problems.append(('review-missing', path, ''))
+                reviews.append(row)
+    parsed_in = time.time() - started
+
+    gone_calls = [key for key, row in indexed_calls.items() if key not in seen_calls
+                  and row[2] in dir_mtimes]
+    gone_segments = [f for f in indexed_segments if f not in seen_segments] if 'segments' in kinds else []
+    for feed, file in gone_calls:
+        problems.append(('gone-row', f'{feed}/{file}', ''))
+    for file in gone_segments:
+        problems.append(('gone-row', os.path.join(config.SEGMENT_DIR, file), ''))
+
+    if not args.check:
+        call_index.bulk_load(calls, segments, gone_calls, gone_segments, dir_mtimes)
+        for r in reviews:
+            link_type = None
+            if r['review_wav'] and r['source_exists']:
+                link_type = 'hardlink' if os.path.samefile(r['review_wav'], r['source_wav']) else 'reflink'
+            call_index.add_review(r['filename'], _feed_of(r['source_wav']), r['source_wav'],
+                                  r['review_wav'] if link_type else None, link_type or 'reference',
+                                  r['edited_transcript'], r['submitted_at'])
+        if 'calls' in kinds:
+            for feed in feeds:
+                call_index.sync_packs(feed, archive_pack.pack_dir(feed), archive_pack.open_pack)
+                call_index.sync_packs(feed, storage.cold_pack_dir(feed), archive_pack.open_pack)
+
+    elapsed = time.time() - started
+    by_kind = defaultdict(list)
+    for name, path, detail in problems:
+        by_kind[name].append({'path': path, 'detail': detail} if detail else {'path': path})
+    summary = {
+        'files': len(tasks),
+        'workers': args.workers,
+        'parse_seconds': round(parsed_in, 2),
+        'total_seconds': round(elapsed, 2),
+        'files_per_second': round(len(tasks) / parsed_in, 1) if parsed_in else None,
+        'written': None if args.check else {
+            'calls': len(calls), 'segments': len(segments), 'reviews': len(reviews),
+            'deleted': len(gone_calls) + len(gone_segments)},
+        'problems': {name: len(items) for name, items in sorted(by_kind.items())},
+    }
+    if args.json:
+        summary['details'] = dict(sorted(by_kind.items()))
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+        return
+
+    for name, items in sorted(by_kind.items()):
+        print(f'{name}: {len(items)}')
+        shown = items if args.list_limit <= 0 else items[:args.list_limit]
+        for item in shown:
+            print(f"    {item['path']}" + (f"  ({item['detail']})" if 'detail' in item else ''))
+        if len(shown) < len(items):
+            print(f'    ... and {len(items) - len(shown)} more')
+    if not by_kind:
+        print('no problems found')
+    written = summary['written']
+    print(f"reindex: {len(tasks)} files in {parsed_in:.1f}s ({summary['files_per_second'] or 0} files/s)"
+          + (' [check only]' if args.check else
+             f", wrote {written['calls']} calls, {written['segments']} segments, {written['reviews']} reviews,"
+             f" deleted {written['deleted']} rows") + f', {elapsed:.1f}s total')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Move calls older than HOT_DAYS from the hot archive to COLD_ROOT.
+
+Loose calls in clean/<feed> and day packs in packs/<feed> are moved to the
+same layout under COLD_ROOT (see storage.py). The call index is updated as
+each call moves, so audio and archive routes keep resolving them.
+
+Usage:
+    python3 scripts/tier_archive.py                 # all feeds, HOT_DAYS from config
+    python3 scripts/tier_archive.py --hot-days 3 --dry-run
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import config  # noqa: E402
+import storage  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--feed', choices=config.FEEDS, action='append', help='feed(s) to tier (default: all)')
+    p.add_argument('--hot-days', type=int, default=config.HOT_DAYS)
+    p.add_argument('--dry-run', action='store_true')
+    args = p.parse_args()
+
+    for feed in args.feed or config.FEEDS:
+        started = time.time()
+        # Index first so every call being moved has a row to repoint.
+        storage.sync_feed(feed)
+        calls, packs, size = storage.demote(feed, args.hot_days, args.dry_run)
+        verb = 'would move' if args.dry_run else 'moved'
+        print(f'{feed}: {verb} {calls} calls and {packs} packs ({size / 1e6:.1f} MB) '
+              f'to {config.COLD_ROOT} in {time.time() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
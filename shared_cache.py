@@ -0,0 +1,145 @@
+"""Listing cache shared by every app process through Redis.
+
+Per-feed call pages and archive day summaries are stored in Redis under a
+per-feed generation number (``scanner:gen:<feed>``). ``invalidate(feed)``
+bumps the generation and publishes the feed on ``scanner:invalidate``, so
+every process, on every host, stops using the old entries at once and the
+next request anywhere rebuilds them a single time for the whole fleet.
+Old generations are never deleted; they expire with the TTL.
+
+Each process keeps the generations it has seen and a small in-memory copy
+of recent entries, both dropped by the subscriber thread when an
+invalidation arrives, so a warm page costs no Redis round trip at all. If
+the subscription is down the process re-reads generations from Redis on
+every request, and if Redis itself is unreachable the cache steps aside for
+a while and pages are built locally.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+CHANNEL = 'scanner:invalidate'
+KEY_PREFIX = 'scanner:cache'
+GEN_PREFIX = 'scanner:gen'
+LOCAL_ENTRIES = 256
+RETRY_AFTER = 30  # seconds to leave Redis alone after an error
+
+
+class SharedCache:
+    def __init__(self, url, ttl, enabled=True):
+        self.url = url
+        self.ttl = ttl
+        self.enabled = enabled
+        self._redis = None
+        self._down_until = 0.0
+        self._gens = {}
+        self._local = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+        self._subscriber = None
+        self._subscribed = False
+
+    # -- plumbing ------------------------------------------------------------
+
+    def _client(self):
+        if not self.enabled or time.time() < self._down_until:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.from_url(self.url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        if self._subscriber is None:
+            # Started lazily so it runs in each worker process after fork.
+            self._subscriber = threading.Thread(target=self._listen, name='shared-cache-sub', daemon=True)
+            self._subscriber.start()
+        return self._redis
+
+    def _failed(self, e):
+        print('shared_cache: redis error, building locally for a while:', e)
+        self._down_until = time.time() + RETRY_AFTER
+        with self._lock:
+            self._gens.clear()
+
+    def _listen(self):
+        import redis
+        client = redis.from_url(self.url)
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # Generations seen before (re)subscribing may be stale.
+                with self._lock:
+                    self._gens.clear()
+                self._subscribed = True
+                for message in pubsub.listen():
+                    feed = message['data'].decode('utf-8', 'replace')
+                    with self._lock:
+                        self._gens.pop(feed, None)
+            except Exception as e:
+                print('shared_cache: subscription lost', e)
+            self._subscribed = False
+            time.sleep(RETRY_AFTER)
+
+    def _generation(self, client, feed):
+        with self._lock:
+            gen = self._gens.get(feed) if self._subscribed else None
+        if gen is None:
+            gen = int(client.get(f'{GEN_PREFIX}:{feed}') or 0)
+            with self._lock:
+                self._gens[feed] = gen
+        return gen
+
+    # -- API -----------------------------------------------------------------
+
+    def get_or_build(self, feed, name, build, ttl=None):
+        """Cached JSON-serialisable value ``name`` of ``feed``, else ``build()``."""
+        ttl = ttl or self.ttl
+        client = self._client()
+        if client is None:
+            return build()
+        try:
+            key = f'{KEY_PREFIX}:{feed}:{self._generation(client, feed)}:{name}'
+            now = time.time()
+            with self._lock:
+                hit = self._local.get(key)
+                if hit and hit[0] > now:
+                    self._local.move_to_end(key)
+                    return hit[1]
+            raw = client.get(key)
+        except Exception as e:
+            self._failed(e)
+            return build()
+        if raw is not None:
+            value = json.loads(raw)
+        else:
+            value = build()
+            try:
+                client.set(key, json.dumps(value), ex=ttl)
+            except Exception as e:
+                self._failed(e)
+                return value
+        with self._lock:
+            # Local copies expire on the same TTL as the Redis entries.
+            self._local[key] = (time.time() + ttl, value)
+            while len(self._local) > LOCAL_ENTRIES:
+                self._local.popitem(last=False)
+        return value
+
+    def invalidate(self, feed):
+        """Drop every cached entry of ``feed`` in all processes."""
+        with self._lock:
+            self._gens.pop(feed, None)
+        client = self._client()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline()
+            pipe.incr(f'{GEN_PREFIX}:{feed}')
+            pipe.publish(CHANNEL, feed)
+            pipe.execute()
+        except Exception as e:
+            self._failed(e)
+
+
+cache = SharedCache(config.REDIS_URL, config.SHARED_CACHE_TTL, enabled=config.SHARED_CACHE)
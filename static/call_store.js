@@ -0,0 +1,133 @@
+// Local copy of the call list in IndexedDB, kept current through
+// /scanner/changes. Each sync sends the last version it applied and gets
+// back only the calls added, edited or removed since, so pages can render
+// from local data first and then patch in the (usually tiny) delta.
+//
+// Loaded with <script src="/static/call_store.js"> in pages, or
+// importScripts() in the service worker; both get a global CallStore.
+(function (global) {
+  const DB_NAME = 'scanner-calls';
+  const DB_VERSION = 1;
+  const CHANGES_URL = '/scanner/changes';
+  const PAGE_LIMIT = 500;
+  // A new store only takes calls from this many days back (today included)
+  // instead of the whole archive; pages read just today's calls from it.
+  const STORE_DAYS = 2;
+
+  let dbPromise = null;
+  let syncing = null;
+
+  function promisify(request) {
+    return new Promise((resolve, reject) => {
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    });
+  }
+
+  function done(tx) {
+    return new Promise((resolve, reject) => {
+      tx.oncomplete = () => resolve();
+      tx.onerror = tx.onabort = () => reject(tx.error);
+    });
+  }
+
+  function open() {
+    if (dbPromise) return dbPromise;
+    const request = indexedDB.open(DB_NAME, DB_VERSION);
+    request.onupgradeneeded = () => {
+      const db = request.result;
+      // Keyed [feed, file]; file names sort by time, so a reverse cursor
+      // over one feed's key range yields its newest calls first.
+      db.createObjectStore('calls', { keyPath: ['feed', 'file'] });
+      db.createObjectStore('meta');
+    };
+    dbPromise = promisify(request).catch((err) => {
+      dbPromise = null;
+      throw err;
+    });
+    return dbPromise;
+  }
+
+  async function getVersion() {
+    const db = await open();
+    const tx = db.transaction('meta', 'readonly');
+    return (await promisify(tx.objectStore('meta').get('version'))) || 0;
+  }
+
+  // First day the store holds calls for, fixed when it is first synced.
+  async function getFromDay() {
+    const db = await open();
+    const tx = db.transaction('meta', 'readonly');
+    const stored = await promisify(tx.objectStore('meta').get('from_day'));
+    if (stored) return stored;
+    const first = new Date();
+    first.setDate(first.getDate() - (STORE_DAYS - 1));
+    return first.toLocaleDateString('en-CA');  // YYYY-MM-DD, local time
+  }
+
+  // Apply one reply from /scanner/changes atomically, version included, so
+  // an interrupted sync resumes from exactly where it stopped.
+  async function apply(data, fromDay) {
+    const db = await open();
+    const tx = db.transaction(['calls', 'meta'], 'readwrite');
+    const calls = tx.objectStore('calls');
+    if (data.reset) calls.clear();
+    for (const call of data.calls) calls.put(call);
+    for (const d of data.deleted) calls.delete([d.feed, d.file]);
+    tx.objectStore('meta').put(data.version, 'version');
+    tx.objectStore('meta').put(fromDay, 'from_day');
+    await done(tx);
+    return data.calls.length + data.deleted.length;
+  }
+
+  async function runSync() {
+    let changed = 0;
+    let since = await getVersion();
+    const fromDay = await getFromDay();
+    for (;;) {
+      const res = await fetch(`${CHANGES_URL}?since=${since}&limit=${PAGE_LIMIT}&from_day=${fromDay}`,
+                              { credentials: 'same-origin', cache: 'no-store' });
+      if (!res.ok) throw new Error(`changes: HTTP ${res.status}`);
+      const data = await res.json();
+      changed += await apply(data, fromDay);
+      since = data.version;
+      if (!data.more) return changed;
+    }
+  }
+
+  // Bring the local store up to date. Concurrent callers share one sync.
+  // Resolves to the number of calls added, changed or removed.
+  function sync() {
+    if (!syncing) {
+      syncing = runSync().finally(() => { syncing = null; });
+    }
+    return syncing;
+  }
+
+  // Newest calls of ``feed`` (optionally only those of ``day``), newest first.
+  async function recent(feed, limit, day) {
+    const db = await open();
+    const tx = db.transaction('calls', 'readonly');
+    const prefix = day ? `rec_${day}_` : '';
+    const range = IDBKeyRange.bound([feed, prefix], [feed, prefix + '\uffff']);
+    const out = [];
+    return new Promise((resolve, reject) => {
+      const request = tx.objectStore('calls').openCursor(range, 'prev');
+      request.onerror = () => reject(request.error);
+      request.onsuccess = () => {
+        const cursor = request.result;
+        if (!cursor || out.length >= limit) return resolve(out);
+        out.push(cursor.value);
+        cursor.continue();
+      };
+    });
+  }
+
+  async function get(feed, file) {
+    const db = await open();
+    const tx = db.transaction('calls', 'readonly');
+    return promisify(tx.objectStore('calls').get([feed, file]));
+  }
+
+  global.CallStore = { open, sync, recent, get, getVersion };
+})(self);
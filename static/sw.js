@@ -1,6 +1,34 @@
-const CACHE_NAME = 'scanner-cache-v2';
+// IndexedDB call store (global CallStore), also used by the feed pages.
+// Optional here: if it cannot be fetched the worker still installs, and
+// everything that uses it checks self.CallStore first.
+try {
+  importScripts('/static/call_store.js');
+} catch (e) {
+  console.warn('SW: call store unavailable', e);
+}
+
+const CACHE_NAME = 'scanner-cache-v3';
 const OFFLINE_URL = 'offline.html';
 
+// Call audio lives in its own cache, bounded by an LRU byte budget. The LRU
+// bookkeeping ({url: {size, used}}) is kept as a JSON entry in a small
+// metadata cache so it survives the worker being stopped.
+const AUDIO_CACHE = 'scanner-audio-v1';
+const AUDIO_META_CACHE = 'scanner-audio-meta-v1';
+const AUDIO_META_KEY = '/__audio_lru__';
+const AUDIO_BUDGET_BYTES = 50 * 1024 * 1024;
+// One page of the feed's listing (CALLS_PER_PAGE), all prefetchFeed sees.
+const AUDIO_PREFETCH_COUNT = 10;
+const AUDIO_PATHS = ['/scanner/audio/', '/api/audio/', '/scanner/clip/'];
+// Clips of one call differ only by ?start=&end=, so those stay in their key.
+const CLIP_PATH = '/scanner/clip/';
+// Where the SW finds the newest calls of each feed for prefetching.
+const FEED_LIST_URLS = { pd: '/scanner_pd', fd: '/scanner_fire' };
+// Path prefixes never stored in or replayed from CACHE_NAME: a stale delta
+// could roll local edits back, peaks are recomputed when a WAV changes
+// (HTTP caching covers them), and day exports can be hundreds of MB.
+const NO_CACHE_PATHS = ['/scanner/changes', '/scanner/peaks/', '/scanner/export'];
+
 // Use relative paths so this worker works under /scanner/ when installed there.
 const ASSETS_TO_CACHE = [
   './',
@@ -39,8 +67,9 @@ self.addEventListener('install', (event) => {
 self.addEventListener('activate', (event) => {
   event.waitUntil(
     caches.keys().then((keys) => {
+      const keep = [CACHE_NAME, AUDIO_CACHE, AUDIO_META_CACHE];
       return Promise.all(
-        keys.filter((key) => key !== CACHE_NAME).map((key) => caches.delete(key))
+        keys.filter((key) => !keep.includes(key)).map((key) => caches.delete(key))
       );
     })
   );
@@ -54,11 +83,212 @@ self.addEventListener('message', (event) => {
   if (event.data.type === 'SKIP_WAITING') {
     self.skipWaiting();
   }
+  if (event.data.type === 'PREFETCH_AUDIO') {
+    event.waitUntil(prefetchFeed(event.data.feed));
+  }
 });
 
+
+// ---- Audio cache -------------------------------------------------------
+
+let audioLru = null;  // url -> {size, used}; loaded lazily
+let audioLruSaving = null;
+
+function isAudioRequest(url) {
+  return url.origin === self.location.origin && AUDIO_PATHS.some((p) => url.pathname.startsWith(p));
+}
+
+async function loadLru() {
+  if (audioLru) return audioLru;
+  try {
+    const meta = await caches.open(AUDIO_META_CACHE);
+    const res = await meta.match(AUDIO_META_KEY);
+    audioLru = res ? await res.json() : {};
+  } catch (e) {
+    audioLru = {};
+  }
+  return audioLru;
+}
+
+function saveLru() {
+  // Coalesce bursts of touches (a page full of <audio> elements) into one write.
+  if (audioLruSaving) return audioLruSaving;
+  audioLruSaving = new Promise((resolve) => setTimeout(resolve, 500)).then(async () => {
+    audioLruSaving = null;
+    const meta = await caches.open(AUDIO_META_CACHE);
+    await meta.put(AUDIO_META_KEY, new Response(JSON.stringify(audioLru), {
+      headers: { 'Content-Type': 'application/json' }
+    }));
+  });
+  return audioLruSaving;
+}
+
+async function touchAudio(url, size) {
+  const lru = await loadLru();
+  const entry = lru[url] || { size: 0 };
+  if (size !== undefined) entry.size = size;
+  entry.used = Date.now();
+  lru[url] = entry;
+  return saveLru();
+}
+
+async function enforceAudioBudget() {
+  const lru = await loadLru();
+  const cache = await caches.open(AUDIO_CACHE);
+  // Drop bookkeeping for entries the browser evicted on its own.
+  const cached = new Set((await cache.keys()).map((r) => r.url));
+  for (const url of Object.keys(lru)) {
+    if (!cached.has(url)) delete lru[url];
+  }
+  let total = Object.values(lru).reduce((sum, e) => sum + e.size, 0);
+  const oldestFirst = Object.entries(lru).sort((a, b) => a[1].used - b[1].used);
+  for (const [url, entry] of oldestFirst) {
+    if (total <= AUDIO_BUDGET_BYTES) break;
+    await cache.delete(url);
+    delete lru[url];
+    total -= entry.size;
+  }
+  return saveLru();
+}
+
+// Store a complete (200) audio response and return its body as a Blob.
+async function storeAudio(url, response) {
+  const blob = await response.blob();
+  if (blob.size > AUDIO_BUDGET_BYTES / 4) return blob;  // not worth evicting for
+  const headers = new Headers(response.headers);
+  headers.set('Content-Length', String(blob.size));
+  const cache = await caches.open(AUDIO_CACHE);
+  await cache.put(url, new Response(blob, { status: 200, headers }));
+  await touchAudio(url, blob.size);
+  await enforceAudioBudget();
+  return blob;
+}
+
+// Answer a request from a full body, honouring a single "bytes=" Range.
+function audioResponse(blob, headers, rangeHeader) {
+  const base = new Headers(headers);
+  base.set('Accept-Ranges', 'bytes');
+  const m = rangeHeader && /^bytes=(\d*)-(\d*)$/.exec(rangeHeader.trim());
+  if (!m || (m[1] === '' && m[2] === '')) {
+    base.set('Content-Length', String(blob.size));
+    return new Response(blob, { status: 200, headers: base });
+  }
+  let start;
+  let end;
+  if (m[1] === '') {
+    // Suffix range: the last N bytes.
+    start = Math.max(blob.size - parseInt(m[2], 10), 0);
+    end = blob.size - 1;
+  } else {
+    start = parseInt(m[1], 10);
+    end = m[2] === '' ? blob.size - 1 : Math.min(parseInt(m[2], 10), blob.size - 1);
+  }
+  if (start >= blob.size || start > end) {
+    base.set('Content-Range', `bytes */${blob.size}`);
+    base.delete('Content-Length');
+    return new Response(null, { status: 416, headers: base });
+  }
+  base.set('Content-Range', `bytes ${start}-${end}/${blob.size}`);
+  base.set('Content-Length', String(end - start + 1));
+  return new Response(blob.slice(start, end + 1), { status: 206, headers: base });
+}
+
+async function handleAudio(event) {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (!url.pathname.startsWith(CLIP_PATH)) url.search = '';
+  const key = url.href;
+  const range = request.headers.get('Range');
+
+  const cache = await caches.open(AUDIO_CACHE);
+  const cached = await cache.match(key);
+  if (cached) {
+    event.waitUntil(touchAudio(key));
+    return audioResponse(await cached.blob(), cached.headers, range);
+  }
+
+  // A whole-file request (no Range, or the "bytes=0-" players open with) is
+  // fetched in full so it can be cached, then answered from the body. Other
+  // ranges (seeks into an uncached call) go straight to the network.
+  if (!range || /^bytes=0-$/.test(range.trim())) {
+    let response;
+    try {
+      response = await fetch(key, { credentials: 'same-origin' });
+    } catch (e) {
+      return fetch(request);
+    }
+    if (response.status !== 200) return response;
+    const headers = response.headers;
+    const blob = await storeAudio(key, response);
+    return audioResponse(blob, headers, range);
+  }
+  return fetch(request);
+}
+
+// Prefetching only happens on unmetered connections: wifi or ethernet, or
+// when the connection type is unknown, fast and not in data-saver mode.
+// Browsers without the Network Information API (Safari) report nothing and
+// never prefetch.
+function onUnmeteredNetwork() {
+  const conn = self.navigator && self.navigator.connection;
+  if (!conn) return false;
+  if (conn.saveData) return false;
+  if (conn.type) return conn.type === 'wifi' || conn.type === 'ethernet';
+  return conn.effectiveType === '4g';
+}
+
+async function prefetchFeed(feed) {
+  const listUrl = FEED_LIST_URLS[feed];
+  if (!listUrl || !onUnmeteredNetwork()) return;
+  let calls;
+  try {
+    const res = await fetch(listUrl, { headers: { Accept: 'application/json' }, credentials: 'same-origin' });
+    if (!res.ok) return;
+    calls = (await res.json()).calls || [];
+  } catch (e) {
+    return;
+  }
+  const cache = await caches.open(AUDIO_CACHE);
+  for (const call of calls.slice(0, AUDIO_PREFETCH_COUNT)) {
+    if (!call.path) continue;
+    const key = new URL(call.path, self.location.origin).href;
+    if (await cache.match(key)) continue;
+    try {
+      const res = await fetch(key, { credentials: 'same-origin' });
+      if (res.status === 200) await storeAudio(key, res);
+    } catch (e) {
+      return;  // went offline; try again next time
+    }
+  }
+}
+
 self.addEventListener('fetch', (event) => {
   if (event.request.method !== 'GET') return;
 
+  const url = new URL(event.request.url);
+  if (NO_CACHE_PATHS.some((p) => url.pathname.startsWith(p))) return;
+
+  // Feed pages: stale-while-revalidate. The cached page shows at once and
+  // its call_store sync patches in whatever arrived since it was cached.
+  if (event.request.mode === 'navigate' && Object.values(FEED_LIST_URLS).includes(url.pathname)) {
+    event.respondWith((async () => {
+      const cache = await caches.open(CACHE_NAME);
+      // Only the page itself, stored under its bare path below; other
+      // cached URLs of the path (e.g. ?page=N JSON) are not pages.
+      const cached = await cache.match(url.pathname);
+      const network = fetch(event.request).then((response) => {
+        if (response.status === 200) cache.put(url.pathname, response.clone());
+        return response;
+      });
+      if (cached) {
+        event.waitUntil(network.catch(() => {}));
+        return cached;
+      }
+      return network.catch(async () => (await caches.match(OFFLINE_URL)));
+    })());
+    return;
+  }
+
   // Navigation requests: serve cached offline page when network fails
   if (event.request.mode === 'navigate') {
     event.respondWith(
@@ -69,11 +299,20 @@ self.addEventListener('fetch', (event) => {
     return;
   }
 
+  if (isAudioRequest(url)) {
+    event.respondWith(handleAudio(event));
+    return;
+  }
+
   event.respondWith(
     fetch(event.request)
       .then((response) => {
-        const resClone = response.clone();
-        caches.open(CACHE_NAME).then((cache) => cache.put(event.request, resClone));
+        // Only complete same-origin responses; partial (206) bodies and
+        // opaque cross-origin responses cannot be replayed correctly.
+        if (response.status === 200 && response.type === 'basic') {
+          const resClone = response.clone();
+          caches.open(CACHE_NAME).then((cache) => cache.put(event.request, resClone));
+        }
         return response;
       })
       .catch(() => caches.match(event.request))
@@ -82,6 +321,34 @@ self.addEventListener('fetch', (event) => {
 
 
 // Handle push events (display notifications)
+// New-call pushes carry the call's audio/metadata URLs; both are fetched
+// (and the local call store synced) before the notification is shown, so
+// tapping it plays from cache. The wait is capped so a slow network never
+// holds the notification back for long.
+const PUSH_PREFETCH_TIMEOUT_MS = 8000;
+
+async function prefetchPushedCall(data) {
+  const jobs = [];
+  const audioKey = new URL(data.audio, self.location.origin).href;
+  const audioCache = await caches.open(AUDIO_CACHE);
+  if (!(await audioCache.match(audioKey))) {
+    jobs.push(fetch(audioKey, { credentials: 'same-origin' }).then((res) => {
+      if (res.status === 200) return storeAudio(audioKey, res);
+    }));
+  }
+  if (data.meta) {
+    jobs.push(fetch(data.meta, { credentials: 'same-origin' }).then(async (res) => {
+      if (res.ok) await (await caches.open(CACHE_NAME)).put(data.meta, res);
+    }));
+  }
+  // Only patch a store a page has already filled; the first sync belongs
+  // to the page, not to an 8 s push handler.
+  if (self.CallStore) {
+    jobs.push(self.CallStore.getVersion().then((version) => version && self.CallStore.sync()));
+  }
+  await Promise.allSettled(jobs);
+}
+
 self.addEventListener('push', function(event) {
   let payload = {};
   try {
@@ -90,22 +357,32 @@ self.addEventListener('push', function(event) {
     try { payload = { message: event.data.text() }; } catch (e2) { payload = { message: 'New notification' }; }
   }
 
+  const data = payload.data || {};
   const title = (payload && payload.title) || 'Scanner';
   const options = {
     body: (payload && payload.message) || '',
     icon: 'static/icons/icon-192.png',
     badge: 'static/icons/icon-192.png',
-    data: payload.data || {}
+    data: data
   };
+  if (data.type === 'call' && data.file) options.tag = `call-${data.file}`;
 
-  event.waitUntil(self.registration.showNotification(title, options));
+  let ready = Promise.resolve();
+  if (data.type === 'call' && data.audio) {
+    ready = Promise.race([
+      prefetchPushedCall(data).catch((err) => console.warn('SW: push prefetch failed', err)),
+      new Promise((resolve) => setTimeout(resolve, PUSH_PREFETCH_TIMEOUT_MS)),
+    ]);
+  }
+  event.waitUntil(ready.then(() => self.registration.showNotification(title, options)));
 });
 
 
 // Handle notification click
 self.addEventListener('notificationclick', function(event) {
   event.notification.close();
-  const urlToOpen = new URL('/scanner/', self.location.origin).href;
+  const target = (event.notification.data && event.notification.data.url) || '/scanner/';
+  const urlToOpen = new URL(target, self.location.origin).href;
   event.waitUntil(
     clients.matchAll({ type: 'window', includeUncontrolled: true }).then( windowClients => {
       for (let i = 0; i < windowClients.length; i++) {
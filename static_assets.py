@@ -0,0 +1,162 @@
+"""Fingerprinted, precompressed static files.
+
+At startup every file under the app's static folder is read once, hashed
+and compressed (gzip, and brotli when the ``brotli`` package is installed),
+so requests are answered from memory without touching the disk.
+
+Pages link assets through ``asset_url('call_store.js')``, which yields a
+content-hashed URL (``/static/call_store.3f2a9c1b0d4e.js``) served with a
+one-year immutable Cache-Control: a new deploy changes the URL, never the
+bytes behind one. Files that must keep a fixed URL (``sw.js``, the
+manifest, the offline page, icons, and plain ``/static/<name>`` requests)
+are sent with ``no-cache`` and a strong ETag instead, so browsers
+revalidate them every time and get a bodiless 304 when nothing changed.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+import threading
+
+from flask import abort, request
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional: gzip alone still covers every browser
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# Below this, compression headers cost more than they save.
+MIN_COMPRESS = 256
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json',
+                'application/manifest+json', 'image/svg+xml')
+HASH_LEN = 12
+_HASHED = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % HASH_LEN)
+
+mimetypes.add_type('application/javascript', '.js')
+mimetypes.add_type('image/svg+xml', '.svg')
+
+
+class Asset:
+    __slots__ = ('name', 'path', 'mtime_ns', 'mimetype', 'digest', 'variants')
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.mtime_ns = os.stat(path).st_mtime_ns
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(data).hexdigest()[:HASH_LEN]
+        # encoding -> bytes; identity always present
+        self.variants = {'identity': data}
+        if len(data) >= MIN_COMPRESS and self.mimetype.startswith(COMPRESSIBLE):
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                self.variants['gzip'] = gz
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(data):
+                    self.variants['br'] = br
+
+    @property
+    def hashed_name(self):
+        stem, ext = os.path.splitext(self.name)
+        return f'{stem}.{self.digest}{ext}'
+
+
+class AssetRegistry:
+    def __init__(self, folder, url_prefix='/static', check=False):
+        self.folder = folder
+        self.url_prefix = url_prefix
+        # Re-stat files on access so edits show up without a restart
+        # (STATIC_RELOAD, for working on the front end).
+        self.check = check
+        self.assets = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        assets = {}
+        for root, _, files in os.walk(self.folder):
+            for fname in files:
+                path = os.path.join(root, fname)
+                name = os.path.relpath(path, self.folder).replace(os.sep, '/')
+                assets[name] = Asset(name, path)
+        self.assets = assets
+
+    def get(self, name):
+        asset = self.assets.get(name)
+        if self.check:
+            path = safe_join(self.folder, name)
+            try:
+                st = os.stat(path)
+            except (TypeError, FileNotFoundError, NotADirectoryError):
+                return None
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            if asset is None or asset.mtime_ns != st.st_mtime_ns:
+                with self._lock:
+                    asset = self.assets[name] = Asset(name, path)
+        return asset
+
+    def url(self, name):
+        asset = self.get(name)
+        if asset is None:
+            return f'{self.url_prefix}/{name}'
+        return f'{self.url_prefix}/{asset.hashed_name}'
+
+
+def _pick_encoding(asset):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.variants and accepted[encoding]:
+            return encoding
+    return 'identity'
+
+
+def send_asset(app, name, immutable=False):
+    """Response for static file ``name`` (relative to the static folder)."""
+    registry = app.extensions['static_assets']
+    asset = registry.get(name)
+    if asset is None:
+        abort(404)
+    encoding = _pick_encoding(asset)
+    rv = app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding != 'identity':
+        rv.content_encoding = encoding
+    if len(asset.variants) > 1:
+        rv.vary.add('Accept-Encoding')
+    # Per-encoding ETag: the bytes differ, so caches must not mix them up.
+    rv.set_etag(asset.digest if encoding == 'identity' else f'{asset.digest}-{encoding}')
+    rv.headers['Cache-Control'] = IMMUTABLE if immutable else REVALIDATE
+    return rv.make_conditional(request)
+
+
+def init_app(app):
+    """Load the static folder and take over Flask's ``static`` endpoint."""
+    registry = AssetRegistry(app.static_folder, app.static_url_path, check=app.config.get('STATIC_RELOAD', False))
+    app.extensions['static_assets'] = registry
+
+    def static(filename):
+        m = _HASHED.match(os.path.basename(filename))
+        if m:
+            name = os.path.join(os.path.dirname(filename), m['stem'] + m['ext']).lstrip('/')
+            asset = registry.get(name)
+            if asset is not None:
+                # A hash from an older deploy still gets the current file,
+                # just without the promise that it never changes.
+                return send_asset(app, name, immutable=asset.digest == m['hash'])
+        return send_asset(app, filename)
+
+    app.view_functions['static'] = static
+
+    @app.context_processor
+    def _asset_url():
+        return {'asset_url': registry.url}
+
+    return registry
@@ -0,0 +1,204 @@
+"""Where a call's bytes live, and how to serve them.
+
+Calls are either loose files in a feed directory or members of a sealed
+day pack, and both exist in two tiers: hot (``clean/<feed>`` and
+``packs/<feed>``, the last HOT_DAYS days) and cold (the same layout under
+COLD_ROOT, possibly slower storage). Routes go through this module instead
+of probing directories themselves; lookups start from the call index.
+"""
+import datetime
+import mimetypes
+import os
+import shutil
+from collections import namedtuple
+
+from flask import current_app, request, send_from_directory
+from werkzeug.wsgi import FileWrapper
+
+import archive_pack
+import call_index
+import config
+import zip_stream
+
+# kind is 'file' or 'pack'; for 'file' ``path`` is the file itself, for
+# 'pack' it is the pack file and ``pack`` the open Pack.
+Location = namedtuple('Location', 'kind path name feed pack')
+
+
+def live_dir(feed):
+    return os.path.join(config.ARCHIVE_DIR, feed)
+
+
+def cold_dir(feed):
+    return os.path.join(config.COLD_ROOT, feed)
+
+
+def cold_pack_dir(feed):
+    return os.path.join(config.COLD_ROOT, 'packs', feed)
+
+
+def sync_feed(feed):
+    """Refresh the call index for every place ``feed`` stores calls.
+
+    Each location is gated on its directory mtime, so untouched tiers cost
+    one stat apiece.
+    """
+    call_index.sync_calls(live_dir(feed), feed)
+    call_index.sync_packs(feed, archive_pack.pack_dir(feed), archive_pack.open_pack)
+    call_index.sync_calls(cold_dir(feed), feed)
+    call_index.sync_packs(feed, cold_pack_dir(feed), archive_pack.open_pack)
+
+
+def _probe_dirs(feed=None):
+    # Only consulted when the index has no usable row (a call that has not
+    # been indexed yet, or one moved between tiers a moment ago).
+    feeds = [feed] if feed else list(config.FEEDS)
+    return ([(f, live_dir(f)) for f in feeds] + [(f, cold_dir(f)) for f in feeds]
+            + [(None, config.SEGMENT_DIR)])
+
+
+def locate(row):
+    """Location of the call described by index ``row``, or None if it is gone."""
+    filename = row['file']
+    location = row['location']
+    if location.endswith('.pack'):
+        try:
+            pack = archive_pack.open_pack(location)
+        except FileNotFoundError:
+            pack = None
+        if pack is not None and filename in pack:
+            return Location('pack', location, filename, row['feed'], pack)
+    else:
+        path = os.path.join(location, filename)
+        if os.path.exists(path):
+            return Location('file', path, filename, row['feed'], None)
+    return None
+
+
+def resolve(filename, feed=None):
+    """Locate ``filename`` (a call or segment WAV). Returns a Location or None."""
+    row = call_index.get_call(filename, feed)
+    if row:
+        location = locate(row)
+        if location is not None:
+            return location
+    # Not indexed yet (or index stale): fall back to the live directories.
+    for f, directory in _probe_dirs(feed):
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            return Location('file', path, filename, f, None)
+    return None
+
+
+def read_sidecar(location, suffix):
+    """Bytes of the ``.json``/``.txt`` sidecar next to a resolved WAV, or None."""
+    name = location.name[:-4] + suffix
+    if location.kind == 'pack':
+        return location.pack.read(name) if name in location.pack else None
+    try:
+        with open(location.path[:-4] + suffix, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def zip_member(location, arcname, suffix='.wav'):
+    """A :mod:`zip_stream` member for a resolved call's WAV or sidecar, or None if missing."""
+    name = location.name[:-4] + suffix
+    if location.kind == 'pack':
+        pack = location.pack
+        if name not in pack:
+            return None
+        offset, size = pack.member_range(name)
+        date_time = zip_stream.filename_datetime(name, pack.mtime_ns)
+        return zip_stream.FileMember(arcname, pack.path, date_time, size=size, base=offset,
+                                     crc=pack.crcs.get(name), mtime_ns=pack.mtime_ns)
+    path = location.path[:-4] + suffix
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    date_time = zip_stream.filename_datetime(name, st.st_mtime_ns)
+    return zip_stream.FileMember(arcname, path, date_time, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+
+def send_location(location, **kwargs):
+    """Flask response for a resolved file, honouring Range/conditional requests."""
+    if location.kind == 'file':
+        return send_from_directory(os.path.dirname(location.path), location.name, **kwargs)
+    pack = location.pack
+    offset, size = pack.member_range(location.name)
+    mimetype = kwargs.get('mimetype') or mimetypes.guess_type(location.name)[0] or 'application/octet-stream'
+    rv = current_app.response_class(
+        FileWrapper(pack.open_member(location.name)), mimetype=mimetype, direct_passthrough=True
+    )
+    rv.content_length = size
+    rv.last_modified = pack.mtime_ns / 1e9
+    rv.set_etag(f'{pack.mtime_ns}-{offset}-{size}')
+    # Sealed packs never change in place, so members can be cached freely.
+    rv.cache_control.public = True
+    rv.cache_control.max_age = 86400
+    return rv.make_conditional(request.environ, accept_ranges=True, complete_length=size)
+
+
+def send_audio(filename, feed=None):
+    location = resolve(filename, feed)
+    if location is None:
+        return None
+    return send_location(location)
+
+
+def _move(src, dst_dir):
+    """Move a file into ``dst_dir``; copies then unlinks across filesystems."""
+    os.makedirs(dst_dir, exist_ok=True)
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    shutil.move(src, dst)
+    return dst
+
+
+def demote(feed, hot_days=None, dry_run=False):
+    """Move calls older than ``hot_days`` days of ``feed`` to the cold tier.
+
+    Loose calls move with their sidecars, packs move whole; index rows are
+    repointed right after each move so lookups never need to probe.
+    Returns ``(calls_moved, packs_moved, bytes_moved)``.
+    """
+    hot_days = config.HOT_DAYS if hot_days is None else hot_days
+    cutoff = (datetime.date.today() - datetime.timedelta(days=hot_days)).isoformat()
+    calls = packs = moved_bytes = 0
+
+    src_dir = live_dir(feed)
+    by_call = {}
+    try:
+        with os.scandir(src_dir) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                if ext not in ('.wav', '.json', '.txt'):
+                    continue
+                day = call_index.call_day(entry.name)
+                if day != 'unknown' and day < cutoff:
+                    by_call.setdefault(stem, []).append(entry.path)
+    except FileNotFoundError:
+        pass
+    for stem, paths in sorted(by_call.items()):
+        moved_bytes += sum(os.path.getsize(p) for p in paths)
+        calls += 1
+        if dry_run:
+            continue
+        # WAV last, so a call is never visible in the cold tier without
+        # its sidecars.
+        for path in sorted(paths, key=lambda p: p.endswith('.wav')):
+            _move(path, cold_dir(feed))
+        call_index.relocate_calls(feed, src_dir, cold_dir(feed), [stem + '.wav'])
+
+    for path in archive_pack.list_packs(feed):
+        day = os.path.basename(path)[:-len('.pack')]
+        if day >= cutoff:
+            continue
+        moved_bytes += os.path.getsize(path)
+        packs += 1
+        if dry_run:
+            continue
+        dst = _move(path, cold_pack_dir(feed))
+        call_index.relocate_calls(feed, path, dst)
+    return calls, packs, moved_bytes
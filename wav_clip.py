@@ -0,0 +1,99 @@
+"""Time ranges of a WAV served as WAVs of their own.
+
+A clip is a synthesized 44-byte header followed by a slice of the source's
+sample data, memory-mapped straight from the loose file or day pack: only
+the pages a client actually reads are touched, and seeking (Range
+requests) costs nothing. Sample boundaries are rounded to whole frames.
+
+Segments cut from a call (see the ``duplicates`` table, which records
+where in the call each segment starts) can be played as clips of the call
+instead of being kept as copies of its audio.
+"""
+import io
+import mmap
+import struct
+
+HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+# Sample formats (``subformat`` of read_wav_info) whose data chunk is plain
+# interleaved samples, safe to cut anywhere on a frame: PCM and float.
+FORMATS = (1, 3)
+
+
+def wav_header(audio_format, channels, sample_rate, sample_width, data_size):
+    """A canonical RIFF/WAVE header for ``data_size`` bytes of samples."""
+    block_align = channels * sample_width
+    return HEADER.pack(b'RIFF', 36 + data_size, b'WAVE', b'fmt ', 16, audio_format, channels, sample_rate,
+                       sample_rate * block_align, block_align, sample_width * 8, b'data', data_size)
+
+
+class WavClip(io.RawIOBase):
+    """Read-only, seekable clip of ``start``..``end`` seconds of a WAV.
+
+    ``info`` is the source's :func:`wav_utils.read_wav_info` (with absolute
+    offsets, so WAVs inside packs work too); WAVE_FORMAT_EXTENSIBLE sources
+    get a plain header with their subformat. Raises ValueError for a range
+    outside the audio.
+    """
+
+    def __init__(self, path, info, start=0.0, end=None):
+        if info['subformat'] not in FORMATS:
+            raise ValueError('unsupported WAV format')
+        frame = info['block_align'] or info['channels'] * info['sample_width']
+        frames = info['data_size'] // frame
+        rate = info['sample_rate']
+        first = int(round(start * rate))
+        last = frames if end is None else min(int(round(end * rate)), frames)
+        if start < 0 or first >= frames or last <= first:
+            raise ValueError(f"range outside the audio (0 to {frames / rate:.3f}s)")
+        self.start = first / rate
+        self.end = last / rate
+        data_size = (last - first) * frame
+        self.header = wav_header(info['subformat'], info['channels'], rate, info['sample_width'], data_size)
+        self.size = len(self.header) + data_size
+
+        # mmap offsets must be multiples of the allocation granularity.
+        begin = info['data_offset'] + first * frame
+        aligned = begin - begin % mmap.ALLOCATIONGRANULARITY
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), begin - aligned + data_size, access=mmap.ACCESS_READ,
+                                  offset=aligned)
+        self._data = memoryview(self._map)[begin - aligned:]
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self.size
+        self._pos = min(max(pos, 0), self.size)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def readinto(self, b):
+        n = min(len(b), self.size - self._pos)
+        if n <= 0:
+            return 0
+        head = len(self.header)
+        done = 0
+        if self._pos < head:
+            done = min(n, head - self._pos)
+            b[:done] = self.header[self._pos:self._pos + done]
+        if done < n:
+            lo = self._pos + done - head
+            b[done:n] = self._data[lo:lo + n - done]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._data.release()
+            self._map.close()
+        super().close()
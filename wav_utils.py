@@ -0,0 +1,86 @@
+import os
+import struct
+
+
+def _walk_chunks(f, file_size, base=0):
+    """Yield (chunk_id, payload_offset, payload_size) for a RIFF/WAVE file.
+
+    ``base`` is where the WAV starts inside ``f`` (non-zero for WAVs stored
+    in a pack file); ``file_size`` is the end of the WAV, and offsets are
+    absolute positions in ``f``.
+    """
+    f.seek(base)
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise ValueError('not a RIFF/WAVE file')
+    offset = base + 12
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        chunk_id, size = struct.unpack('<4sI', chunk)
+        yield chunk_id, offset + 8, size
+        # chunks are word aligned
+        offset += 8 + size + (size & 1)
+
+
+def read_wav_info(path, base=0, length=None):
+    """Read format and length of a PCM WAV from its headers only.
+
+    Only the RIFF chunk headers and the ``fmt `` chunk are read; sample data
+    is never touched. A ``data`` chunk whose size field is 0 or overruns the
+    file (recorder killed mid-write) is clamped to the bytes actually there.
+    ``base``/``length`` locate a WAV embedded in a larger file; the returned
+    ``data_offset`` is then absolute within ``path``.
+
+    Returns a dict with ``duration`` (seconds), ``sample_rate``,
+    ``channels``, ``sample_width`` (bytes), ``data_offset`` and ``data_size``.
+    ``subformat`` is the format code of the samples: ``audio_format``, or
+    for WAVE_FORMAT_EXTENSIBLE the one in its SubFormat GUID.
+    """
+    file_size = base + length if length is not None else os.path.getsize(path)
+    fmt = None
+    subformat = None
+    data_offset = data_size = None
+    with open(path, 'rb') as f:
+        for chunk_id, offset, size in _walk_chunks(f, file_size, base):
+            if chunk_id == b'fmt ':
+                f.seek(offset)
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                subformat = fmt[0]
+                if fmt[0] == 0xFFFE and size >= 40:
+                    # The GUID starts with the plain format code (1 PCM, 3 float).
+                    f.seek(offset + 24)
+                    subformat = struct.unpack('<H', f.read(2))[0]
+            elif chunk_id == b'data':
+                data_offset = offset
+                available = file_size - offset
+                data_size = size if 0 < size <= available else available
+                break
+    if fmt is None or data_offset is None:
+        raise ValueError('missing fmt or data chunk')
+    audio_format, channels, sample_rate, byte_rate, block_align, bits = fmt
+    if not byte_rate:
+        raise ValueError('invalid byte rate')
+    if block_align:
+        data_size -= data_size % block_align
+    return {
+        'duration': data_size / byte_rate,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'sample_width': bits // 8,
+        'block_align': block_align,
+        'audio_format': audio_format,
+        'subformat': subformat,
+        'data_offset': data_offset,
+        'data_size': data_size,
+    }
+
+
+def wav_duration(path, default=0.0):
+    """Duration in seconds from the WAV header, or ``default`` if unreadable."""
+    try:
+        return read_wav_info(path)['duration']
+    except (OSError, ValueError, struct.error):
+        return default
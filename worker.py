@@ -0,0 +1,119 @@
+"""Background services for the scanner app.
+
+These run in their own process (``python worker.py``) so that request
+workers can be scaled across cores by the WSGI server without each one
+starting its own copy of the push consumer. The dev server in ``app.py``
+starts them in-process for convenience.
+"""
+import json
+import os
+import signal
+import threading
+import time
+
+import redis
+
+import config
+import ingest
+import peaks
+import push_db
+import push_rules
+import push_utils
+
+
+def push_worker(stop_event):
+    """Consume jobs from the Redis ``push_queue`` list and fan them out."""
+    r = redis.from_url(config.REDIS_URL)
+    vapid_pub, vapid_priv = push_utils.load_vapid_keys()
+    vapid_claims = {'sub': config.VAPID_CLAIM_SUB}
+    while not stop_event.is_set():
+        try:
+            item = r.brpop('push_queue', timeout=5)
+        except redis.RedisError as e:
+            print('push_worker redis error', e)
+            stop_event.wait(5)
+            continue
+        if not item:
+            continue
+        _, payload = item
+        try:
+            job = json.loads(payload)
+            # New-call jobs carry a full payload; plain jobs just a message.
+            body = job.get('payload') or {'message': job.get('message')}
+            if job.get('feed'):
+                # A call: only subscribers whose keyword rules match it.
+                subs = push_rules.matcher.recipients(job['feed'], job.get('texts') or [])
+            else:
+                subs = push_db.list_subscriptions()
+            for s in subs:
+                push_utils.send_push(s, body, vapid_priv, vapid_claims)
+        except Exception as e:
+            print('push_worker error', e)
+
+
+def ingest_worker(stop_event):
+    """Index and announce calls as the recorder finishes writing them (see ingest.py)."""
+    ingest.Ingester(redis.from_url(config.REDIS_URL)).run(stop_event)
+
+
+def peaks_worker(stop_event):
+    """Precompute waveform peaks for new WAVs in every feed directory."""
+    dirs = [(feed, os.path.join(config.ARCHIVE_DIR, feed)) for feed in config.FEEDS] + [(None, config.SEGMENT_DIR)]
+    failed = set()  # unreadable files are not retried every pass
+    while not stop_event.is_set():
+        for feed, directory in dirs:
+            try:
+                pending = peaks.missing_peaks(directory, feed)
+            except FileNotFoundError:
+                continue
+            for wav in pending:
+                if stop_event.is_set():
+                    return
+                if wav in failed:
+                    continue
+                try:
+                    peaks.write_peaks(wav, peaks.peaks_path(wav, feed))
+                except Exception as e:
+                    failed.add(wav)
+                    print(f'peaks_worker: {wav}: {e}')
+        stop_event.wait(config.PEAKS_SCAN_INTERVAL)
+
+
+# name -> callable(stop_event). Each service runs in its own daemon thread.
+SERVICES = {
+    'push': push_worker,
+    'ingest': ingest_worker,
+    'peaks': peaks_worker,
+}
+
+
+def start_background(stop_event=None, services=None):
+    """Start background services in daemon threads and return them."""
+    stop_event = stop_event or threading.Event()
+    push_db.ensure_db()
+    threads = []
+    for name in (services or SERVICES):
+        t = threading.Thread(target=SERVICES[name], args=(stop_event,), name=f'svc-{name}', daemon=True)
+        t.start()
+        threads.append(t)
+    return stop_event, threads
+
+
+def main():
+    stop_event, threads = start_background()
+
+    def _stop(signum, frame):
+        print('worker: stopping on signal', signum)
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    print('worker: started', ', '.join(t.name for t in threads))
+    while not stop_event.is_set():
+        time.sleep(1)
+    for t in threads:
+        t.join(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""WSGI entry point for production serving.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Background services (push queue consumer, ...) are not started by request
+workers; run ``python worker.py`` alongside as its own process/unit.
+"""
+from app import create_app
+
+app = create_app()
@@ -0,0 +1,193 @@
+"""ZIP archives streamed straight from the call store.
+
+Every member is *stored* (WAV does not compress), so the archive's exact
+size and the offset of every byte are known from the member sizes alone,
+before anything is read. That gives:
+
+* constant memory and no temp files: members are read in CHUNK-sized
+  pieces as the response is written, from loose files or from day packs;
+* Range support: a resumed download skips straight to the member holding
+  its first byte.
+
+The CRC-32 of each member goes in its local header (no data descriptors,
+for the widest reader support). Pack members carry their CRC in the pack
+index; loose files are checksummed just before they are sent, which
+reads them twice but the second read comes from the page cache. Offsets
+past 4 GiB switch the central directory to ZIP64.
+"""
+import datetime
+import hashlib
+import os
+import struct
+import zlib
+
+from archive_pack import CHUNK
+
+LOCAL = struct.Struct('<IHHHHHIIIHH')
+CENTRAL = struct.Struct('<IHHHHHHIIIHHHHHII')
+END = struct.Struct('<IHHHHIIH')
+END64 = struct.Struct('<IQHHIIQQQQ')
+LOCATOR64 = struct.Struct('<IIQI')
+EXTRA64 = struct.Struct('<HHQ')
+LIMIT32 = 0xFFFFFFFF
+UTF8 = 1 << 11
+MIN_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+def dos_datetime(dt):
+    """``(date, time)`` in MS-DOS format for a ``(y, m, d, H, M, S)`` tuple."""
+    y, mo, d, h, mi, s = max(tuple(dt), MIN_DATE)
+    return (y - 1980) << 9 | mo << 5 | d, h << 11 | mi << 5 | s // 2
+
+
+class Member:
+    """One stored archive member. Subclasses provide ``_read(start, end)``."""
+
+    def __init__(self, name, size, date_time, crc=None):
+        self.name = name.encode('utf-8')
+        self.size = size
+        self.date_time = date_time
+        self._crc = crc
+        self.offset = None  # set by ZipStream
+
+    def crc(self):
+        if self._crc is None:
+            crc = 0
+            for data in self._read(0, self.size):
+                crc = zlib.crc32(data, crc)
+            self._crc = crc
+        return self._crc
+
+    def chunks(self, start, end):
+        return self._read(start, end)
+
+    def version_key(self):
+        """What identifies this member's content, for ETags."""
+        return (self.name, self.size)
+
+
+class BytesMember(Member):
+    def __init__(self, name, data, date_time):
+        super().__init__(name, len(data), date_time, zlib.crc32(data))
+        self.data = data
+
+    def _read(self, start, end):
+        yield self.data[start:end]
+
+    def version_key(self):
+        return (self.name, hashlib.sha1(self.data).hexdigest())
+
+
+class FileMember(Member):
+    """A loose file, or with ``base`` a byte range of a larger file (a pack member)."""
+
+    def __init__(self, name, path, date_time, size=None, base=0, crc=None, mtime_ns=None):
+        if size is None or mtime_ns is None:
+            st = os.stat(path)
+            size = st.st_size if size is None else size
+            mtime_ns = st.st_mtime_ns if mtime_ns is None else mtime_ns
+        super().__init__(name, size, date_time, crc)
+        self.path = path
+        self.base = base
+        self.mtime_ns = mtime_ns
+
+    def _read(self, start, end):
+        with open(self.path, 'rb') as f:
+            f.seek(self.base + start)
+            remaining = end - start
+            while remaining > 0:
+                data = f.read(min(CHUNK, remaining))
+                if not data:
+                    raise IOError(f'{self.path}: shorter than when the archive was laid out')
+                remaining -= len(data)
+                yield data
+
+    def version_key(self):
+        return (self.name, self.size, self.path, self.base, self.mtime_ns)
+
+
+class ZipStream:
+    def __init__(self, members):
+        self.members = members
+        pos = 0
+        for m in members:
+            m.offset = pos
+            pos += LOCAL.size + len(m.name) + m.size
+        self.cd_offset = pos
+        self.cd_size = sum(CENTRAL.size + len(m.name) + (EXTRA64.size if m.offset >= LIMIT32 else 0)
+                           for m in members)
+        self.zip64 = (self.cd_offset >= LIMIT32 or self.cd_size >= LIMIT32 or len(members) >= 0xFFFF)
+        self.tail_size = END.size + (END64.size + LOCATOR64.size if self.zip64 else 0)
+        self.size = self.cd_offset + self.cd_size + self.tail_size
+
+    def etag(self):
+        h = hashlib.sha1()
+        for m in self.members:
+            h.update(repr(m.version_key()).encode('utf-8'))
+        return h.hexdigest()
+
+    # -- pieces --------------------------------------------------------------
+    # The archive is a sequence of (length, producer) pieces; producer(lo, hi)
+    # yields bytes lo..hi of the piece. Lengths never need a CRC, so pieces
+    # before a Range start are skipped without reading anything.
+
+    def _local_header(self, m):
+        date, time = dos_datetime(m.date_time)
+        return LOCAL.pack(0x04034b50, 20, UTF8, 0, time, date, m.crc(), m.size, m.size,
+                          len(m.name), 0) + m.name
+
+    def _central_record(self, m):
+        date, time = dos_datetime(m.date_time)
+        extra = EXTRA64.pack(1, 8, m.offset) if m.offset >= LIMIT32 else b''
+        return CENTRAL.pack(0x02014b50, 45 if extra else 20, 45 if extra else 20, UTF8, 0, time, date,
+                            m.crc(), m.size, m.size, len(m.name), len(extra), 0, 0, 0,
+                            0o100644 << 16, min(m.offset, LIMIT32)) + m.name + extra
+
+    def _tail(self):
+        count = len(self.members)
+        tail = b''
+        if self.zip64:
+            end64_offset = self.cd_offset + self.cd_size
+            tail += END64.pack(0x06064b50, END64.size - 12, 45, 45, 0, 0, count, count,
+                               self.cd_size, self.cd_offset)
+            tail += LOCATOR64.pack(0x07064b50, 0, end64_offset, 1)
+        return tail + END.pack(0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                               min(self.cd_size, LIMIT32), min(self.cd_offset, LIMIT32), 0)
+
+    def _pieces(self):
+        def literal(make):
+            def produce(lo, hi):
+                yield make()[lo:hi]
+            return produce
+
+        for m in self.members:
+            yield LOCAL.size + len(m.name), literal(lambda m=m: self._local_header(m))
+            yield m.size, m.chunks
+        for m in self.members:
+            yield (CENTRAL.size + len(m.name) + (EXTRA64.size if m.offset >= LIMIT32 else 0),
+                   literal(lambda m=m: self._central_record(m)))
+        yield self.tail_size, literal(self._tail)
+
+    def iter_bytes(self, start=0, end=None):
+        """Yield bytes ``start`` up to ``end`` (exclusive) of the archive."""
+        end = self.size if end is None else end
+        pos = 0
+        for length, produce in self._pieces():
+            if pos >= end:
+                break
+            if pos + length > start and length:
+                lo = max(start - pos, 0)
+                hi = min(end - pos, length)
+                for data in produce(lo, hi):
+                    if data:
+                        yield data
+            pos += length
+
+
+def filename_datetime(name, fallback_ns):
+    """Timestamp of a ``rec_YYYY-MM-DD_HH-MM-SS`` name, else of ``fallback_ns``."""
+    try:
+        _, date, time = os.path.splitext(name)[0].split('_')[:3]
+        return datetime.datetime.strptime(f'{date}_{time}', '%Y-%m-%d_%H-%M-%S').timetuple()[:6]
+    except ValueError:
+        return datetime.datetime.fromtimestamp(fallback_ns / 1e9).timetuple()[:6]